@@ -0,0 +1,279 @@
+import builtins
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from .file_operations import get_media_files, get_organised_files, organise_media, safe_move
+from .name_index import NameIndex
+
+# The peak memory use is only reported on platforms with the resource module, i.e. not on Windows
+try:
+  import resource
+except ImportError:
+  resource = None
+
+# Shape of the synthetic media trees built for the benchmarks
+#  - file_count: number of files to organise, spread over sub_dir_count nested sub-directories (scanned when options.recursive is true)
+#  - min_size, max_size: range of the file sizes, in bytes
+#  - extensions: relative weights of the file extensions, where extensions missing from media_extensions are not organised
+#  - mtime_spread_days: the files' modification dates are spread over this many days before mtime_end
+#  - organised_ratio: number of files already organised in year/month sub-directories, relative to file_count
+#  - collision_ratio: share of the files to organise whose name clashes with an organised file of the same month
+#  - options: the optional configuration variables passed to organise_media
+TREE_DEFAULTS = {
+  'file_count': 1000,
+  'sub_dir_count': 0,
+  'min_size': 1024,
+  'max_size': 16 * 1024,
+  'extensions': { '.jpg': 70, '.png': 15, '.mp4': 10, '.txt': 5 },
+  'media_extensions': ['.jpg', '.png', '.mp4'],
+  'mtime_spread_days': 3650,
+  'mtime_end': 1672531200,
+  'organised_ratio': 0.2,
+  'collision_ratio': 0.1,
+  'seed': 0,
+  'options': {}
+}
+
+# Functions of the os module whose calls are counted while a benchmark runs
+COUNTED_OS_FUNCTIONS = ['stat', 'lstat', 'scandir', 'mkdir', 'rename', 'link', 'unlink', 'open', 'copy_file_range', 'sendfile', 'utime']
+
+BENCHMARKS = ['get_media_files', 'organise_media', 'safe_move']
+
+# Counts the filesystem calls made through the os module and the open builtin while it is active
+# The entries listed by os.scandir are wrapped so their first stat, the only one making a system call, is counted too (see CountedDirEntry),
+# but other calls made inside C code are not counted
+class FsCallCounter:
+  def __init__(self):
+    self.count = 0
+    self.originals = dict()
+
+  def __enter__(self):
+    for name in COUNTED_OS_FUNCTIONS:
+      if hasattr(os, name):
+        self.originals[(os, name)] = getattr(os, name)
+        setattr(os, name, self.counted(getattr(os, name)))
+
+    os.scandir = self.counted_scandir(os.scandir)
+
+    self.originals[(builtins, 'open')] = builtins.open
+    builtins.open = self.counted(builtins.open)
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    for (module, name), function in self.originals.items():
+      setattr(module, name, function)
+
+  def counted(self, function):
+    def counted_function(*args, **kwargs):
+      self.count += 1
+      return function(*args, **kwargs)
+
+    return counted_function
+
+  # Wrap the entries listed by a counted os.scandir, see CountedDirEntry
+  def counted_scandir(self, scandir):
+    def counted_scandir_function(*args, **kwargs):
+      return CountedScandirIterator(scandir(*args, **kwargs), self)
+
+    return counted_scandir_function
+
+# Iterator of os.scandir while the filesystem calls are counted, yielding counted entries
+class CountedScandirIterator:
+  def __init__(self, iterator, counter):
+    self.iterator = iterator
+    self.counter = counter
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def __iter__(self):
+    for entry in self.iterator:
+      yield CountedDirEntry(entry, self.counter)
+
+  def close(self):
+    self.iterator.close()
+
+# os.DirEntry listed while the filesystem calls are counted, counting the first stat of each entry (with and without following symlinks),
+# since os.DirEntry caches it, and its type is read from the directory listing on most platforms
+class CountedDirEntry:
+  def __init__(self, entry, counter):
+    self.entry = entry
+    self.counter = counter
+    self.counted_stats = set()
+
+  def __getattr__(self, name):
+    return getattr(self.entry, name)
+
+  def __fspath__(self):
+    return os.fspath(self.entry)
+
+  def stat(self, follow_symlinks = True):
+    if follow_symlinks not in self.counted_stats:
+      self.counted_stats.add(follow_symlinks)
+      self.counter.count += 1
+
+    return self.entry.stat(follow_symlinks = follow_symlinks)
+
+# Read the number of read and write system calls made by the process so far, on systems with a /proc filesystem
+def read_io_syscalls():
+  try:
+    with open('/proc/self/io') as io_file:
+      counters = dict(line.split(': ') for line in io_file.read().splitlines())
+  except OSError:
+    return None
+
+  return int(counters['syscr']) + int(counters['syscw'])
+
+# Get the name of the month directory of a modification date, as created by organise_media, e.g. '2019/11_November'
+def month_dir_name(mtime):
+  return time.strftime('%Y/%m_%B', time.localtime(mtime))
+
+# Build a synthetic media tree in a directory, according to a tree spec (see TREE_DEFAULTS)
+# Returns a dict with the number of files and bytes written
+def generate_media_tree(root, spec = None):
+  spec = { **TREE_DEFAULTS, **(spec or {}) }
+  rng = random.Random(spec['seed'])
+  extensions, weights = zip(*spec['extensions'].items())
+  sub_dirs = [root] + [os.path.join(root, *[f'sub_{str(level)}' for level in range(1, depth + 1)]) for depth in range(1, spec['sub_dir_count'] + 1)]
+
+  def random_mtime():
+    return spec['mtime_end'] - rng.uniform(0, spec['mtime_spread_days'] * 86400)
+
+  def write_file(path, mtime):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    size = rng.randint(spec['min_size'], spec['max_size'])
+
+    with open(path, 'wb') as file:
+      file.write(rng.randbytes(size))
+
+    os.utime(path, (mtime, mtime))
+    return size
+
+  organised_files = list()
+  stats = { 'files': 0, 'organised_files': 0, 'collisions': 0, 'bytes': 0 }
+
+  for index in range(int(spec['file_count'] * spec['organised_ratio'])):
+    file_name = f'IMG_{str(index).zfill(6)}{rng.choices(extensions, weights)[0]}'
+    mtime = random_mtime()
+
+    stats['bytes'] += write_file(os.path.join(root, month_dir_name(mtime), file_name), mtime)
+    stats['organised_files'] += 1
+    organised_files.append((file_name, mtime))
+
+  for index in range(spec['file_count']):
+    if organised_files and rng.random() < spec['collision_ratio']:
+      file_name, mtime = rng.choice(organised_files)
+      stats['collisions'] += 1
+    else:
+      file_name = f'DSC_{str(index).zfill(6)}{rng.choices(extensions, weights)[0]}'
+      mtime = random_mtime()
+
+    file_dir = rng.choice(sub_dirs)
+    file_path = os.path.join(file_dir, file_name)
+    if os.path.exists(file_path):
+      file_path = os.path.join(file_dir, f'{str(index)}_{file_name}')
+
+    stats['bytes'] += write_file(file_path, mtime)
+    stats['files'] += 1
+
+  return stats
+
+# Time a benchmark on a freshly generated tree, counting the filesystem calls made
+# Benchmarks with a prepare_<name> function have it run on the tree before the timer starts
+# Returns the benchmark's result, with the number of files per second and of calls per file
+def run_benchmark(benchmark, base_dir, spec = None):
+  spec = { **TREE_DEFAULTS, **(spec or {}) }
+  root = tempfile.mkdtemp(prefix = f'bench_{benchmark}_', dir = base_dir)
+
+  try:
+    dir = os.path.join(root, 'media')
+    tree_stats = generate_media_tree(dir, spec)
+    prepare = globals().get(f'prepare_{benchmark}')
+    prepared = prepare(dir, spec) if prepare is not None else None
+
+    io_syscalls = read_io_syscalls()
+    with FsCallCounter() as counter:
+      start = time.perf_counter()
+      file_count = globals()[f'bench_{benchmark}'](dir, spec, prepared)
+      seconds = time.perf_counter() - start
+    io_syscalls = None if io_syscalls is None else read_io_syscalls() - io_syscalls
+  finally:
+    shutil.rmtree(root, ignore_errors = True)
+
+  return {
+    'benchmark': benchmark,
+    'tree': tree_stats,
+    'files': file_count,
+    'seconds': seconds,
+    'files_per_sec': file_count / seconds if seconds else None,
+    'fs_calls': counter.count,
+    'fs_calls_per_file': counter.count / file_count if file_count else None,
+    'io_syscalls_per_file': io_syscalls / file_count if file_count and io_syscalls is not None else None,
+    'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else None
+  }
+
+def bench_get_media_files(dir, spec, prepared):
+  return len(list(get_media_files(dir, spec['media_extensions'], spec['options'].get('recursive', False))))
+
+def bench_organise_media(dir, spec, prepared):
+  return organise_media(dir, spec['media_extensions'], spec['options'])
+
+# Fill a destination directory with the names of the organised files, so moving the files to organise into it hits the tree's name clashes
+# Returns the destination directory and the files to move into it
+def prepare_safe_move(dir, spec):
+  dest_path = os.path.join(os.path.dirname(dir), 'destination')
+  os.makedirs(dest_path)
+
+  for organised_file in get_organised_files(dir, spec['media_extensions']):
+    if not os.path.exists(os.path.join(dest_path, organised_file.name)):
+      os.link(organised_file.path, os.path.join(dest_path, organised_file.name))
+
+  return dest_path, [entry.path for entry in get_media_files(dir, spec['media_extensions'])]
+
+def bench_safe_move(dir, spec, prepared):
+  dest_path, file_paths = prepared
+  name_index = NameIndex(dest_path)
+
+  for file_path in file_paths:
+    safe_move(file_path, dest_path, name_index = name_index)
+
+  return len(file_paths)
+
+# Run each benchmark in a separate process, so its peak memory usage is not mixed up with the other benchmarks'
+# Only errors are logged, so the per-file log entries do not slow down the benchmarks
+# Returns the list of results, which is also written as JSON to the output path when one is given
+def run_benchmarks(benchmarks = None, base_dir = None, spec = None, output_path = None):
+  results = list()
+  context = multiprocessing.get_context('spawn')
+
+  for benchmark in benchmarks or BENCHMARKS:
+    with context.Pool(1, initializer = logging.disable, initargs = (logging.WARNING,)) as pool:
+      results.append(pool.apply(run_benchmark, (benchmark, base_dir, spec)))
+
+  if output_path is not None:
+    write_benchmark_results(results, output_path, spec)
+
+  return results
+
+# Write benchmark results as JSON, along with the tree spec and the environment they were measured in
+def write_benchmark_results(results, output_path, spec = None):
+  os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok = True)
+
+  with open(output_path, 'w') as output_file:
+    json.dump({
+      'created_at': time.time(),
+      'python': sys.version,
+      'platform': platform.platform(),
+      'spec': { **TREE_DEFAULTS, **(spec or {}) },
+      'results': results
+    }, output_file, indent = 1)
@@ -0,0 +1,394 @@
+import collections
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of bytes read from the start of a file (or of its metadata box) to look for a capture date
+HEADER_SIZE = 64 * 1024
+
+# Number of files whose dates are resolved together by the worker pool
+DATE_BATCH_SIZE = 256
+
+# Seconds between the QuickTime epoch (1904-01-01) and the Unix epoch (1970-01-01)
+QUICKTIME_EPOCH_OFFSET = 2082844800
+
+EXIF_IFD_POINTER_TAG = 0x8769
+EXIF_DATE_TAGS = [0x9003, 0x9004]
+IFD0_DATE_TAG = 0x0132
+IFD0_MODEL_TAG = 0x0110
+
+# Top level box types that mark a file as an ISO base media file (MP4, MOV, HEIC, ...)
+BMFF_BOX_TYPES = { b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip', b'meta' }
+
+# Parse an EXIF date string, e.g. '2019:11:01 10:20:30', as a local time
+# Returns the date as seconds since the epoch, or None if it is not a valid date
+def parse_exif_date(value):
+  try:
+    return time.mktime(time.strptime(value.split(b'\x00')[0].decode('ascii').strip(), '%Y:%m:%d %H:%M:%S'))
+  except (ValueError, OverflowError, UnicodeDecodeError):
+    return None
+
+# Read the entries of a TIFF image file directory, as a dict mapping each tag to its (type, count, value or offset bytes) tuple
+def read_tiff_ifd(data, offset, endian):
+  entry_count, = struct.unpack_from(endian + 'H', data, offset)
+  entries = dict()
+
+  for index in range(entry_count):
+    tag, value_type, count = struct.unpack_from(endian + 'HHI', data, offset + 2 + index * 12)
+    entries[tag] = (value_type, count, data[offset + 10 + index * 12:offset + 14 + index * 12])
+
+  return entries
+
+# Read the ASCII value of a TIFF entry, which is stored inline when it fits in 4 bytes
+def read_tiff_ascii(data, entry, endian):
+  value_type, count, value = entry
+
+  if count <= 4:
+    return value[:count]
+
+  offset, = struct.unpack(endian + 'I', value)
+  return data[offset:offset + count]
+
+# Find the capture date in TIFF formatted EXIF data, preferring the original date over the digitized and modified dates
+def parse_tiff_date(data):
+  try:
+    endian = { b'II': '<', b'MM': '>' }.get(data[:2])
+    if endian is None:
+      return None
+
+    ifd0_offset, = struct.unpack_from(endian + 'I', data, 4)
+    ifd0 = read_tiff_ifd(data, ifd0_offset, endian)
+
+    if EXIF_IFD_POINTER_TAG in ifd0:
+      exif_ifd_offset, = struct.unpack(endian + 'I', ifd0[EXIF_IFD_POINTER_TAG][2])
+      exif_ifd = read_tiff_ifd(data, exif_ifd_offset, endian)
+
+      for tag in EXIF_DATE_TAGS:
+        if tag in exif_ifd:
+          date = parse_exif_date(read_tiff_ascii(data, exif_ifd[tag], endian))
+          if date is not None:
+            return date
+
+    if IFD0_DATE_TAG in ifd0:
+      return parse_exif_date(read_tiff_ascii(data, ifd0[IFD0_DATE_TAG], endian))
+  except (struct.error, IndexError):
+    pass
+
+  return None
+
+# Find the camera model in TIFF formatted EXIF data
+def parse_tiff_model(data):
+  try:
+    endian = { b'II': '<', b'MM': '>' }.get(data[:2])
+    if endian is None:
+      return None
+
+    ifd0_offset, = struct.unpack_from(endian + 'I', data, 4)
+    ifd0 = read_tiff_ifd(data, ifd0_offset, endian)
+
+    if IFD0_MODEL_TAG in ifd0:
+      model = read_tiff_ascii(data, ifd0[IFD0_MODEL_TAG], endian).split(b'\x00')[0].decode('ascii', 'replace').strip()
+      return model.replace('/', '_').replace('\\', '_') or None
+  except (struct.error, IndexError):
+    pass
+
+  return None
+
+# Find the capture date in the EXIF APP1 segment of a JPEG file
+def parse_jpeg_date(header):
+  exif = find_jpeg_exif(header)
+  return parse_tiff_date(exif) if exif is not None else None
+
+# Find the TIFF formatted EXIF data in the APP1 segment of a JPEG file, stopping at the start of the image data
+def find_jpeg_exif(header):
+  offset = 2
+
+  while offset + 4 <= len(header):
+    if header[offset] != 0xFF:
+      return None
+
+    marker = header[offset + 1]
+    if marker == 0xFF:
+      offset += 1
+      continue
+    if marker in (0xD9, 0xDA):
+      return None
+
+    length, = struct.unpack_from('>H', header, offset + 2)
+    segment = header[offset + 4:offset + 2 + length]
+
+    if marker == 0xE1 and segment.startswith(b'Exif\x00\x00'):
+      return segment[6:]
+
+    offset += 2 + length
+
+  return None
+
+# Find the capture date in the eXIf chunk of a PNG file
+def parse_png_date(header):
+  exif = find_png_exif(header)
+  return parse_tiff_date(exif) if exif is not None else None
+
+# Find the TIFF formatted EXIF data in the eXIf chunk of a PNG file, stopping at the start of the image data
+def find_png_exif(header):
+  offset = 8
+
+  while offset + 8 <= len(header):
+    length, chunk_type = struct.unpack_from('>I4s', header, offset)
+
+    if chunk_type == b'eXIf':
+      return header[offset + 8:offset + 8 + length]
+    if chunk_type == b'IDAT':
+      return None
+
+    offset += 12 + length
+
+  return None
+
+# Iterate over the boxes of an ISO base media file between two offsets, reading only their headers
+# Yields the (type, content start offset, end offset) tuple of each box
+def iter_bmff_boxes(file, start, end):
+  offset = start
+
+  while offset + 8 <= end:
+    file.seek(offset)
+    header = file.read(16)
+    if len(header) < 8:
+      return
+
+    size, box_type = struct.unpack_from('>I4s', header)
+    header_size = 8
+
+    if size == 1 and len(header) == 16:
+      size, = struct.unpack_from('>Q', header, 8)
+      header_size = 16
+    elif size == 0:
+      size = end - offset
+
+    if size < header_size:
+      return
+
+    yield box_type, offset + header_size, min(offset + size, end)
+    offset += size
+
+# Iterate over the child boxes of a box already read into memory
+def iter_bmff_child_boxes(data, start):
+  offset = start
+
+  while offset + 8 <= len(data):
+    size, box_type = struct.unpack_from('>I4s', data, offset)
+    if size < 8:
+      return
+
+    yield box_type, offset + 8, min(offset + size, len(data))
+    offset += size
+
+# Read an unsigned big-endian integer of 0, 2, 4 or 8 bytes
+def read_uint(data, offset, size):
+  if size == 0:
+    return 0, offset
+
+  return int.from_bytes(data[offset:offset + size], 'big'), offset + size
+
+# Find the file offset and length of the Exif item of a HEIF meta box, using its item information and item location boxes
+def find_heif_exif_location(meta):
+  exif_item_id = None
+  locations = dict()
+
+  for box_type, start, end in iter_bmff_child_boxes(meta, 4):
+    if box_type == b'iinf':
+      version = meta[start]
+      offset = start + 4 + (2 if version == 0 else 4)
+
+      for info_type, info_start, info_end in iter_bmff_child_boxes(meta[:end], offset):
+        info_version = meta[info_start]
+        if info_type != b'infe' or info_version < 2:
+          continue
+
+        id_size = 2 if info_version == 2 else 4
+        item_id, offset = read_uint(meta, info_start + 4, id_size)
+        if meta[offset + 2:offset + 6] == b'Exif':
+          exif_item_id = item_id
+
+    elif box_type == b'iloc':
+      version = meta[start]
+      offset_size, length_size = meta[start + 4] >> 4, meta[start + 4] & 0x0F
+      base_offset_size, index_size = meta[start + 5] >> 4, (meta[start + 5] & 0x0F if version in (1, 2) else 0)
+      item_count, offset = read_uint(meta, start + 6, 2 if version < 2 else 4)
+
+      for index in range(item_count):
+        if offset >= end:
+          break
+
+        item_id, offset = read_uint(meta, offset, 2 if version < 2 else 4)
+        if version in (1, 2):
+          offset += 2
+        offset += 2
+        base_offset, offset = read_uint(meta, offset, base_offset_size)
+        extent_count, offset = read_uint(meta, offset, 2)
+
+        for extent in range(extent_count):
+          extent_index, offset = read_uint(meta, offset, index_size)
+          extent_offset, offset = read_uint(meta, offset, offset_size)
+          extent_length, offset = read_uint(meta, offset, length_size)
+
+          if extent == 0:
+            locations[item_id] = (base_offset + extent_offset, extent_length)
+
+  return locations.get(exif_item_id)
+
+# Find the capture date of an ISO base media file, reading only box headers, the moov/mvhd box of videos and the Exif item of HEIF images
+def parse_bmff_date(file, file_size):
+  for box_type, start, end in iter_bmff_boxes(file, 0, file_size):
+    if box_type == b'moov':
+      for child_type, child_start, child_end in iter_bmff_boxes(file, start, end):
+        if child_type == b'mvhd':
+          file.seek(child_start)
+          content = file.read(12)
+          creation_time, = struct.unpack_from('>Q', content, 4) if content[0] == 1 else struct.unpack_from('>I', content, 4)
+          return creation_time - QUICKTIME_EPOCH_OFFSET if creation_time > QUICKTIME_EPOCH_OFFSET else None
+
+    elif box_type == b'meta':
+      file.seek(start)
+      location = find_heif_exif_location(file.read(min(end - start, HEADER_SIZE)))
+
+      if location is not None:
+        file.seek(location[0])
+        exif = file.read(min(location[1], HEADER_SIZE))
+        tiff_header_offset, = struct.unpack_from('>I', exif)
+        tiff = exif[4 + tiff_header_offset:]
+        return parse_tiff_date(tiff[6:] if tiff.startswith(b'Exif\x00\x00') else tiff)
+
+  return None
+
+# Read the capture date from the metadata at the start of a JPEG, PNG, HEIC, MP4 or MOV file
+# Only the first bytes of the file (and the headers of its boxes, for ISO base media files) are read
+# Returns the capture date as seconds since the epoch, or None if the file has no capture date
+def read_capture_date(path):
+  try:
+    with open(path, 'rb') as file:
+      header = file.read(HEADER_SIZE)
+
+      if header.startswith(b'\xFF\xD8'):
+        return parse_jpeg_date(header)
+      if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return parse_png_date(header)
+      if header[4:8] in BMFF_BOX_TYPES:
+        return parse_bmff_date(file, os.fstat(file.fileno()).st_size)
+  # Malformed offsets, e.g. past the range of a file offset, raise ValueError or OverflowError when the file is seeked to them
+  except (OSError, struct.error, IndexError, ValueError, OverflowError):
+    pass
+
+  return None
+
+# Read the camera model in the EXIF metadata of a JPEG or PNG file, with '/' and '\\' replaced so it can be used as a directory name
+# Returns None if the file has no camera model
+def read_camera_model(path):
+  try:
+    with open(path, 'rb') as file:
+      header = file.read(HEADER_SIZE)
+
+    if header.startswith(b'\xFF\xD8'):
+      exif = find_jpeg_exif(header)
+    elif header.startswith(b'\x89PNG\r\n\x1a\n'):
+      exif = find_png_exif(header)
+    else:
+      return None
+
+    return parse_tiff_model(exif) if exif is not None else None
+  except (OSError, struct.error, IndexError, ValueError, OverflowError):
+    return None
+
+# Cache of the capture dates of files, keyed by their (inode, size, mtime), so unchanged files are only parsed once
+# When a scan index is given, the dates are also looked up in it and recorded in it, to be reused by later runs
+# When a maximum size is given, only the dates of the most recently used max_size files are kept, so the memory used does not grow with the number of files
+class CaptureDateCache:
+  def __init__(self, scan_index = None, max_size = None):
+    self.scan_index = scan_index
+    self.max_size = max_size
+    self.dates = collections.OrderedDict()
+    self.new_dates = dict()
+    self.lock = threading.Lock()
+
+  # Get the cached capture dates of a batch of keys
+  # Returns a dict mapping the keys found to their capture dates, which are None for files without a capture date
+  def get_many(self, keys):
+    with self.lock:
+      found = { key: self.dates[key] for key in keys if key in self.dates }
+      for key in found:
+        self.dates.move_to_end(key)
+
+    missing = [key for key in keys if key not in found]
+    if self.scan_index is not None and missing:
+      recorded = self.scan_index.get_capture_dates(missing)
+      found.update(recorded)
+
+      with self.lock:
+        self.dates.update(recorded)
+        self.evict()
+
+    return found
+
+  def put(self, key, date):
+    with self.lock:
+      self.dates[key] = date
+      self.dates.move_to_end(key)
+      self.new_dates[key] = date
+      self.evict()
+
+  # Drop the least recently used dates past the maximum size
+  def evict(self):
+    while self.max_size is not None and len(self.dates) > self.max_size:
+      self.dates.popitem(last = False)
+
+  # Record the dates added since the last flush in the scan index
+  def flush(self):
+    with self.lock:
+      new_dates = self.new_dates
+      self.new_dates = dict()
+
+    if self.scan_index is not None and new_dates:
+      self.scan_index.record_capture_dates(new_dates)
+
+# Resolve the creation date of each directory entry, in batches parsed by a pool of threads
+# With the 'metadata' date source, the capture date is read from the file's metadata, falling back to its mtime when there is none
+# The dates parsed are recorded in the scan index of the cache after each batch, so they are not all held until the last file
+# Yields (entry, creation date) pairs, in the same order as the input entries
+def resolve_creation_dates(entries, date_source = 'metadata', date_workers = 4, cache = None):
+  if date_source != 'metadata':
+    for entry in entries:
+      yield entry, entry.stat().st_mtime
+    return
+
+  if cache is None:
+    cache = CaptureDateCache()
+
+  with ThreadPoolExecutor(max_workers = max(1, date_workers), thread_name_prefix = 'date') as executor:
+    batch = list()
+
+    for entry in entries:
+      batch.append(entry)
+
+      if len(batch) == DATE_BATCH_SIZE:
+        yield from resolve_batch_creation_dates(batch, executor, cache)
+        cache.flush()
+        batch = list()
+
+    yield from resolve_batch_creation_dates(batch, executor, cache)
+
+  cache.flush()
+
+def resolve_batch_creation_dates(batch, executor, cache):
+  keys = [(entry.stat().st_ino, entry.stat().st_size, entry.stat().st_mtime) for entry in batch]
+  cached_dates = cache.get_many(keys)
+
+  missing = [(entry, key) for entry, key in zip(batch, keys) if key not in cached_dates]
+  for (entry, key), date in zip(missing, executor.map(lambda missing_entry: read_capture_date(missing_entry[0].path), missing)):
+    cache.put(key, date)
+    cached_dates[key] = date
+
+  for entry, key in zip(batch, keys):
+    date = cached_dates[key]
+    yield entry, entry.stat().st_mtime if date is None else date
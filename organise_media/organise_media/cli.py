@@ -0,0 +1,171 @@
+import argparse
+import logging
+import os
+
+# Only the modules needed to parse the arguments are imported up front, and the rest once the arguments are known to be valid,
+# so scripts can launch many short runs, or just check the usage, without paying for imports they do not need
+
+DEFAULT_CONFIG_FILE_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', 'config.yaml'))
+
+# Exit codes of the command line interface
+#  - EXIT_SUCCESS: every file was organised, or planned on a dry run
+#  - EXIT_FAILURE: the run stopped on an unexpected error
+#  - EXIT_USAGE: the arguments are not valid (set by argparse)
+#  - EXIT_INVALID_CONFIG: the configuration file is missing or not valid
+#  - EXIT_NOT_CONFIRMED: files would have been moved without the --yes argument
+#  - EXIT_PARTIAL: the run finished, but some files or directories could not be organised, or some verified files are missing or changed
+#  - EXIT_INTERRUPTED: the run was interrupted, e.g. with Ctrl+C
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_INVALID_CONFIG = 3
+EXIT_NOT_CONFIRMED = 4
+EXIT_PARTIAL = 5
+EXIT_INTERRUPTED = 130
+
+def parse_args(argv = None):
+  parser = argparse.ArgumentParser(description = 'Organise media files into year/month directories, without any prompt.')
+  parser.add_argument('--config', default = DEFAULT_CONFIG_FILE_PATH, help = 'the configuration file (default: config.yaml in the root of the project)')
+  parser.add_argument('--folder', action = 'append', help = 'a directory to organise instead of folders_to_organise, can be repeated')
+  parser.add_argument('--extension', action = 'append', help = 'a file extension to organise instead of media_extensions, e.g. .jpg, can be repeated')
+  parser.add_argument('--dry-run', action = 'store_true', help = 'only write the planned moves to the plan file')
+  parser.add_argument('--plan-file', help = 'the file a dry run writes its plan to, instead of plan_file')
+  parser.add_argument('--workers', type = int, help = 'the number of directories organised concurrently, instead of max_workers')
+  parser.add_argument('-y', '--yes', action = 'store_true', help = 'move the files without asking for confirmation, required unless on a dry run')
+  return parser.parse_args(argv)
+
+# Get the configuration variables given as arguments, which replace those of the configuration file
+# Paths given as arguments are relative to the current directory, unlike the paths of the configuration file, e.g. plan_file,
+# which are relative to the root of the project, so they are made absolute first
+def get_config_overrides(args):
+  overrides = dict()
+
+  if args.folder:
+    overrides['folders_to_organise'] = [os.path.abspath(folder) for folder in args.folder]
+  if args.extension:
+    overrides['media_extensions'] = args.extension
+  if args.dry_run:
+    overrides['dry_run'] = True
+  if args.plan_file:
+    overrides['plan_file'] = os.path.abspath(args.plan_file)
+  if args.workers is not None:
+    overrides['max_workers'] = args.workers
+
+  return overrides
+
+# Run the command line interface, returning its exit code
+def main(argv = None):
+  args = parse_args(argv)
+
+  from .logger_config import config_logger
+  config_logger()
+
+  try:
+    return run_headless(args)
+  except KeyboardInterrupt:
+    logging.error('Interrupted. Script aborted.')
+    return EXIT_INTERRUPTED
+  except Exception:
+    logging.error('Unexpected error. Script aborted.', exc_info=True)
+    return EXIT_FAILURE
+
+# Organise the configured directories without any prompt
+# Interrupted runs are resumed when files can be moved, i.e. with --yes, and are otherwise only finished or rolled back on the next run that can
+# Returns the exit code of the run
+def run_headless(args):
+  from .configuration_reader import read_config_file
+  from .logger_config import apply_logging_options
+
+  config, valid, error_msg = read_config_file(args.config, get_config_overrides(args))
+  if not valid:
+    logging.error(error_msg)
+    return EXIT_INVALID_CONFIG
+
+  apply_logging_options(config)
+
+  if not (args.yes or config['dry_run']):
+    logging.error('Files are only moved with the --yes argument, or planned with --dry-run. Script aborted.')
+    return EXIT_NOT_CONFIRMED
+
+  from .metrics import RunMetrics
+  from .move_journal import find_unfinished_journals
+  from .scan_index import ScanIndex
+  from .user_prompt import get_journal_dir, handle_prompt_answer, resume_run
+
+  # The moves of the resumed runs that fail, and the directories that do not exist, are counted as errors of the run, see EXIT_PARTIAL
+  metrics = RunMetrics()
+  journal_dir = get_journal_dir(config)
+  if args.yes and journal_dir is not None:
+    for journal_path in find_unfinished_journals(journal_dir):
+      logging.info(f'Found an interrupted run, recorded in: {journal_path}')
+      resume_run('yes', journal_path, config, metrics = metrics)
+
+  scan_index = ScanIndex() if config['scan_index'] else None
+  try:
+    handle_prompt_answer('yes', config['folders_to_organise'], config['ruleset'], config, scan_index, metrics)
+  finally:
+    if scan_index is not None:
+      scan_index.close()
+
+  return EXIT_PARTIAL if metrics.totals()['counters']['errors'] else EXIT_SUCCESS
+
+# Number of verified files between two progress messages of the verify command
+VERIFY_PROGRESS_FILES = 10000
+
+def parse_verify_args(argv = None):
+  parser = argparse.ArgumentParser(description = 'Verify the files moved by a run against its manifest, without moving anything.')
+  parser.add_argument('manifest', nargs = '?', help = 'the manifest to verify (default: the most recent manifest in manifest_dir)')
+  parser.add_argument('--config', default = DEFAULT_CONFIG_FILE_PATH, help = 'the configuration file (default: config.yaml in the root of the project)')
+  parser.add_argument('--workers', type = int, help = 'the number of files verified concurrently, instead of verify_workers')
+  return parser.parse_args(argv)
+
+# Run the verify command, returning its exit code
+def verify_main(argv = None):
+  args = parse_verify_args(argv)
+
+  from .logger_config import config_logger
+  config_logger()
+
+  try:
+    return run_verify(args)
+  except KeyboardInterrupt:
+    logging.error('Interrupted. Script aborted.')
+    return EXIT_INTERRUPTED
+  except Exception:
+    logging.error('Unexpected error. Script aborted.', exc_info=True)
+    return EXIT_FAILURE
+
+# Verify the files of a manifest, logging the files that are missing or changed as they are found, and then the number of files of each status
+# Returns the exit code of the verification, which is EXIT_PARTIAL when any file is missing, changed or cannot be read
+def run_verify(args):
+  from collections import Counter
+  from .configuration_reader import read_config_file
+  from .logger_config import apply_logging_options
+  from .manifest import STATUS_MTIME_CHANGED, STATUS_OK, find_manifests, verify_manifest
+  from .user_prompt import get_manifest_dir
+
+  config, valid, error_msg = read_config_file(args.config)
+  if not valid:
+    logging.error(error_msg)
+    return EXIT_INVALID_CONFIG
+
+  apply_logging_options(config)
+
+  manifest_path = os.path.abspath(args.manifest) if args.manifest else next(reversed(find_manifests(get_manifest_dir(config))), None)
+  if manifest_path is None:
+    logging.error('No manifest was found to verify. Script aborted.')
+    return EXIT_FAILURE
+
+  logging.info(f'Verifying the files recorded in: {manifest_path}...')
+  statuses = Counter()
+
+  for record, status in verify_manifest(manifest_path, args.workers or config['verify_workers']):
+    statuses[status] += 1
+
+    if status != STATUS_OK:
+      logging.warning(f'{status}: {record["path"]}')
+    if sum(statuses.values()) % VERIFY_PROGRESS_FILES == 0:
+      logging.info(f'Verified {str(sum(statuses.values()))} files...')
+
+  logging.info(f'Summary: verified {str(sum(statuses.values()))} files: ' + ', '.join(f'{str(count)} {status}' for status, count in sorted(statuses.items())))
+  return EXIT_SUCCESS if set(statuses) <= { STATUS_OK, STATUS_MTIME_CHANGED } else EXIT_PARTIAL
@@ -1,20 +1,121 @@
 import os
+import re
 import yaml
+from .destinations import DestinationTemplate
+from .rules import DEFAULT_DESTINATION, compile_rule, compile_ruleset
+from .packing import PACK_FORMATS
+from .scheduler import MOVE_ORDERS
+from .storage import STORAGE_BACKENDS
 
-# Read the configuration file
-def read_config_file(path):
+# Optional configuration variables, and the default values used when they are not declared
+OPTIONAL_CONFIG_TYPES = {
+  'recursive': bool,
+  'max_workers': int,
+  'transfer_workers': int,
+  'duplicates': str,
+  'hash_workers': int,
+  'scan_index': bool,
+  'dry_run': bool,
+  'plan_file': str,
+  'date_source': str,
+  'date_workers': int,
+  'file_log_level': str,
+  'console_rate_limit': int,
+  'metrics_dir': str,
+  'progress_interval': int,
+  'journal_dir': str,
+  'rules': list,
+  'destination': str,
+  'watch_quiet_period': int,
+  'watch_batch_size': int,
+  'streaming': bool,
+  'organise_mode': str,
+  'move_order': str,
+  'metadata_workers': int,
+  'mount_concurrency': dict,
+  'near_duplicate_distance': int,
+  'near_duplicate_workers': int,
+  'near_duplicates_file': str,
+  'storage': str,
+  'storage_latency_ms': int,
+  'pack_threshold': int,
+  'pack_format': str,
+  'manifest': bool,
+  'manifest_dir': str,
+  'verify_workers': int
+}
+OPTIONAL_CONFIG_DEFAULTS = {
+  'recursive': False,
+  'max_workers': 1,
+  'transfer_workers': 4,
+  'duplicates': 'keep',
+  'hash_workers': 4,
+  'scan_index': False,
+  'dry_run': False,
+  'plan_file': 'move_plan.json',
+  'date_source': 'metadata',
+  'date_workers': 4,
+  'file_log_level': 'WARNING',
+  'console_rate_limit': 50,
+  'metrics_dir': 'metrics',
+  'progress_interval': 0,
+  'journal_dir': 'journal',
+  'rules': [],
+  'destination': DEFAULT_DESTINATION,
+  'watch_quiet_period': 5,
+  'watch_batch_size': 100,
+  'streaming': False,
+  'organise_mode': 'move',
+  'move_order': 'destination',
+  'metadata_workers': 16,
+  'mount_concurrency': {},
+  'near_duplicate_distance': 6,
+  'near_duplicate_workers': 4,
+  'near_duplicates_file': 'near_duplicates.json',
+  'storage': 'local',
+  'storage_latency_ms': 20,
+  'pack_threshold': 0,
+  'pack_format': 'tar',
+  'manifest': False,
+  'manifest_dir': 'manifests',
+  'verify_workers': 8
+}
+
+# Allowed values of the optional configuration variables that only accept a fixed set of values
+OPTIONAL_CONFIG_CHOICES = {
+  'duplicates': ['keep', 'skip', 'hardlink', 'move'],
+  'date_source': ['metadata', 'mtime'],
+  'file_log_level': ['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+  'organise_mode': ['move', 'hardlink', 'reflink'],
+  'move_order': list(MOVE_ORDERS),
+  'storage': STORAGE_BACKENDS,
+  'pack_format': PACK_FORMATS
+}
+
+# Read the configuration file, with the configuration variables of the overrides (e.g. given as command line arguments) replacing those of the file
+# The file may be missing when the overrides declare both required configuration variables
+def read_config_file(path, overrides = None):
   config = { 'folders_to_organise': list(), 'media_extensions': list() }
+  overrides = overrides or dict()
 
-  if not os.path.exists(path):
+  if os.path.exists(path):
+    with open(path) as config_file:
+      try:
+        config = yaml.safe_load(config_file)
+      except yaml.YAMLError as exception:
+        return config, bool(False), exception
+  elif not ('folders_to_organise' in overrides and 'media_extensions' in overrides):
     return config, bool(False), str('Missing configuration file "config.yaml" in the root directory of the project. Script aborted.')
 
-  with open(path) as config_file:
-    try:
-      config = yaml.safe_load(config_file)
-    except yaml.YAMLError as exception:
-      return config, bool(False), exception
+  if overrides and isinstance(config, dict):
+    config = { **config, **overrides }
 
-  return config, *is_valid_config(config)
+  valid, error_msg = is_valid_config(config)
+  if valid:
+    config = apply_config_defaults(config)
+    config['ruleset'] = compile_ruleset(config['media_extensions'], config['rules'], config['destination'])
+
+  return config, valid, error_msg
 
 # Validate the configuration structure
 def is_valid_config(config):
@@ -26,5 +127,35 @@ def is_valid_config(config):
   for key in config_types:
     if not key in config or not isinstance(config[key], config_types[key]):
       return bool(False), str(f'The configuration file "config.yaml" must have a variable {key} of type {config_types[key].__name__}. Script aborted.')
+    if not all(isinstance(value, str) for value in config[key]):
+      return bool(False), str(f'The configuration variable {key} in "config.yaml" must be a list of str. Script aborted.')
+
+  # bool is a subclass of int in Python, so true and false are rejected explicitly for the int variables
+  for key in OPTIONAL_CONFIG_TYPES:
+    if key in config and (not isinstance(config[key], OPTIONAL_CONFIG_TYPES[key]) or (OPTIONAL_CONFIG_TYPES[key] is int and isinstance(config[key], bool))):
+      return bool(False), str(f'The configuration variable {key} in "config.yaml" must be of type {OPTIONAL_CONFIG_TYPES[key].__name__}. Script aborted.')
+
+  for key in OPTIONAL_CONFIG_CHOICES:
+    if key in config and config[key] not in OPTIONAL_CONFIG_CHOICES[key]:
+      return bool(False), str(f'The configuration variable {key} in "config.yaml" must be one of: {", ".join(OPTIONAL_CONFIG_CHOICES[key])}. Script aborted.')
+
+  try:
+    DestinationTemplate(config.get('destination', DEFAULT_DESTINATION))
+  except ValueError as e:
+    return bool(False), str(f'The configuration variable destination in "config.yaml" is not valid: {e}. Script aborted.')
+
+  for mount, limit in config.get('mount_concurrency', dict()).items():
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+      return bool(False), str(f'The concurrency limit of mount point {mount} in "config.yaml" must be a positive int. Script aborted.')
+
+  for index, rule in enumerate(config.get('rules', list())):
+    try:
+      compile_rule(rule, config.get('destination', DEFAULT_DESTINATION))
+    except (ValueError, re.error) as e:
+      return bool(False), str(f'The rule number {str(index + 1)} in "config.yaml" is not valid: {e}. Script aborted.')
+
+  return bool(True), str()
 
-  return bool(True), str()
\ No newline at end of file
+# Fill in the default values of the optional configuration variables that are not declared
+def apply_config_defaults(config):
+  return { **OPTIONAL_CONFIG_DEFAULTS, **(config or {}) }
\ No newline at end of file
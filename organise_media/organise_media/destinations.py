@@ -0,0 +1,158 @@
+import bisect
+import datetime
+import os
+import re
+import string
+import threading
+import time
+
+# Fields that can be used in a destination template, e.g. '{year}/{month:02}_{month_name}', '{iso_year}/{week}' or '{camera}/{year}'
+#  - year, month, day: the file's creation date
+#  - month_name: the full name of the creation month, in the current locale
+#  - week: the ISO week number of the creation date
+#  - iso_year: the ISO year of the creation date, which the week belongs to, e.g. 2020 for 2021-01-01, which is in the week 53 of 2020
+#  - camera: the camera model in the file's EXIF metadata, or UNKNOWN_CAMERA, made safe to use as a directory name, see sanitise_path_component
+DESTINATION_FIELDS = ['year', 'month', 'month_name', 'day', 'week', 'iso_year', 'camera']
+
+# Sample values of the destination fields, used to check the templates when they are compiled
+SAMPLE_DESTINATION_FIELDS = { 'year': 2000, 'month': 1, 'month_name': 'January', 'day': 1, 'week': 1, 'iso_year': 2000, 'camera': 'Camera' }
+
+UNKNOWN_CAMERA = 'Unknown camera'
+
+# Fields formatted as numbers, which the directories of a destination are matched against as digits, see compile_dir_pattern
+NUMERIC_DESTINATION_FIELDS = frozenset(['year', 'month', 'day', 'week', 'iso_year'])
+
+# Pattern of the directories formatted from any other field, e.g. the camera
+FREE_DIR_PATTERN = '.+'
+
+# Destination template compiled once per run
+# All files created within the same date bucket (e.g. the same month, for a template with a year and a month) share a destination,
+# so each bucket is formatted once and its epoch range cached, and the destination of any other file in the range is a single bisect away
+class DestinationTemplate:
+  def __init__(self, template):
+    fields = set()
+
+    for literal_text, field_name, format_spec, conversion in string.Formatter().parse(template):
+      if field_name is None:
+        continue
+
+      field = field_name.split('.')[0].split('[')[0]
+      if field not in DESTINATION_FIELDS:
+        raise ValueError(f"unknown field '{field}' in destination {template}")
+      fields.add(field)
+
+    try:
+      sample_destination = template.format(**SAMPLE_DESTINATION_FIELDS)
+    except (KeyError, IndexError, ValueError) as e:
+      raise ValueError(f'invalid destination {template}: {e}')
+
+    # The destinations must stay within the organised directory
+    if os.path.isabs(sample_destination) or os.path.splitdrive(sample_destination)[0]:
+      raise ValueError(f'destination {template} is an absolute path')
+    if any(component in ('', '.', '..') for component in sample_destination.replace('\\', '/').split('/')):
+      raise ValueError(f"destination {template} has an empty, '.' or '..' directory")
+
+    self.template = template
+    self.fields = frozenset(fields)
+    self.needs_camera = 'camera' in fields
+
+    # Patterns of the directories of the destinations, from the organised directory down, to find the files organised into them
+    self.dir_patterns = tuple(compile_dir_pattern(component) for component in template.replace('\\', '/').split('/'))
+
+    # Sorted (start, end) epoch ranges of the buckets formatted so far, and their destinations, for each camera
+    self.buckets = dict()
+    self.lock = threading.Lock()
+
+  # Get the destination of a file created at an epoch, relative to the organised directory and normalised for the current platform
+  def format(self, epoch, camera = None):
+    camera = sanitise_path_component(camera or UNKNOWN_CAMERA) if self.needs_camera else None
+
+    with self.lock:
+      starts, ends, destinations = self.buckets.setdefault(camera, (list(), list(), list()))
+
+      index = bisect.bisect_right(starts, epoch) - 1
+      if index >= 0 and epoch < ends[index]:
+        return destinations[index]
+
+      start, end, destination = self.format_bucket(epoch, camera)
+      starts.insert(index + 1, start)
+      ends.insert(index + 1, end)
+      destinations.insert(index + 1, destination)
+
+      return destination
+
+  # Check whether a directory, given by its path components relative to the organised directory, is a destination of the template,
+  # or, with prefix, whether it is one or one of their parent directories
+  def matches(self, components, prefix = False):
+    if len(components) > len(self.dir_patterns) or (not prefix and len(components) < len(self.dir_patterns)):
+      return False
+
+    return all(pattern.fullmatch(component) for pattern, component in zip(self.dir_patterns, components))
+
+  # Format the destination of the bucket holding an epoch
+  # Returns the epoch range of the bucket, i.e. the range over which none of the template's date fields change, and its destination
+  def format_bucket(self, epoch, camera):
+    creation_time = time.localtime(epoch)
+    creation_date = datetime.date(creation_time.tm_year, creation_time.tm_mon, creation_time.tm_mday)
+    start, end = float('-inf'), float('inf')
+
+    def narrow(first_day, next_first_day):
+      nonlocal start, end
+      start = max(start, local_midnight(first_day))
+      end = min(end, local_midnight(next_first_day))
+
+    if 'year' in self.fields:
+      narrow(creation_date.replace(month = 1, day = 1), creation_date.replace(year = creation_date.year + 1, month = 1, day = 1))
+    if 'month' in self.fields or 'month_name' in self.fields:
+      narrow(creation_date.replace(day = 1), (creation_date.replace(day = 28) + datetime.timedelta(days = 4)).replace(day = 1))
+    if 'iso_year' in self.fields:
+      iso_year = creation_date.isocalendar()[0]
+      narrow(datetime.date.fromisocalendar(iso_year, 1, 1), datetime.date.fromisocalendar(iso_year + 1, 1, 1))
+    if 'week' in self.fields:
+      monday = creation_date - datetime.timedelta(days = creation_date.weekday())
+      narrow(monday, monday + datetime.timedelta(days = 7))
+    if 'day' in self.fields:
+      narrow(creation_date, creation_date + datetime.timedelta(days = 1))
+
+    destination = self.template.format(
+      year = creation_time.tm_year,
+      month = creation_time.tm_mon,
+      month_name = time.strftime('%B', creation_time),
+      day = creation_time.tm_mday,
+      week = creation_date.isocalendar()[1],
+      iso_year = creation_date.isocalendar()[0],
+      camera = camera
+    )
+
+    return start, end, os.path.normpath(destination)
+
+# Make a value, e.g. a camera model read from a file, safe to use as a single directory name: path separators are replaced,
+# and a value made only of dots, e.g. '..', which would leave the organised directory, has its dots replaced
+def sanitise_path_component(value):
+  value = value.replace('/', '_').replace('\\', '_').replace(os.sep, '_')
+  return '_' * len(value) if value.strip('.') == '' else value
+
+# Compile the pattern of the directory names formatted from a component of a destination template, e.g. '\\d+_.+' for '{month:02}_{month_name}'
+def compile_dir_pattern(component):
+  pattern = ''
+
+  for literal_text, field_name, format_spec, conversion in string.Formatter().parse(component):
+    pattern += re.escape(literal_text)
+
+    if field_name is not None:
+      field = field_name.split('.')[0].split('[')[0]
+      is_number = field in NUMERIC_DESTINATION_FIELDS and conversion is None and re.fullmatch(r'0?\d*d?', format_spec or '')
+      pattern += r'\d+' if is_number else FREE_DIR_PATTERN
+
+  return re.compile(pattern)
+
+# Get the epoch of the local midnight starting a day
+def local_midnight(day):
+  return time.mktime((day.year, day.month, day.day, 0, 0, 0, 0, 0, -1))
+
+# Get the compiled template of a destination, reusing the templates already compiled in a dict, so rules with the same destination share their buckets
+def get_destination_template(destination, templates):
+  if destination not in templates:
+    templates[destination] = DestinationTemplate(destination)
+
+  return templates[destination]
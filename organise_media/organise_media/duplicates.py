@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .logger_config import FILE_EVENTS_LOGGER_NAME
+
+# Number of bytes hashed at the start and at the end of each file to narrow down the candidates for a full hash
+PARTIAL_HASH_SIZE = 8 * 1024
+FULL_HASH_CHUNK_SIZE = 1024 * 1024
+
+# Files at least this large are read through mmap, which avoids copying their contents into Python buffers
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+DUPLICATES_DIR_NAME = 'duplicates'
+
+file_events = logging.getLogger(FILE_EVENTS_LOGGER_NAME)
+
+# Hash the first and the last bytes of a file
+def partial_hash(path, size):
+  digest = hashlib.blake2b()
+
+  with open(path, 'rb') as file:
+    digest.update(file.read(PARTIAL_HASH_SIZE))
+
+    if size > PARTIAL_HASH_SIZE:
+      file.seek(max(PARTIAL_HASH_SIZE, size - PARTIAL_HASH_SIZE))
+      digest.update(file.read(PARTIAL_HASH_SIZE))
+
+  return digest.hexdigest()
+
+# Hash the whole contents of a file, in chunks
+# Only files that are still large enough when they are opened are read through mmap, since a file that shrank since it was stat-ed,
+# e.g. to zero bytes, cannot be mapped
+def full_hash(path, size):
+  digest = hashlib.blake2b()
+
+  with open(path, 'rb') as file:
+    if size >= MMAP_THRESHOLD and os.fstat(file.fileno()).st_size >= MMAP_THRESHOLD:
+      with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as mapped_file:
+        view = memoryview(mapped_file)
+        try:
+          for offset in range(0, len(view), FULL_HASH_CHUNK_SIZE):
+            digest.update(view[offset:offset + FULL_HASH_CHUNK_SIZE])
+        finally:
+          view.release()
+    else:
+      for chunk in iter(lambda: file.read(FULL_HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+
+  return digest.hexdigest()
+
+# Build a full hash function that reuses the known hashes of files whose size and mtime did not change
+# Newly computed hashes are added to the known hashes, which map each path to a (size, mtime, hash) tuple
+def cached_full_hash(known_hashes):
+  def hash_function(path, size):
+    stat = os.stat(path)
+    known_size, known_mtime, known_hash = known_hashes.get(path, (None, None, None))
+
+    if (known_size, known_mtime) == (stat.st_size, stat.st_mtime) and known_hash is not None:
+      return known_hash
+
+    file_hash = full_hash(path, size)
+    known_hashes[path] = (stat.st_size, stat.st_mtime, file_hash)
+    return file_hash
+
+  return hash_function
+
+# Split groups of (path, size) pairs by the result of a hash function computed on a thread pool
+# Files whose hash is unique, or that could not be read, are dropped since they cannot be duplicates
+def split_groups_by_hash(groups, hash_function, executor):
+  files = [file for group in groups for file in group]
+  hashes = executor.map(lambda file: safe_hash(hash_function, *file), files)
+
+  split_groups = dict()
+  for file, file_hash in zip(files, hashes):
+    if file_hash is not None:
+      split_groups.setdefault((file[1], file_hash), list()).append(file)
+
+  return [group for group in split_groups.values() if len(group) > 1]
+
+# Compute a hash, logging files that cannot be read instead of failing the whole stage
+# ValueError is raised by mmap, e.g. for a file truncated while it is mapped
+def safe_hash(hash_function, path, size):
+  try:
+    return hash_function(path, size)
+  except (OSError, ValueError) as e:
+    file_events.warning(f'Failed to hash file: {path}\n  {e}')
+    return None
+
+# Find the byte-identical files among the files to organise, and between them and the files already organised
+# Files are grouped by size first, then by a partial hash of their first and last bytes, and only the remaining candidates get a full hash
+# Both inputs are lists of (path, size) pairs, and the files already organised always take precedence as originals
+# When a dict of known hashes is given, full hashes are looked up in it and the newly computed ones are added to it
+# Returns a dict mapping the path of each duplicated file to organise to the path of its original file
+def find_duplicates(files, organised_files = None, hash_workers = 4, known_hashes = None):
+  organised_files = organised_files or list()
+  organised_paths = { path for path, size in organised_files }
+  groups_by_size = dict()
+
+  for path, size in organised_files + list(files):
+    if size > 0:
+      groups_by_size.setdefault(size, list()).append((path, size))
+
+  groups = [
+    group for group in groups_by_size.values()
+    if len(group) > 1 and any(path not in organised_paths for path, size in group)
+  ]
+
+  with ThreadPoolExecutor(max_workers = max(1, hash_workers), thread_name_prefix = 'hash') as executor:
+    groups = split_groups_by_hash(groups, partial_hash, executor)
+
+    # The partial hash already covers the whole contents of small files
+    small_groups = [group for group in groups if group[0][1] <= 2 * PARTIAL_HASH_SIZE]
+    large_groups = [group for group in groups if group[0][1] > 2 * PARTIAL_HASH_SIZE]
+    hash_function = full_hash if known_hashes is None else cached_full_hash(known_hashes)
+    groups = small_groups + split_groups_by_hash(large_groups, hash_function, executor)
+
+  duplicates = dict()
+  for group in groups:
+    paths = sorted((path for path, size in group), key = lambda path: path not in organised_paths)
+    original_path = paths[0]
+
+    for path in paths[1:]:
+      if path not in organised_paths:
+        duplicates[path] = original_path
+
+  return duplicates
@@ -1,52 +1,688 @@
+import errno
+import itertools
 import logging
 import os
-import shutil
-import time
+import stat as stat_module
+from concurrent.futures import ThreadPoolExecutor
+from .capture_date import CaptureDateCache, read_camera_model, resolve_creation_dates
+from .configuration_reader import apply_config_defaults
+from .destinations import FREE_DIR_PATTERN
+from .duplicates import DUPLICATES_DIR_NAME, find_duplicates, full_hash, safe_hash
+from .logger_config import FILE_EVENTS_LOGGER_NAME
+from .metrics import RunMetrics
+from .move_journal import JOURNAL_BEGIN_RECORDS
+from .move_plan import ACTION_HARDLINK, ACTION_LINK, ACTION_MOVE, ACTION_SKIP, PlannedMove, check_free_space
+from .name_index import NameIndex, NameIndexCache, numbered_name
+from .packing import pack_files
+from .pipeline import Pipeline
+from .rules import as_ruleset
+from .scan_index import STATUS_ORGANISED, STATUS_SKIPPED
+from .scheduler import schedule_moves
+from .storage import LOCAL_STORAGE, get_storage
+from .transfer import TransferEngine, is_copy_of
 
-# Iterate over all media files in the directory to organise
-def organise_media(dir, media_types):
+# Errors of os.link for which the link mode falls back to cloning or copying the file, e.g. across filesystems or past the filesystem's link limit
+LINK_UNSUPPORTED_ERRNOS = { errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.ENOTSUP }
+
+# Number of destination directories whose name indexes are kept by stream_media, so its memory use does not grow with the number of destinations
+STREAM_NAME_INDEX_CACHE_SIZE = 64
+
+# Number of capture dates kept in memory by stream_media, see capture_date.CaptureDateCache
+STREAM_DATE_CACHE_SIZE = 4096
+
+# Logger of the per-file events, whose verbosity is set by the file_log_level configuration variable
+file_events = logging.getLogger(FILE_EVENTS_LOGGER_NAME)
+
+# Organise all media files in a directory, by planning the moves and then executing the plan
+# With the streaming option, and unless duplicates are looked for, the files are organised as they are found instead, see stream_media
+# The options are the optional configuration variables, see configuration_reader.OPTIONAL_CONFIG_DEFAULTS
+# When a scan index is given, the processed files are recorded in it, and the records of previous runs are reused
+# When run metrics are given, the counters and timers of each phase are added to them
+# The files are listed, stat-ed, created, renamed, copied and deleted through a storage backend, the one of the storage option by default,
+# see storage.get_storage
+# When a run manifest is given, the moved files are recorded in it, see execute_plan
+# Returns the number of files moved
+def organise_media(dir, media_types, options = None, scan_index = None, metrics = None, storage = None, manifest = None):
+  options = apply_config_defaults(options)
+  storage = storage or get_storage(options)
+  if options['streaming'] and options['duplicates'] == 'keep':
+    return stream_media(dir, media_types, options, scan_index, metrics, storage = storage, manifest = manifest)
+
+  plan = plan_media(dir, media_types, options, scan_index, metrics, storage = storage)
+  file_count = execute_plan(plan, options, scan_index, metrics, storage = storage, manifest = manifest)
+
+  logging.info(f'Finished moving {str(file_count)} files in: {dir}!')
+  return file_count
+
+# Plan how to organise all media files in a directory, without changing anything on disk
+# Destination names are resolved against an in-memory name index of each destination directory, so the plan already accounts for name clashes
+# When a list of paths is given, only those files are planned instead of scanning the directory, e.g. for the files reported by the watch mode
+# Returns the list of planned moves
+def plan_media(dir, media_types, options = None, scan_index = None, metrics = None, paths = None, storage = None):
+  options = apply_config_defaults(options)
+  storage = storage or get_storage(options)
+  ruleset = as_ruleset(media_types, options['rules'], options['destination'])
+  dir_metrics = (metrics or RunMetrics()).for_dir(dir)
+  name_indexes = NameIndexCache(storage = storage)
+  logging.info(f'Starting to plan files in: {dir}...')
+
+  with dir_metrics.timer('scan'):
+    entries = list(get_media_files(dir, ruleset, options['recursive'], storage) if paths is None else get_file_entries(paths, ruleset, storage))
+  dir_metrics.count('scanned_files', len(entries))
+
+  # The stats are cached by the directory entries, so later phases do not stat the files again
+  with dir_metrics.timer('stat'):
+    storage.stat_entries(entries)
+
+  plan = list()
+  duplicates = dict()
+  known_hashes = dict()
+  pending_duplicates = list()
+  planned_paths = dict()
+
+  dir_device = storage.stat(dir).st_dev if storage.is_dir(dir) else None
+
+  # A directory to organise that does not exist is an error, while the files given by path may simply have been removed since
+  if dir_device is None and paths is None:
+    dir_metrics.count('errors')
+
+  if scan_index is not None and options['duplicates'] == 'skip':
+    entries = skip_unchanged_files(entries, scan_index.get_files(dir, STATUS_SKIPPED))
+
+  if options['duplicates'] != 'keep' and dir_device is not None:
+    entries = list(entries)
+    files = [(entry.path, entry.stat().st_size) for entry in entries]
+
+    with dir_metrics.timer('dedup'):
+      organised_files, known_hashes = get_known_organised_files(dir, ruleset, scan_index, storage)
+      # The full hashes computed are kept even without a scan index, so the run manifest does not compute them again
+      known_hashes = dict() if known_hashes is None else known_hashes
+      duplicates = find_duplicates(files, organised_files, options['hash_workers'], known_hashes)
+
+    dir_metrics.count('duplicates', len(duplicates))
+    logging.info(f'Found {str(len(duplicates))} duplicated files in: {dir}')
+
+    if scan_index is not None:
+      scan_index.record_hashes([(path, size, mtime, file_hash) for path, (size, mtime, file_hash) in known_hashes.items()])
+
+  def planned_move(action, entry, dest_file_path, original_path = None):
+    stat = entry.stat()
+    file_hash = (known_hashes or {}).get(entry.path, (None, None, None))[2]
+    return PlannedMove(action, dir, entry.path, dest_file_path, stat.st_size, stat.st_mtime, stat.st_ino, stat.st_dev != dir_device, original_path, file_hash)
+
+  date_cache = CaptureDateCache(scan_index)
+  move_action = ACTION_MOVE if options['organise_mode'] == 'move' else ACTION_LINK
+
+  with dir_metrics.timer('dates'):
+    dated_entries = list(resolve_creation_dates(entries, options['date_source'], options['date_workers'], date_cache))
+    destinations = resolve_destinations(dir, dated_entries, ruleset, options['date_workers'])
+
+  for entry, destination_path in destinations:
+    if move_action == ACTION_LINK and is_already_linked(entry, destination_path, name_indexes.get(destination_path), storage):
+      continue
+
+    if entry.path in duplicates:
+      pending_duplicates.append((entry, destination_path))
+      continue
+
+    planned_paths[entry.path] = os.path.join(destination_path, name_indexes.get(destination_path).reserve(entry.name))
+    plan.append(planned_move(move_action, entry, planned_paths[entry.path]))
+
+  for entry, destination_path in pending_duplicates:
+    original_path = planned_paths.get(duplicates[entry.path], duplicates[entry.path])
+
+    if options['duplicates'] == 'skip':
+      plan.append(planned_move(ACTION_SKIP, entry, None, original_path))
+      continue
+
+    # Duplicates are only replaced with hardlinks when moved, since in the link modes they are kept where they are
+    action = ACTION_HARDLINK if options['duplicates'] == 'hardlink' and move_action == ACTION_MOVE else move_action
+    if options['duplicates'] == 'move':
+      destination_path = os.path.join(dir, DUPLICATES_DIR_NAME, '')
+
+    dest_file_path = os.path.join(destination_path, name_indexes.get(destination_path).reserve(entry.name))
+    plan.append(planned_move(action, entry, dest_file_path, original_path))
+
+  dir_metrics.count('planned_files', sum(1 for move in plan if move.action != ACTION_SKIP))
+  dir_metrics.count('planned_collisions', sum(1 for move in plan if move.dest_file_path is not None and os.path.basename(move.dest_file_path) != os.path.basename(move.src_file_path)))
+
+  logging.info(f'Planned {str(len(plan))} files in: {dir}')
+  return plan
+
+# Check whether a file was already linked, cloned or copied into its destination directory by a previous run in a link mode,
+# under its own name or the numbered name it got because of a name clash, so re-runs do not link the same file again
+def is_already_linked(entry, destination_path, name_index, storage = None):
+  storage = storage or LOCAL_STORAGE
+  file_name = entry.name
+  number = 1
+
+  while file_name in name_index:
+    try:
+      if is_copy_of(storage.stat(os.path.join(destination_path, file_name)), entry.stat()):
+        return True
+    except OSError:
+      pass
+
+    number += 1
+    file_name = numbered_name(entry.name, number)
+
+  return False
+
+# Resolve the destination directory of a list of (entry, creation date) pairs, from the destination template of the rule matching each entry
+# The destinations are formatted once per date bucket by the compiled templates, and joined to the directory once per destination,
+# which is remembered in the given dict of destination paths, to be reused across several calls for the same directory
+# Returns a list of (entry, destination path) pairs, leaving out the files already in their destination
+def resolve_destinations(dir, dated_entries, ruleset, date_workers = 4, destination_paths = None):
+  destination_paths = dict() if destination_paths is None else destination_paths
+  rules = [ruleset.match_entry(entry) for entry, creation_epoch in dated_entries]
+  cameras = read_camera_models([entry for (entry, creation_epoch), rule in zip(dated_entries, rules) if rule.destination.needs_camera], date_workers)
+  destinations = list()
+
+  for (entry, creation_epoch), rule in zip(dated_entries, rules):
+    destination = rule.destination.format(creation_epoch, cameras.get(entry.path))
+
+    if destination not in destination_paths:
+      destination_path = os.path.join(dir, destination, '')
+      destination_paths[destination] = (destination_path, os.path.normpath(destination_path))
+    destination_path, normalised_destination_path = destination_paths[destination]
+
+    # Files already in their destination, e.g. found by a recursive scan of a custom destination, are left where they are
+    if os.path.normpath(os.path.dirname(entry.path)) != normalised_destination_path:
+      destinations.append((entry, destination_path))
+
+  return destinations
+
+# Organise the media files of a directory as they are found, through a pipeline of threads connected by bounded queues:
+# the scan, the creation dates and the moves of a few files at a time overlap, so the first files are moved straight away, and the scan
+# waits for the moves when it gets ahead, so the memory used does not depend on the number of files in the directory
+# Each batch is planned without reserving names, executed like a plan (see execute_plan) and recorded in the move journal, when one is given
+# Duplicates are not looked for, since that needs all the files of the directory
+# Returns the number of files moved
+def stream_media(dir, media_types, options = None, scan_index = None, metrics = None, journal = None, storage = None, manifest = None):
+  options = apply_config_defaults(options)
+  storage = storage or get_storage(options)
+  ruleset = as_ruleset(media_types, options['rules'], options['destination'])
+  metrics = metrics or RunMetrics()
+  dir_metrics = metrics.for_dir(dir)
+
+  if not storage.is_dir(dir):
+    dir_metrics.count('errors')
+    logging.warning(f'Failed to organise directory: {dir}. It does not exist.')
+    return 0
+
+  logging.info(f'Starting to organise files as they are found in: {dir}...')
+  dir_device = storage.stat(dir).st_dev
+  name_indexes = NameIndexCache(STREAM_NAME_INDEX_CACHE_SIZE, storage)
+  created_dirs = set()
+  destination_paths = dict()
+  move_action = ACTION_MOVE if options['organise_mode'] == 'move' else ACTION_LINK
   file_count = 0
-  logging.info(f'Starting to organise files in: {dir}...')
 
-  for file in get_media_files(dir, media_types):
-    creation_epoch = os.stat(os.path.join(dir, file)).st_mtime
-    creation_date = time.strftime('%Y-%m_%B-%d', time.localtime(creation_epoch))
+  with Pipeline() as pipeline:
+    entries = pipeline.stage('scan', get_media_files(dir, ruleset, options['recursive'], storage))
+    dated_entries = pipeline.stage('date', resolve_creation_dates(entries, options['date_source'], options['date_workers'], CaptureDateCache(scan_index, STREAM_DATE_CACHE_SIZE)))
+
+    for batch in dated_entries.chunks():
+      dir_metrics.count('scanned_files', len(batch))
+
+      plan = list()
+      for entry, destination_path in resolve_destinations(dir, batch, ruleset, options['date_workers'], destination_paths):
+        if move_action == ACTION_LINK and is_already_linked(entry, destination_path, name_indexes.get(destination_path), storage):
+          continue
+
+        stat = entry.stat()
+        plan.append(PlannedMove(move_action, dir, entry.path, os.path.join(destination_path, entry.name), stat.st_size, stat.st_mtime, stat.st_ino, stat.st_dev != dir_device, None, None))
+      dir_metrics.count('planned_files', len(plan))
+
+      free_space_errors = check_free_space(plan)
+      if free_space_errors:
+        raise OSError('\n'.join(free_space_errors))
+
+      if journal is not None:
+        journal.record_plan(plan)
+      file_count += execute_plan(plan, options, scan_index, metrics, journal, name_indexes, created_dirs, storage, manifest)
+
+  logging.info(f'Finished moving {str(file_count)} files in: {dir}!')
+  return file_count
+
+# Execute a plan, in the move order of the options (see scheduler.MOVE_ORDERS), in batches of up to JOURNAL_BEGIN_RECORDS consecutive moves,
+# whatever their destination directories, so orders that go back and forth between the destinations still fsync the journal once per batch
+# The destination directories are created and have their name indexes loaded once, up front, and planned names that were taken in the meantime are resolved again
+# Hardlinks are created last, once the original files they point to were moved
+# When run metrics are given, the counters and timers of each phase are added to them
+# When a move journal is given, the moves of each batch are recorded in it before they begin, and again once they complete
+# Consecutive plans can share a name index cache and a set of the directories already created, so their destinations are only loaded and created once
+# When a run manifest is given, the moved files are recorded in it with their hash, see record_manifest_files
+# A move that fails is logged and counted as an error, and the next moves are still executed
+# Returns the number of files moved
+def execute_plan(plan, options = None, scan_index = None, metrics = None, journal = None, name_indexes = None, created_dirs = None, storage = None, manifest = None):
+  options = apply_config_defaults(options)
+  storage = storage or get_storage(options)
+  metrics = metrics or RunMetrics()
+  actual_paths = dict()
+  processed_moves = list()
+  created_dirs = set() if created_dirs is None else created_dirs
+
+  name_indexes = NameIndexCache(storage = storage) if name_indexes is None else name_indexes
+
+  moves = [move for move in plan if move.action != ACTION_SKIP]
+  if moves:
+    with metrics.for_dir(moves[0].dir).timer('schedule'):
+      moves = schedule_moves(moves, options['move_order'])
+    prepare_dest_dirs(moves, storage, metrics, name_indexes, created_dirs)
+
+  transfer_engine = TransferEngine(options['transfer_workers'], journal, hash_copies = manifest is not None)
+  failures = list()
+
+  # The moves that completed are recorded even when the run is stopped, e.g. by an interrupt or a full journal disk
+  try:
+    with transfer_engine:
+      for is_hardlink, group in itertools.groupby(moves, key = lambda move: move.action == ACTION_HARDLINK):
+        if is_hardlink:
+          transfer_engine.wait()
+
+        group = list(group)
+        for start in range(0, len(group), JOURNAL_BEGIN_RECORDS):
+          batch = group[start:start + JOURNAL_BEGIN_RECORDS]
+          dir_metrics = metrics.for_dir(batch[0].dir)
+          dest_paths = [os.path.dirname(move.dest_file_path) for move in batch]
+
+          # The name index of each destination is held for the whole batch, so the names reserved in it stay reserved until the files are moved
+          with dir_metrics.timer('collisions'):
+            batch_name_indexes = dict()
+            for dest_path in dest_paths:
+              if dest_path not in batch_name_indexes:
+                batch_name_indexes[dest_path] = name_indexes.get(dest_path)
+            dest_file_names = [
+              reserve_dest_file_name(batch_name_indexes[dest_path], os.path.basename(move.src_file_path), os.path.basename(move.dest_file_path))
+              for move, dest_path in zip(batch, dest_paths)
+            ]
+
+          original_paths = [actual_paths.get(move.original_path, move.original_path) for move in batch]
+          if journal is not None:
+            journal.begin([
+              (move, os.path.join(dest_path, dest_file_name), original_path)
+              for move, dest_path, dest_file_name, original_path in zip(batch, dest_paths, dest_file_names, original_paths)
+            ])
+
+          for move, dest_path, dest_file_name, original_path in zip(batch, dest_paths, dest_file_names, original_paths):
+            name_index = batch_name_indexes[dest_path]
+
+            # A failed move, e.g. of a file deleted since it was planned, is logged and counted as an error, and the next files are still moved
+            try:
+              with dir_metrics.timer('move'):
+                if is_hardlink:
+                  actual_paths[move.dest_file_path] = safe_link(move.src_file_path, original_path, dest_path, name_index, dest_file_name, journal, reserved = True, storage = storage)
+                else:
+                  link_mode = (options['organise_mode'] if options['organise_mode'] != 'move' else 'hardlink') if move.action == ACTION_LINK else None
+                  actual_paths[move.dest_file_path] = safe_move(
+                    move.src_file_path, dest_path, transfer_engine, name_index, dest_file_name, journal, reserved = True, link_mode = link_mode, storage = storage
+                  )
+            except Exception as e:
+              file_events.error(f'Failed to move file: {move.src_file_path}\n  to: {os.path.join(dest_path, dest_file_name)}', exc_info=True)
+              failures.append((move.src_file_path, e))
+
+            processed_moves.append(move)
+  finally:
+    failed_paths = { src_file_path for src_file_path, error in transfer_engine.failures + failures }
+    file_count = sum(1 for move in processed_moves if move.src_file_path not in failed_paths)
+    record_executed_moves(plan, processed_moves, actual_paths, failed_paths, transfer_engine, options, scan_index, metrics, journal, manifest)
+
+  return file_count
 
-    date_elements = creation_date.split('-')
-    year = date_elements[0]
-    month = date_elements[1]
+# Record the moves processed by a plan, completed or failed, in the run manifest, the archives of the small files, the run metrics and the scan index
+# Failed moves are only counted as errors
+def record_executed_moves(plan, processed_moves, actual_paths, failed_paths, transfer_engine, options, scan_index, metrics, journal, manifest):
+  # The files are recorded before they are packed, since their hash may have to be read from their destination
+  if manifest is not None and processed_moves:
+    with metrics.for_dir(processed_moves[0].dir).timer('manifest'):
+      record_manifest_files(manifest, processed_moves, actual_paths, failed_paths, transfer_engine, options['hash_workers'])
 
-    destination_path = os.path.join(dir, year, month, '')
-    os.makedirs(os.path.dirname(destination_path), exist_ok = True)
+  if options['pack_threshold'] > 0:
+    # The commits of the moves are written before their destination files are packed and deleted, so resuming the run never takes them for moves that did not happen
+    if journal is not None:
+      journal.flush()
+    pack_moved_files(processed_moves, actual_paths, failed_paths, options, metrics)
 
-    file_path = os.path.join(dir, file)
-    safe_move(file_path, destination_path)
-    file_count += 1
+  for move in processed_moves:
+    record_move_metrics(metrics.for_dir(move.dir), move, actual_paths.get(move.dest_file_path), transfer_engine, move.src_file_path in failed_paths)
 
-  logging.info(f'Finished moving {str(file_count)} files!')
+  if scan_index is not None:
+    record_processed_files(scan_index, [
+      move._replace(dest_file_path = actual_paths[move.dest_file_path])
+      for move in processed_moves if move.src_file_path not in failed_paths
+    ] + [move for move in plan if move.action == ACTION_SKIP])
 
-# Get the list of media files from the input directory path, based on the input media types array
-def get_media_files(dir, media_types):
-  if os.path.isdir(dir):
-    for file in os.listdir(dir):
-      if os.path.isfile(os.path.join(dir, file)):
-        filename, file_extension = os.path.splitext(file)
+# Create the destination directories of the moves that were not created yet, and load their name indexes, before any file is moved
+# The directories are created in one batched call of the storage backend, and their name indexes are loaded concurrently,
+# so on a network share their round trips overlap instead of adding up, but only when the cache can hold all of them
+def prepare_dest_dirs(moves, storage, metrics, name_indexes, created_dirs):
+  dest_paths = dict()
+  for move in moves:
+    dest_paths.setdefault(os.path.dirname(move.dest_file_path), move.dir)
 
-        if file_extension in media_types:
-          yield file
+  new_dest_paths = [dest_path for dest_path in dest_paths if dest_path not in created_dirs]
+  for dest_path in new_dest_paths:
+    metrics.for_dir(dest_paths[dest_path]).count('dest_dirs')
+
+  dir_metrics = metrics.for_dir(moves[0].dir)
+  with dir_metrics.timer('mkdir'):
+    storage.make_dirs(new_dest_paths)
+  created_dirs.update(new_dest_paths)
+
+  if name_indexes.max_size is None or len(dest_paths) <= name_indexes.max_size:
+    with dir_metrics.timer('collisions'):
+      storage.map(name_indexes.get, dest_paths)
+
+# Record the files moved by a plan in a run manifest (see manifest.RunManifest), with the hash they were moved with:
+# computed while they were copied by the transfer engine, found while looking for duplicates, or otherwise read from their destination,
+# on up to hash_workers threads
+# Files whose hash cannot be read are left out of the manifest
+def record_manifest_files(manifest, moves, actual_paths, failed_paths, transfer_engine, hash_workers = 4):
+  moves = [move for move in moves if move.src_file_path not in failed_paths]
+  file_hashes = [transfer_engine.digests.get(move.src_file_path, move.file_hash) for move in moves]
+  unhashed_moves = [move for move, file_hash in zip(moves, file_hashes) if file_hash is None]
+
+  with ThreadPoolExecutor(max_workers = max(1, hash_workers), thread_name_prefix = 'manifest') as executor:
+    read_hashes = iter(executor.map(lambda move: safe_hash(full_hash, actual_paths[move.dest_file_path], move.size), unhashed_moves))
+    file_hashes = [next(read_hashes) if file_hash is None else file_hash for file_hash in file_hashes]
+
+  manifest.record([
+    (actual_paths[move.dest_file_path], move.size, move.mtime, file_hash)
+    for move, file_hash in zip(moves, file_hashes) if file_hash is not None
+  ])
+
+# Pack the files smaller than the pack threshold moved by a plan into the archive of their destination directory, see packing.pack_files
+# Only the files moved in move mode are packed: the links of the link modes and the duplicates are left as they are
+# When a directory cannot be packed, e.g. because its archive is damaged, its files are left unpacked
+def pack_moved_files(moves, actual_paths, failed_paths, options, metrics):
+  files_by_dest_path = dict()
+
+  for move in moves:
+    if move.action == ACTION_MOVE and move.original_path is None and move.size < options['pack_threshold'] and move.src_file_path not in failed_paths:
+      files_by_dest_path.setdefault(os.path.dirname(actual_paths[move.dest_file_path]), list()).append(move)
+
+  for dest_path, dest_moves in files_by_dest_path.items():
+    dir_metrics = metrics.for_dir(dest_moves[0].dir)
+    sizes = { actual_paths[move.dest_file_path]: move.size for move in dest_moves }
+
+    try:
+      with dir_metrics.timer('pack'):
+        packed_paths = pack_files(dest_path, list(sizes), options['pack_format'])
+    except (OSError, ValueError) as e:
+      dir_metrics.count('errors')
+      logging.error(f'Failed to pack the small files of directory: {dest_path}\n  {e}')
+      continue
+
+    dir_metrics.count('packed_files', len(packed_paths))
+    dir_metrics.count('packed_bytes', sum(sizes[path] for path in packed_paths))
+
+# Add an executed move to the metrics of its directory
+def record_move_metrics(dir_metrics, move, actual_path, transfer_engine, failed):
+  if failed:
+    dir_metrics.count('errors')
+    return
+
+  dir_metrics.count('moved_files')
+  dir_metrics.count('moved_bytes', move.size)
+  dir_metrics.count('collisions', os.path.basename(actual_path) != os.path.basename(move.src_file_path))
+
+  if move.action == ACTION_HARDLINK:
+    dir_metrics.count('hardlinks')
+  elif move.action == ACTION_LINK:
+    if move.src_file_path not in transfer_engine.copy_seconds:
+      dir_metrics.count('links')
+      return
+
+    dir_metrics.count('clones' if move.src_file_path in transfer_engine.cloned else 'copies')
+    dir_metrics.count('copied_bytes', move.size)
+    dir_metrics.add_time('copy', transfer_engine.copy_seconds[move.src_file_path])
+  elif move.cross_device:
+    dir_metrics.count('cross_device_copies')
+    dir_metrics.count('copied_bytes', move.size)
+    dir_metrics.add_time('copy', transfer_engine.copy_seconds.get(move.src_file_path, 0))
+  else:
+    dir_metrics.count('renames')
+
+# Filter out the files recorded in the scan index that did not change since they were last processed
+def skip_unchanged_files(entries, recorded_files):
+  for entry in entries:
+    recorded_file = recorded_files.get(os.path.abspath(entry.path))
+
+    if recorded_file is not None:
+      stat = entry.stat()
+      size, mtime, inode, file_hash = recorded_file
+
+      if (size, mtime, inode) == (stat.st_size, stat.st_mtime, stat.st_ino):
+        continue
+
+    yield entry
+
+# Read the camera models of directory entries, using up to max_workers threads
+# Returns a dict mapping the paths of the entries to their camera models, which are None for files without one
+def read_camera_models(entries, max_workers = 4):
+  if not entries:
+    return dict()
+
+  with ThreadPoolExecutor(max_workers = max(1, max_workers), thread_name_prefix = 'camera') as executor:
+    return dict(zip((entry.path for entry in entries), executor.map(read_camera_model, (entry.path for entry in entries))))
+
+# Get the (path, size) pairs of the files already organised in a directory, and the hashes known for them
+# The destination sub-directories are only walked the first time, after which their contents are read from the scan index
+def get_known_organised_files(dir, media_types, scan_index = None, storage = None):
+  media_types = as_ruleset(media_types)
+
+  if scan_index is None:
+    return [(entry.path, entry.stat().st_size) for entry in get_organised_files(dir, media_types, storage)], None
+
+  if not scan_index.is_dir_indexed(dir):
+    scan_index.record_files(dir, STATUS_ORGANISED, [
+      (entry.path, None, entry.stat().st_size, entry.stat().st_mtime, entry.stat().st_ino, None)
+      for entry in get_organised_files(dir, media_types, storage)
+    ])
+    scan_index.mark_dir_indexed(dir)
+
+  organised_files = list()
+  known_hashes = dict()
+
+  for path, (size, mtime, inode, file_hash) in scan_index.get_files(dir, STATUS_ORGANISED).items():
+    if media_types.match(os.path.basename(path), lambda: size) is not None:
+      organised_files.append((path, size))
+
+      if file_hash is not None:
+        known_hashes[path] = (size, mtime, file_hash)
+
+  return organised_files, known_hashes
+
+# Record the files moved and skipped by a plan in the scan index, with one batch per directory and status
+def record_processed_files(scan_index, moves):
+  batches = dict()
+
+  for move in moves:
+    status = STATUS_SKIPPED if move.action == ACTION_SKIP else STATUS_ORGANISED
+    path = move.src_file_path if move.action == ACTION_SKIP else move.dest_file_path
+    batches.setdefault((move.dir, status), list()).append((path, move.src_file_path, move.size, move.mtime, move.inode, move.file_hash))
+
+  for (dir, status), files in batches.items():
+    scan_index.record_files(dir, status, files)
+
+# Get the media files from the input directory path, based on the input media types array or compiled ruleset (see rules.compile_ruleset)
+# Extensions are matched case-insensitively
+# Yields the directory entries listed by the storage backend (os.DirEntry objects for the local filesystem), so callers can reuse their
+# cached stat info instead of issuing extra stat calls
+def get_media_files(dir, media_types, recursive = False, storage = None):
+  storage = storage or LOCAL_STORAGE
+  if storage.is_dir(dir):
+    yield from scan_media_files(dir, as_ruleset(media_types), recursive, storage = storage)
   else:
     logging.warning(f'Failed to organise directory: {dir}. It does not exist.')
 
+# Directory entry of a single file, with the stat caching interface of os.DirEntry, for files known by path instead of found by a scan
+class FileEntry:
+  __slots__ = ('path', 'name', 'cached_stat')
+
+  def __init__(self, path, stat = None):
+    self.path = path
+    self.name = os.path.basename(path)
+    self.cached_stat = stat
+
+  def stat(self):
+    if self.cached_stat is None:
+      self.cached_stat = os.stat(self.path)
+    return self.cached_stat
+
+  def is_file(self):
+    return os.path.isfile(self.path) if self.cached_stat is None else stat_module.S_ISREG(self.cached_stat.st_mode)
+
+# Get the entries of the files from a list of paths that still exist and are matched by a ruleset
+# The paths are stat-ed in one batched call of the storage backend
+def get_file_entries(paths, ruleset, storage = None):
+  paths = list(paths)
+
+  for path, stat in zip(paths, (storage or LOCAL_STORAGE).stat_many(paths)):
+    entry = FileEntry(path, stat)
+
+    if stat is not None and entry.is_file() and ruleset.match_entry(entry) is not None:
+      yield entry
+
+# Scan a directory through a storage backend, optionally descending into sub-directories, yielding the entries matched by a ruleset
+# The destination directories of the ruleset and the duplicates directory at the root of the scan are skipped, since they hold files that were already organised
+# The components are those of the path of the directory relative to the root of the scan
+def scan_media_files(dir, ruleset, recursive = False, components = (), storage = None):
+  storage = storage or LOCAL_STORAGE
+  subdirs = list()
+
+  for entry in storage.list_dir(dir):
+    if entry.is_file():
+      if ruleset.match_entry(entry) is not None:
+        yield entry
+    elif recursive and entry.is_dir(follow_symlinks = False) and not is_organised_dir(components + (entry.name,), ruleset):
+      subdirs.append((entry.path, components + (entry.name,)))
+
+  for subdir, subdir_components in subdirs:
+    yield from scan_media_files(subdir, ruleset, recursive, subdir_components, storage)
+
+# Check whether a directory, given by its path components relative to an organised directory, holds organised files, i.e. whether it is
+# the duplicates directory, a destination of the rules of a ruleset, or a parent of one whose name was formatted from the destination,
+# e.g. a year directory, but not a directory whose name could be anything, e.g. the camera directories of '{camera}/{year}'
+def is_organised_dir(components, ruleset):
+  if components == (DUPLICATES_DIR_NAME,):
+    return True
+
+  return any(
+    destination.matches(components) or (destination.matches(components, prefix = True) and destination.dir_patterns[len(components) - 1].pattern != FREE_DIR_PATTERN)
+    for destination in ruleset.destinations
+  )
+
+# Get the directory entries of the files already organised in the destination directories of a directory, e.g. its year/month sub-directories
+# Only the sub-directories that can lead to a destination of the ruleset are listed, apart from the duplicates directory, and a file is
+# only taken as organised when it is in a destination of the rule it matches
+def get_organised_files(dir, media_types, storage = None, components = ()):
+  storage = storage or LOCAL_STORAGE
+  media_types = as_ruleset(media_types)
+  organised_files = list()
+
+  for entry in storage.list_dir(dir):
+    if entry.is_dir(follow_symlinks = False):
+      subdir_components = components + (entry.name,)
+      if subdir_components != (DUPLICATES_DIR_NAME,) and any(destination.matches(subdir_components, prefix = True) for destination in media_types.destinations):
+        organised_files.extend(get_organised_files(entry.path, media_types, storage, subdir_components))
+    elif components and entry.is_file():
+      rule = media_types.match_entry(entry)
+      if rule is not None and rule.destination.matches(components):
+        organised_files.append(entry)
+
+  return organised_files
+
+# Replace a duplicated file with a hardlink to its original file in the destination directory
+# Falls back to moving the file when the hardlink cannot be created, e.g. across filesystems
+# See safe_move for the journal, reserved and storage arguments
+# Returns the destination file path
+def safe_link(src_file_path, original_path, dest_path, name_index, dest_file_name = None, journal = None, reserved = False, storage = None):
+  storage = storage or LOCAL_STORAGE
+  if not reserved:
+    dest_file_name = reserve_dest_file_name(name_index, os.path.basename(src_file_path), dest_file_name)
+  dest_file_path = os.path.join(dest_path, dest_file_name)
+
+  try:
+    storage.link(original_path, dest_file_path)
+  except OSError as e:
+    name_index.release(dest_file_name)
+    file_events.warning(f'Failed to hardlink duplicated file: {src_file_path}\n  {e}')
+    return safe_move(src_file_path, dest_path, name_index = name_index, dest_file_name = dest_file_name, journal = journal, storage = storage)
+
+  storage.delete(src_file_path)
+  if journal is not None:
+    journal.commit(src_file_path, dest_file_path)
+
+  file_events.info(f'Hardlinked duplicated file: {src_file_path}\n  to: {dest_file_path}')
+  return dest_file_path
+
+# Reserve the planned destination name of a file if it is still free, or the next free name for the file otherwise
+def reserve_dest_file_name(name_index, file_name, planned_file_name = None):
+  if planned_file_name is not None and name_index.claim(planned_file_name):
+    return planned_file_name
+
+  return name_index.reserve(file_name)
+
 # Safely move files from one directory to another, by avoiding name clashes in the destination directory
-# If there is a name clash, appends '_copy' to the filename (before the extension)
-def safe_move(src_file_path, dest_path):
-  src_dir, src_file_name = os.path.split(src_file_path)
-  dest_file_name = src_file_name
+# If there is a name clash, appends a number to the filename (before the extension), e.g. 'file (2).jpg'
+# Free names are looked up in the destination's name index, which is loaded from the directory when none is given
+# Files are renamed when possible. Moves to another filesystem are queued in the transfer engine when one is given, or copied synchronously otherwise
+# A planned destination file name is used as long as it is still free, unless reserved is true, in which case the caller already reserved it in the name index
+# When a move journal is given, the move is recorded in it once it completes (or fails), including moves completed later by the transfer engine
+# With a link mode, the source file is kept and linked to the destination instead:
+#  - hardlink: hardlinked, or cloned (or copied) when it cannot be, e.g. across filesystems
+#  - reflink: cloned, or copied when the filesystem does not support it
+# The file is renamed, linked, copied and deleted through a storage backend, the local filesystem by default, see storage.LocalStorage,
+# and copies are only queued in the transfer engine by the backends whose files are local paths
+# Returns the destination file path
+def safe_move(src_file_path, dest_path, transfer_engine = None, name_index = None, dest_file_name = None, journal = None, reserved = False, link_mode = None, storage = None):
+  storage = storage or LOCAL_STORAGE
+  if name_index is None:
+    name_index = NameIndex(dest_path, storage)
 
-  while os.path.exists(os.path.join(dest_path, dest_file_name)):
-    dest_file_name = dest_file_name.replace('.', '_copy.', 1)
+  src_dir, src_file_name = os.path.split(src_file_path)
+  if not reserved:
+    dest_file_name = reserve_dest_file_name(name_index, src_file_name, dest_file_name)
 
   if dest_file_name != src_file_name:
-    logging.warning(f'Duplicated filename in destination directory: {dest_path}\n  Renamed a file to: {dest_file_name}')
+    file_events.warning(f'Duplicated filename in destination directory: {dest_path}\n  Renamed a file to: {dest_file_name}')
+
+  dest_file_path = os.path.join(dest_path, dest_file_name)
+  queued = False
+
+  # Files are only copied across filesystems, or in the link modes when they cannot be hardlinked
+  copy = link_mode == 'reflink'
+
+  try:
+    if not copy:
+      try:
+        if link_mode is None:
+          storage.rename(src_file_path, dest_file_path)
+        else:
+          storage.link(src_file_path, dest_file_path)
+      except OSError as e:
+        if e.errno not in (LINK_UNSUPPORTED_ERRNOS if link_mode is not None else { errno.EXDEV }):
+          raise
+        copy = True
+
+    if copy:
+      if transfer_engine is not None and storage.queues_copies:
+        transfer_engine.submit(src_file_path, dest_file_path, keep_source = link_mode is not None)
+        queued = True
+      else:
+        storage.copy(src_file_path, dest_file_path, clone = link_mode is not None)
+        if link_mode is None:
+          storage.delete(src_file_path)
+  except BaseException:
+    name_index.release(dest_file_name)
+    if journal is not None:
+      journal.abort(src_file_path, dest_file_path)
+    raise
+
+  if journal is not None and not queued:
+    journal.commit(src_file_path, dest_file_path)
 
-  shutil.move(src_file_path, os.path.join(dest_path, dest_file_name))
\ No newline at end of file
+  file_events.info(f'{"Moved" if link_mode is None else "Linked"} file: {src_file_path}\n  to: {dest_file_path}')
+  return dest_file_path
\ No newline at end of file
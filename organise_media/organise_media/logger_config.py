@@ -1,23 +1,158 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 import sys
+import time
 
 RELATIVE_LOG_DIR_PATH = "../log/"
 LOG_FILE_NAME = "organize_media.log"
 
+LOG_FORMAT = '%(asctime)s [%(levelname)s] [%(threadName)s] %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Name of the logger of the per-file events (moves, renames, failed hashes, ...), whose verbosity is configured separately
+FILE_EVENTS_LOGGER_NAME = 'organise_media.file_events'
+
+# The log file is flushed after this many records, after this many seconds, or after any error
+FILE_FLUSH_RECORDS = 500
+FILE_FLUSH_SECONDS = 1.0
+
+# Default number of records per second written to the console, before the rest are only written to the log file
+CONSOLE_RATE_LIMIT = 50
+
+# Handlers of the running queue listener, kept to apply the logging options once the configuration is read
+console_handler = None
+queue_listener = None
+
+# Log file handler that batches writes, flushing the file every FILE_FLUSH_RECORDS records or FILE_FLUSH_SECONDS seconds instead of after every record
+# Records of level ERROR and above are flushed straight away
+class BatchingFileHandler(logging.FileHandler):
+  def __init__(self, filename, flush_records = FILE_FLUSH_RECORDS, flush_seconds = FILE_FLUSH_SECONDS):
+    super().__init__(filename, encoding = 'utf-8')
+    self.flush_records = flush_records
+    self.flush_seconds = flush_seconds
+    self.pending_records = 0
+    self.last_flush = time.monotonic()
+    self.flush_now = False
+
+  def emit(self, record):
+    self.pending_records += 1
+    self.flush_now = record.levelno >= logging.ERROR
+    super().emit(record)
+
+  # Called by the stream handler after every record, but only flushes the file once a batch is complete
+  def flush(self):
+    if self.flush_now or self.pending_records >= self.flush_records or time.monotonic() - self.last_flush >= self.flush_seconds:
+      super().flush()
+      self.pending_records = 0
+      self.last_flush = time.monotonic()
+      self.flush_now = False
+
+  # Flush the records left pending, called by the queue listener when no record arrived for flush_seconds, see FlushingQueueListener
+  def flush_idle(self):
+    if self.pending_records:
+      self.flush_now = True
+      self.flush()
+
+  def close(self):
+    self.flush_now = True
+    super().close()
+
+# Queue listener that flushes the pending records of its batching file handlers whenever no record arrived for flush_seconds,
+# so the records buffered while idle, e.g. in the watch mode, are still written to the file
+class FlushingQueueListener(logging.handlers.QueueListener):
+  def __init__(self, queue, *handlers, flush_seconds = FILE_FLUSH_SECONDS):
+    super().__init__(queue, *handlers)
+    self.flush_seconds = flush_seconds
+
+  def dequeue(self, block):
+    while True:
+      try:
+        return self.queue.get(block, self.flush_seconds)
+      except queue.Empty:
+        if not block:
+          raise
+
+        for handler in self.handlers:
+          if isinstance(handler, BatchingFileHandler):
+            handler.flush_idle()
+
+# Console handler that writes at most rate_limit records per second, so a burst of per-file records does not slow down the run
+# Records of level ERROR and above are always written, and the number of records left out is reported once the next second starts
+class RateLimitedStreamHandler(logging.StreamHandler):
+  def __init__(self, stream = None, rate_limit = CONSOLE_RATE_LIMIT):
+    super().__init__(stream)
+    self.rate_limit = rate_limit
+    self.window_start = time.monotonic()
+    self.window_records = 0
+    self.suppressed_records = 0
+
+  def emit(self, record):
+    now = time.monotonic()
+    if now - self.window_start >= 1:
+      self.window_start = now
+      self.window_records = 0
+
+    if record.levelno < logging.ERROR and self.rate_limit > 0 and self.window_records >= self.rate_limit:
+      self.suppressed_records += 1
+      return
+
+    if self.suppressed_records:
+      self.stream.write(f'... {str(self.suppressed_records)} log entries were only written to the log file{self.terminator}')
+      self.suppressed_records = 0
+
+    self.window_records += 1
+    super().emit(record)
+
 # Configure the logger to write to a file and to the console
+# Log calls only put their records in a queue, and a background thread formats them and writes them to the file and the console
+# Configuring the logger again stops the previous background thread, and the logger is stopped once at exit
 def config_logger():
+  global console_handler, queue_listener
+
+  stop_logger()
   log_dir_path = os.path.join(os.path.dirname(__file__), RELATIVE_LOG_DIR_PATH)
 
   if not os.path.exists(log_dir_path):
     os.makedirs(log_dir_path)
 
-  logging.basicConfig(
-    level = logging.INFO,
-    format = '%(asctime)s [%(levelname)s] %(message)s',
-    datefmt = '%Y-%m-%d %H:%M:%S',
-    handlers = [
-      logging.FileHandler(os.path.join(log_dir_path, LOG_FILE_NAME)),
-      logging.StreamHandler(sys.stdout)
-    ]
-  )
\ No newline at end of file
+  formatter = logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT)
+  file_handler = BatchingFileHandler(os.path.join(log_dir_path, LOG_FILE_NAME))
+  console_handler = RateLimitedStreamHandler(sys.stdout)
+
+  for handler in (file_handler, console_handler):
+    handler.setFormatter(formatter)
+
+  log_queue = queue.SimpleQueue()
+  queue_listener = FlushingQueueListener(log_queue, file_handler, console_handler)
+  queue_listener.start()
+  atexit.unregister(stop_logger)
+  atexit.register(stop_logger)
+
+  # The records are formatted by the listener's handlers, so the queue handler only keeps their message
+  queue_handler = logging.handlers.QueueHandler(log_queue)
+  queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
+  logging.basicConfig(level = logging.INFO, handlers = [queue_handler], force = True)
+  logging.getLogger(FILE_EVENTS_LOGGER_NAME).setLevel(logging.WARNING)
+
+# Apply the logging options of the configuration: the level of the per-file events, and the console rate limit
+def apply_logging_options(options):
+  logging.getLogger(FILE_EVENTS_LOGGER_NAME).setLevel(options['file_log_level'])
+
+  if console_handler is not None:
+    console_handler.rate_limit = options['console_rate_limit']
+
+# Write the records left in the queue, and flush and close the log file
+def stop_logger():
+  global queue_listener
+
+  if queue_listener is not None:
+    queue_listener.stop()
+
+    for handler in queue_listener.handlers:
+      handler.close()
+
+    queue_listener = None
@@ -0,0 +1,162 @@
+import collections
+import functools
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .duplicates import FULL_HASH_CHUNK_SIZE, full_hash
+from .move_journal import new_run_file_name
+from .packing import find_packed_file, read_pack_index
+
+MANIFEST_FILE_PREFIX = 'manifest_'
+MANIFEST_FILE_EXTENSION = '.jsonl'
+
+# Number of records buffered before they are written to the manifest together
+MANIFEST_FLUSH_RECORDS = 256
+
+# Number of files queued for each verification thread, which bounds the records held in memory while a manifest is verified
+VERIFY_QUEUE_PER_WORKER = 4
+
+# Number of archive indexes kept in memory while a manifest is verified, see packing.read_pack_index
+VERIFY_PACK_INDEX_CACHE_SIZE = 64
+
+# Results of the verification of a file:
+#  - ok: the file has the size and hash it was moved with
+#  - missing: the file is neither where it was moved to, nor packed in the archive of its directory
+#  - size_mismatch: the file does not have the size it was moved with, so it was not hashed again
+#  - hash_mismatch: the file has the size it was moved with, but not the same contents
+#  - mtime_changed: the file has the contents it was moved with, but its modification time changed
+#  - error: the file could not be read
+STATUS_OK = 'ok'
+STATUS_MISSING = 'missing'
+STATUS_SIZE_MISMATCH = 'size_mismatch'
+STATUS_HASH_MISMATCH = 'hash_mismatch'
+STATUS_MTIME_CHANGED = 'mtime_changed'
+STATUS_ERROR = 'error'
+
+# Manifest of the files moved by a run, appended to a JSON lines file, with the size, modification time and BLAKE2b hash of each file
+# where it ended up, to check later that every byte was moved, see verify_manifest
+# The hashes are the same as those of the duplicates (see duplicates.full_hash), so the hashes computed to find duplicates are reused
+class RunManifest:
+  def __init__(self, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+
+    self.path = path
+    # A manifest only holds the files of one run, so an existing file is never appended to
+    self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+    self.buffer = list()
+    self.lock = threading.Lock()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  # Record files as (path, size, modification time, hash) tuples, buffered until MANIFEST_FLUSH_RECORDS are buffered
+  def record(self, files):
+    with self.lock:
+      self.buffer.extend({ 'path': path, 'size': size, 'mtime': mtime, 'blake2b': file_hash } for path, size, mtime, file_hash in files)
+
+      if len(self.buffer) >= MANIFEST_FLUSH_RECORDS:
+        self.flush_buffer()
+
+  def flush_buffer(self):
+    if self.buffer:
+      os.write(self.fd, ''.join(json.dumps(record) + '\n' for record in self.buffer).encode('utf-8'))
+      self.buffer = list()
+
+  def close(self):
+    with self.lock:
+      self.flush_buffer()
+      os.fsync(self.fd)
+      os.close(self.fd)
+
+# Get the path of the manifest of a run started now
+def new_manifest_path(manifest_dir):
+  return os.path.join(manifest_dir, new_run_file_name(MANIFEST_FILE_PREFIX, MANIFEST_FILE_EXTENSION))
+
+# Get the paths of the manifests in a directory, from the oldest to the most recent run
+def find_manifests(manifest_dir):
+  if not os.path.isdir(manifest_dir):
+    return list()
+
+  return sorted(
+    os.path.join(manifest_dir, file_name) for file_name in os.listdir(manifest_dir)
+    if file_name.startswith(MANIFEST_FILE_PREFIX) and file_name.endswith(MANIFEST_FILE_EXTENSION)
+  )
+
+# Read the records of a manifest one at a time, ignoring a last record cut short by a crash
+def read_manifest(path):
+  with open(path) as manifest_file:
+    for line in manifest_file:
+      try:
+        yield json.loads(line)
+      except ValueError:
+        continue
+
+# Hash the data of a file packed in an archive, read straight from its offset
+def packed_file_hash(archive_path, entry):
+  digest = hashlib.blake2b()
+
+  with open(archive_path, 'rb') as archive:
+    archive.seek(entry['offset'])
+    remaining = entry['size']
+
+    while remaining:
+      chunk = archive.read(min(FULL_HASH_CHUNK_SIZE, remaining))
+      if not chunk:
+        break
+      digest.update(chunk)
+      remaining -= len(chunk)
+
+  return digest.hexdigest()
+
+# Verify a file of a manifest against the size and hash it was moved with
+# Files packed since they were moved (see packing.pack_files) are verified in their archive, whose indexes are read through read_index
+# Returns the status of the file, see STATUS_OK
+def verify_file(record, read_index = read_pack_index):
+  size, mtime, file_hash = record['size'], record['mtime'], record['blake2b']
+
+  try:
+    try:
+      stat = os.stat(record['path'])
+      if stat.st_size != size:
+        return STATUS_SIZE_MISMATCH
+      actual_mtime, actual_hash = stat.st_mtime, full_hash(record['path'], size)
+    except FileNotFoundError:
+      packed_file = find_packed_file(record['path'], read_index)
+      if packed_file is None:
+        return STATUS_MISSING
+
+      archive_path, entry = packed_file
+      if entry['size'] != size:
+        return STATUS_SIZE_MISMATCH
+      actual_mtime, actual_hash = entry['mtime'], packed_file_hash(archive_path, entry)
+  except (OSError, ValueError):
+    return STATUS_ERROR
+
+  if actual_hash != file_hash:
+    return STATUS_HASH_MISMATCH
+
+  return STATUS_OK if actual_mtime == mtime else STATUS_MTIME_CHANGED
+
+# Verify the files of a manifest on up to max_workers threads, yielding a (record, status) pair for each file, in the order of the manifest,
+# as soon as it is verified
+# The manifest is read as the files are verified, and only a few files per thread are queued, so the memory used does not depend on the size of the manifest
+def verify_manifest(manifest_path, max_workers = 8):
+  read_index = functools.lru_cache(maxsize = VERIFY_PACK_INDEX_CACHE_SIZE)(read_pack_index)
+  queue = collections.deque()
+
+  with ThreadPoolExecutor(max_workers = max(1, max_workers), thread_name_prefix = 'verify') as executor:
+    for record in read_manifest(manifest_path):
+      queue.append((record, executor.submit(verify_file, record, read_index)))
+
+      if len(queue) >= max(1, max_workers) * VERIFY_QUEUE_PER_WORKER:
+        record, future = queue.popleft()
+        yield record, future.result()
+
+    while queue:
+      record, future = queue.popleft()
+      yield record, future.result()
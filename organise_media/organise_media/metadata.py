@@ -0,0 +1,75 @@
+import contextlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Semaphores limiting the concurrent metadata calls on each configured mount point, shared by all the pools of a run,
+# so directories organised concurrently on the same share do not add up to more calls than it accepts
+MOUNT_SEMAPHORES = dict()
+MOUNT_SEMAPHORES_LOCK = threading.Lock()
+
+# Get the semaphore of a mount point, created with its limit the first time the mount point is used
+def get_mount_semaphore(mount, limit):
+  with MOUNT_SEMAPHORES_LOCK:
+    if (mount, limit) not in MOUNT_SEMAPHORES:
+      MOUNT_SEMAPHORES[(mount, limit)] = threading.BoundedSemaphore(max(1, limit))
+
+    return MOUNT_SEMAPHORES[(mount, limit)]
+
+# Runs metadata calls (stats, directory creations and listings) on pools of threads, so many of them are in flight at once
+# On network shares (e.g. SMB or NFS) each call costs a round trip, so running them one after another caps the number of files per second,
+# while a local disk answers them from its caches anyway
+# The calls on paths under one of the mount points of mount_limits are limited to its number of concurrent calls, e.g. for a share that throttles clients:
+# they get a pool of their own, no larger than the limit, so they never hold the threads of the calls on other mount points
+class MetadataPool:
+  def __init__(self, max_workers = 16, mount_limits = None):
+    self.max_workers = max(1, max_workers)
+    self.mount_limits = sorted(
+      ((os.path.normcase(os.path.abspath(mount)), max(1, limit)) for mount, limit in (mount_limits or {}).items()),
+      key = lambda mount_limit: len(mount_limit[0]),
+      reverse = True
+    )
+
+  # Get the deepest configured mount point holding a path, with its limit, or None if the path is on no configured mount point
+  def get_mount_limit(self, path):
+    path = os.path.normcase(os.path.abspath(path))
+
+    for mount, limit in self.mount_limits:
+      if path == mount or path.startswith(os.path.join(mount, '')):
+        return mount, limit
+
+    return None
+
+  # Get the semaphore limiting the calls on a path, shared with the other pools, or None if the path is on no configured mount point
+  def get_semaphore(self, path):
+    mount_limit = self.get_mount_limit(path) if self.mount_limits else None
+    return None if mount_limit is None else get_mount_semaphore(*mount_limit)
+
+  # Call a function on each item, on up to max_workers threads, and return the results in the order of the items
+  # The path of each item, given by path_of, tells which mount limit applies to its call
+  # The first error raised by a call is raised again, once all calls finished
+  def map(self, function, items, path_of = lambda item: item):
+    items = list(items)
+    groups = dict()
+    for index, item in enumerate(items):
+      groups.setdefault(self.get_mount_limit(path_of(item)) if self.mount_limits else None, list()).append(index)
+
+    def call(semaphore, item):
+      if semaphore is None:
+        return function(item)
+
+      with semaphore:
+        return function(item)
+
+    if self.max_workers == 1 or len(items) < 2:
+      return [call(self.get_semaphore(path_of(item)), item) for item in items]
+
+    futures = list()
+    with contextlib.ExitStack() as stack:
+      for mount_limit, indexes in groups.items():
+        semaphore = None if mount_limit is None else get_mount_semaphore(*mount_limit)
+        max_workers = self.max_workers if mount_limit is None else min(self.max_workers, mount_limit[1])
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers = min(max_workers, len(indexes)), thread_name_prefix = 'metadata'))
+        futures.extend((index, executor.submit(call, semaphore, items[index])) for index in indexes)
+
+    return [future.result() for index, future in sorted(futures, key = lambda indexed_future: indexed_future[0])]
@@ -0,0 +1,157 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+# Counters and timers of a run, kept for each organised directory
+# Counters:
+#  - scanned_files, planned_files, duplicates: files found, planned and detected as duplicates while planning
+#  - planned_collisions, collisions: name clashes resolved while planning, and while moving the files
+#  - moved_files, moved_bytes: files (and their bytes) moved, copied or hardlinked into their destination
+#  - renames, cross_device_copies, hardlinks: how the moved files got to their destination
+#  - links, clones, copies: how the files organised in a link mode got to their destination, keeping their source
+#  - copied_bytes: bytes copied to another filesystem, or cloned and copied in a link mode
+#  - dest_dirs: destination directories created or reused
+#  - errors: files and directories that could not be organised
+# Timers, in seconds spent by the worker threads (so parallel phases can add up to more than the run's duration):
+#  - scan, stat, dedup, dates: planning phases, i.e. listing the files, reading their stats, finding duplicates and reading their creation dates
+#  - schedule: ordering the moves of the plans, see scheduler.MOVE_ORDERS
+#  - mkdir, collisions, move, copy: execution phases, i.e. creating the destination directories, loading their names, renaming or linking the files and copying them across filesystems
+COUNTERS = [
+  'scanned_files', 'planned_files', 'duplicates', 'planned_collisions', 'collisions', 'moved_files', 'moved_bytes',
+  'renames', 'cross_device_copies', 'hardlinks', 'links', 'clones', 'copies', 'copied_bytes', 'dest_dirs', 'packed_files', 'packed_bytes', 'errors'
+]
+TIMERS = ['scan', 'stat', 'dedup', 'dates', 'schedule', 'mkdir', 'collisions', 'move', 'copy', 'manifest', 'pack']
+
+# Counters and timers of a single directory, updated by any number of threads
+class DirMetrics:
+  def __init__(self):
+    self.counters = dict.fromkeys(COUNTERS, 0)
+    self.timers = dict.fromkeys(TIMERS, 0.0)
+    self.lock = threading.Lock()
+
+  def count(self, name, amount = 1):
+    with self.lock:
+      self.counters[name] += amount
+
+  def add_time(self, phase, seconds):
+    with self.lock:
+      self.timers[phase] += seconds
+
+  # Time the code run in the context, and add its duration to a phase's timer
+  @contextlib.contextmanager
+  def timer(self, phase):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.add_time(phase, time.perf_counter() - start)
+
+  def snapshot(self):
+    with self.lock:
+      return { 'counters': dict(self.counters), 'timers': dict(self.timers) }
+
+# Metrics of a whole run, with the counters and timers of each directory and their totals
+class RunMetrics:
+  def __init__(self):
+    self.started_at = time.time()
+    self.start = time.perf_counter()
+    self.dirs = dict()
+    self.lock = threading.Lock()
+
+  # Get the metrics of a directory, creating them the first time the directory is used
+  def for_dir(self, dir):
+    with self.lock:
+      if dir not in self.dirs:
+        self.dirs[dir] = DirMetrics()
+
+      return self.dirs[dir]
+
+  def elapsed(self):
+    return time.perf_counter() - self.start
+
+  # Add up the counters and timers of every directory
+  def totals(self):
+    totals = { 'counters': dict.fromkeys(COUNTERS, 0), 'timers': dict.fromkeys(TIMERS, 0.0) }
+
+    with self.lock:
+      dir_metrics = list(self.dirs.values())
+
+    for metrics in dir_metrics:
+      snapshot = metrics.snapshot()
+
+      for kind in totals:
+        for name, value in snapshot[kind].items():
+          totals[kind][name] += value
+
+    return totals
+
+  # Build the report of the run, with the totals and the metrics of each directory, and their moved files and bytes per second
+  # The settings the run was made with, e.g. its move order, are added to the report when given, so the reports of runs with different settings can be compared
+  def report(self, settings = None):
+    seconds = self.elapsed()
+
+    with self.lock:
+      dirs = dict(self.dirs)
+
+    return {
+      'started_at': self.started_at,
+      'seconds': seconds,
+      'settings': settings or dict(),
+      'totals': with_rates(self.totals(), seconds),
+      'dirs': { dir: with_rates(metrics.snapshot(), seconds) for dir, metrics in dirs.items() }
+    }
+
+  # Format a single line with the progress of the run so far
+  def format_progress(self):
+    seconds = self.elapsed()
+    counters = self.totals()['counters']
+
+    return ''.join([
+      f'Progress: moved {str(counters["moved_files"])} of {str(counters["planned_files"])} planned files',
+      f' ({str(round(counters["moved_files"] / seconds))} files/sec, {str(round(counters["moved_bytes"] / seconds))} bytes/sec),',
+      f' {str(counters["errors"])} errors'
+    ])
+
+# Add the moved files and bytes per second to the counters and timers of a directory, or to the totals
+def with_rates(metrics, seconds):
+  return {
+    **metrics,
+    'files_per_sec': metrics['counters']['moved_files'] / seconds if seconds else None,
+    'bytes_per_sec': metrics['counters']['moved_bytes'] / seconds if seconds else None
+  }
+
+# Write the report of a run as JSON
+def write_metrics_report(metrics, path, settings = None):
+  os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+
+  # Each run writes its own report, so an existing report is never replaced
+  with open(path, 'x') as report_file:
+    json.dump(metrics.report(settings), report_file, indent = 1)
+
+# Logs the progress of a run every interval seconds, on a background thread, while it is active
+class ProgressReporter:
+  def __init__(self, metrics, interval):
+    self.metrics = metrics
+    self.interval = interval
+    self.stopped = threading.Event()
+    self.thread = None
+
+  def __enter__(self):
+    if self.interval > 0:
+      self.thread = threading.Thread(target = self.run, name = 'progress', daemon = True)
+      self.thread.start()
+
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.stopped.set()
+
+    if self.thread is not None:
+      self.thread.join()
+
+  def run(self):
+    while not self.stopped.wait(self.interval):
+      logging.info(self.metrics.format_progress())
@@ -0,0 +1,269 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from .move_plan import ACTION_HARDLINK, ACTION_LINK, ACTION_SKIP, PlannedMove
+from .packing import find_packed_file
+from .transfer import is_copy_of
+
+# Number of commit records buffered before they are written and fsynced together
+JOURNAL_FLUSH_RECORDS = 256
+
+# Number of moves whose begin records are written and fsynced together, see file_operations.execute_plan
+JOURNAL_BEGIN_RECORDS = 256
+
+JOURNAL_FILE_PREFIX = 'run_'
+JOURNAL_FILE_EXTENSION = '.jsonl'
+
+# Suffix added to the name of a journal, before its extension, once its run ended, so the journals to resume are found without reading them
+JOURNAL_ENDED_SUFFIX = '.ended'
+
+# Counter of the run files named by this process, see new_run_file_name
+RUN_FILE_COUNTER = itertools.count()
+
+# Types of the journal records:
+#  - plan: a move planned for the run, written before any file is moved
+#  - begin: a move about to be executed, with its resolved destination, written (and fsynced) before the move
+#  - commit: a move that completed
+#  - abort: a move that failed or was rolled back, and left the source file in place
+#  - end: the run finished, so the journal does not need to be resumed
+#  - undo: a committed move that was reversed by the undo command
+RECORD_PLAN = 'plan'
+RECORD_BEGIN = 'begin'
+RECORD_COMMIT = 'commit'
+RECORD_ABORT = 'abort'
+RECORD_END = 'end'
+RECORD_UNDO = 'undo'
+
+# Write-ahead journal of the moves of a run, appended to a JSON lines file
+# The plan and each batch of begin records are fsynced before the files are moved, while commit records are buffered and fsynced in groups,
+# so a crash can only lose commits, which resuming the run finds again by looking at the files
+# A journal whose end record was written is renamed when it is closed, see get_ended_journal_path
+class MoveJournal:
+  def __init__(self, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+
+    self.path = path
+    self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    self.buffer = list()
+    self.lock = threading.Lock()
+    self.ended = False
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  # Write records straight away, fsyncing them along with any buffered records
+  def write(self, records):
+    with self.lock:
+      self.buffer.extend(records)
+      self.flush_buffer()
+
+  # Buffer records, writing them once JOURNAL_FLUSH_RECORDS are buffered
+  def append(self, records):
+    with self.lock:
+      self.buffer.extend(records)
+
+      if len(self.buffer) >= JOURNAL_FLUSH_RECORDS:
+        self.flush_buffer()
+
+  def flush(self):
+    with self.lock:
+      self.flush_buffer()
+
+  def flush_buffer(self):
+    if self.buffer:
+      os.write(self.fd, ''.join(json.dumps(record) + '\n' for record in self.buffer).encode('utf-8'))
+      os.fsync(self.fd)
+      self.buffer = list()
+
+  def record_plan(self, plan):
+    self.write([{ 'type': RECORD_PLAN, **move._asdict() } for move in plan])
+
+  # Record a batch of moves about to be executed, as (planned move, resolved destination path) pairs
+  def begin(self, moves):
+    self.write([
+      { 'type': RECORD_BEGIN, 'src': move.src_file_path, 'dest': dest_file_path, 'action': move.action, 'cross_device': move.cross_device, 'original_path': original_path }
+      for move, dest_file_path, original_path in moves
+    ])
+
+  def commit(self, src_file_path, dest_file_path):
+    self.append([{ 'type': RECORD_COMMIT, 'src': src_file_path, 'dest': dest_file_path }])
+
+  def abort(self, src_file_path, dest_file_path):
+    self.append([{ 'type': RECORD_ABORT, 'src': src_file_path, 'dest': dest_file_path }])
+
+  def undo(self, src_file_path, dest_file_path):
+    self.append([{ 'type': RECORD_UNDO, 'src': src_file_path, 'dest': dest_file_path }])
+
+  def end(self):
+    self.write([{ 'type': RECORD_END, 'ended_at': time.time() }])
+    self.ended = True
+
+  def close(self):
+    with self.lock:
+      self.flush_buffer()
+      os.close(self.fd)
+
+    if self.ended:
+      self.path = mark_journal_ended(self.path)
+
+# Get the name of a new file of a run (journal, manifest or metrics report), e.g. run_20200510-120000-4242-0000.jsonl
+# The process ID and a counter follow the time, so the files of runs started in the same second, e.g. in watch mode, do not share a name
+def new_run_file_name(prefix, extension):
+  return f'{prefix}{time.strftime("%Y%m%d-%H%M%S")}-{str(os.getpid())}-{next(RUN_FILE_COUNTER):04d}{extension}'
+
+# Get the path of a new journal file in a directory
+def new_journal_path(journal_dir):
+  return os.path.join(journal_dir, new_run_file_name(JOURNAL_FILE_PREFIX, JOURNAL_FILE_EXTENSION))
+
+# Get the path a journal is renamed to once its run ended, e.g. run_20200510-120000-4242-0000.ended.jsonl
+def get_ended_journal_path(path):
+  root, extension = os.path.splitext(path)
+  return path if root.endswith(JOURNAL_ENDED_SUFFIX) else root + JOURNAL_ENDED_SUFFIX + extension
+
+# Rename a journal whose run ended, see get_ended_journal_path, unless a journal already has the ended name, which is never replaced
+# Returns the path of the journal
+def mark_journal_ended(path):
+  ended_path = get_ended_journal_path(path)
+
+  if ended_path == path:
+    return path
+
+  if os.path.lexists(ended_path):
+    logging.warning(f'Kept the journal of an ended run under its name, since another journal already exists at: {ended_path}')
+    return path
+
+  os.rename(path, ended_path)
+  return ended_path
+
+# Read a journal file, ignoring a last record cut short by a crash
+# Returns the planned moves, the last begin record of each source path, the commit records by source path (without the undone moves), and whether the run ended
+def read_journal(path):
+  plan = list()
+  begun = dict()
+  committed = dict()
+  ended = False
+
+  with open(path, encoding = 'utf-8') as journal_file:
+    for line in journal_file:
+      try:
+        record = json.loads(line)
+      except ValueError:
+        continue
+
+      record_type = record.pop('type')
+
+      if record_type == RECORD_PLAN:
+        plan.append(PlannedMove(**record))
+      elif record_type == RECORD_BEGIN:
+        begun[record['src']] = record
+      elif record_type == RECORD_COMMIT:
+        committed[record['src']] = record
+      elif record_type == RECORD_ABORT:
+        begun.pop(record['src'], None)
+      elif record_type == RECORD_END:
+        ended = True
+      elif record_type == RECORD_UNDO:
+        committed.pop(record['src'], None)
+
+  return plan, begun, committed, ended
+
+# Get the journals in a directory, from the oldest to the most recent run
+def find_journals(journal_dir):
+  if not os.path.isdir(journal_dir):
+    return list()
+
+  return sorted(
+    os.path.join(journal_dir, file_name) for file_name in os.listdir(journal_dir)
+    if file_name.startswith(JOURNAL_FILE_PREFIX) and file_name.endswith(JOURNAL_FILE_EXTENSION)
+  )
+
+# Get the journals in a directory whose run did not end, e.g. because the process was killed or a drive was disconnected
+# Only the journals that were not renamed when their run ended are read, and those found to have ended, e.g. written by an older version, are renamed
+def find_unfinished_journals(journal_dir):
+  unfinished_journals = list()
+
+  for path in find_journals(journal_dir):
+    if path == get_ended_journal_path(path):
+      continue
+
+    if read_journal(path)[3]:
+      mark_journal_ended(path)
+    else:
+      unfinished_journals.append(path)
+
+  return unfinished_journals
+
+# Find out what happened to a move that began but has no commit record, finishing or rolling it back
+# Renames and hardlinks are atomic, so the source file tells whether they happened, while a copy, e.g. across filesystems or when a rename
+# falls back to copying, only deletes its source once the copy is complete, so a destination that is not a complete copy is removed
+# Links keep their source file, so they are complete when the destination is the same file as the source, or a complete copy of it
+# A moved file may also have been packed in the archive of its directory since, see packing.pack_files
+# Returns whether the move is complete
+def recover_move(record):
+  src_exists = os.path.lexists(record['src'])
+  dest_exists = os.path.lexists(record['dest'])
+
+  if not src_exists:
+    return dest_exists or find_packed_file(record['dest']) is not None
+
+  if record['action'] == ACTION_HARDLINK:
+    if dest_exists and os.path.samefile(record['dest'], record['original_path']):
+      os.unlink(record['src'])
+      return True
+    return False
+
+  if record['action'] == ACTION_LINK:
+    if dest_exists and is_copy_of(os.stat(record['dest']), os.stat(record['src'])):
+      return True
+    if dest_exists:
+      logging.warning(f'Rolling back the interrupted copy of file: {record["src"]}\n  to: {record["dest"]}')
+      os.unlink(record['dest'])
+    return False
+
+  if dest_exists and is_copy_of(os.stat(record['dest']), os.stat(record['src'])):
+    os.unlink(record['src'])
+    return True
+  if dest_exists:
+    logging.warning(f'Rolling back the interrupted copy of file: {record["src"]}\n  to: {record["dest"]}')
+    os.unlink(record['dest'])
+
+  return False
+
+# Recover the moves of an interrupted run from its journal, recording the outcome of the moves that began but did not commit
+# Returns the planned moves that still have to be executed, and the moves that already completed, with their actual destination path
+def recover_journal(journal):
+  plan, begun, committed, ended = read_journal(journal.path)
+  completed = { src_file_path: record['dest'] for src_file_path, record in committed.items() }
+
+  for src_file_path, record in begun.items():
+    if src_file_path in committed:
+      continue
+
+    if recover_move(record):
+      journal.commit(src_file_path, record['dest'])
+      completed[src_file_path] = record['dest']
+    else:
+      journal.abort(src_file_path, record['dest'])
+
+  journal.flush()
+
+  # Hardlinks point to the planned path of their original file, which may have been renamed when it was moved
+  actual_paths = { move.dest_file_path: completed[move.src_file_path] for move in plan if move.src_file_path in completed }
+
+  remaining = list()
+  for move in plan:
+    if move.action == ACTION_SKIP or move.src_file_path in completed:
+      continue
+
+    if os.path.lexists(move.src_file_path):
+      remaining.append(move._replace(original_path = actual_paths.get(move.original_path, move.original_path)))
+    else:
+      logging.warning(f'Skipped a planned file that no longer exists: {move.src_file_path}')
+
+  return remaining, completed
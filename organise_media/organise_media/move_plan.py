@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+import shutil
+from collections import namedtuple
+
+# Actions of a planned move:
+#  - move: move the file to its destination path
+#  - hardlink: replace the file with a hardlink to its original file, at its destination path
+#  - link: keep the file where it is, and hardlink, clone or copy it to its destination path
+#  - skip: leave the file where it is
+ACTION_MOVE = 'move'
+ACTION_HARDLINK = 'hardlink'
+ACTION_LINK = 'link'
+ACTION_SKIP = 'skip'
+
+# A single file operation decided by the planning phase, with the destination name (and any name clash) already resolved
+# The size, mtime and inode are those of the source file when it was planned, and cross_device tells whether its data has to be copied
+PlannedMove = namedtuple('PlannedMove', [
+  'action',
+  'dir',
+  'src_file_path',
+  'dest_file_path',
+  'size',
+  'mtime',
+  'inode',
+  'cross_device',
+  'original_path',
+  'file_hash'
+])
+
+# Summarise a plan with the number of files per action, the number of renamed files, and the bytes involved
+def summarise_plan(plan):
+  summary = { ACTION_MOVE: 0, ACTION_HARDLINK: 0, ACTION_LINK: 0, ACTION_SKIP: 0, 'renamed': 0, 'bytes': 0, 'copied_bytes': 0 }
+
+  for move in plan:
+    summary[move.action] += 1
+
+    if move.action != ACTION_SKIP:
+      summary['bytes'] += move.size
+      summary['renamed'] += os.path.basename(move.dest_file_path) != os.path.basename(move.src_file_path)
+
+    if move.action in (ACTION_MOVE, ACTION_LINK) and move.cross_device:
+      summary['copied_bytes'] += move.size
+
+  return summary
+
+# Check that each directory's filesystem has enough free space for the files that have to be copied into it
+# Returns the list of error messages, which is empty when there is enough space everywhere
+def check_free_space(plan):
+  required_bytes = dict()
+
+  for move in plan:
+    if move.action in (ACTION_MOVE, ACTION_LINK) and move.cross_device:
+      required_bytes[move.dir] = required_bytes.get(move.dir, 0) + move.size
+
+  errors = list()
+  for dir, size in required_bytes.items():
+    free_bytes = shutil.disk_usage(dir).free
+
+    if free_bytes < size:
+      errors.append(f'Not enough free space to organise directory: {dir}\n  Required {str(size)} bytes, but only {str(free_bytes)} are free.')
+
+  return errors
+
+# Write a plan to a JSON or CSV file, according to the file extension
+def write_plan(plan, path):
+  os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+
+  with open(path, 'w', newline = '') as plan_file:
+    if os.path.splitext(path)[1].lower() == '.csv':
+      writer = csv.writer(plan_file)
+      writer.writerow(PlannedMove._fields)
+      writer.writerows(plan)
+    else:
+      json.dump({ 'summary': summarise_plan(plan), 'moves': [move._asdict() for move in plan] }, plan_file, indent = 1)
+
+# Read a plan written by write_plan
+def read_plan(path):
+  with open(path, newline = '') as plan_file:
+    if os.path.splitext(path)[1].lower() == '.csv':
+      rows = csv.DictReader(plan_file)
+      return [parse_csv_move(row) for row in rows]
+
+    return [PlannedMove(**move) for move in json.load(plan_file)['moves']]
+
+# CSV files hold every value as a string, so convert them back to the types of a planned move
+def parse_csv_move(row):
+  return PlannedMove(
+    action = row['action'],
+    dir = row['dir'],
+    src_file_path = row['src_file_path'],
+    dest_file_path = row['dest_file_path'] or None,
+    size = int(row['size']),
+    mtime = float(row['mtime']),
+    inode = int(row['inode']),
+    cross_device = row['cross_device'] == 'True',
+    original_path = row['original_path'] or None,
+    file_hash = row['file_hash'] or None
+  )
@@ -0,0 +1,92 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from .packing import read_packed_names
+from .storage import LOCAL_STORAGE
+
+# Build the name of a numbered copy of a file, with the number placed before the real extension
+# e.g. numbered_name('IMG.2020.jpg', 2) == 'IMG.2020 (2).jpg'
+def numbered_name(file_name, number):
+  stem, extension = os.path.splitext(file_name)
+  return f'{stem} ({str(number)}){extension}'
+
+# In-memory index of the file names in a destination directory, loaded once and updated as files are moved into it
+# Remembers the next number to try for each clashing name, so finding a free name does not re-check the numbers already taken
+# The names are listed through a storage backend, the local filesystem by default, see storage.LocalStorage
+# The names of the files packed in the archives of the directory are taken too, see packing.pack_files
+class NameIndex:
+  def __init__(self, dir, storage = None):
+    self.next_numbers = dict()
+    self.lock = threading.Lock()
+
+    names = (storage or LOCAL_STORAGE).list_names(dir)
+    self.names = { os.path.normcase(name) for name in itertools.chain(names, read_packed_names(dir, names)) }
+
+  # Check whether a name is taken, either by a file of the directory or by a reservation
+  def __contains__(self, file_name):
+    with self.lock:
+      return os.path.normcase(file_name) in self.names
+
+  # Reserve a free name for a file moved into the directory
+  # Returns the input name if it is free, or its next free numbered name otherwise
+  def reserve(self, file_name):
+    with self.lock:
+      if os.path.normcase(file_name) not in self.names:
+        self.names.add(os.path.normcase(file_name))
+        return file_name
+
+      number = self.next_numbers.get(file_name, 2)
+      while os.path.normcase(numbered_name(file_name, number)) in self.names:
+        number += 1
+
+      self.next_numbers[file_name] = number + 1
+      self.names.add(os.path.normcase(numbered_name(file_name, number)))
+      return numbered_name(file_name, number)
+
+  # Reserve an exact name for a file moved into the directory
+  # Returns whether the name was free
+  def claim(self, file_name):
+    with self.lock:
+      if os.path.normcase(file_name) in self.names:
+        return False
+
+      self.names.add(os.path.normcase(file_name))
+      return True
+
+  # Release a reserved name, e.g. when the file could not be moved
+  def release(self, file_name):
+    with self.lock:
+      self.names.discard(os.path.normcase(file_name))
+
+# Cache of the name indexes of every destination directory used in a run
+# When a max size is given, only the indexes of the max_size most recently used directories are kept, and the others are loaded again when
+# they are used again, which is only safe once the files whose names they reserved were moved
+class NameIndexCache:
+  def __init__(self, max_size = None, storage = None):
+    self.indexes = OrderedDict()
+    self.max_size = max_size
+    self.storage = storage
+    self.lock = threading.Lock()
+
+  # Get the name index of a directory, loading it the first time the directory is used
+  # Indexes are loaded outside the lock, so several directories can be loaded concurrently, e.g. on a network share
+  def get(self, dir):
+    key = os.path.normcase(os.path.normpath(dir))
+
+    with self.lock:
+      if key in self.indexes:
+        self.indexes.move_to_end(key)
+        return self.indexes[key]
+
+    name_index = NameIndex(dir, self.storage)
+
+    with self.lock:
+      if key not in self.indexes:
+        self.indexes[key] = name_index
+
+        if self.max_size is not None and len(self.indexes) > self.max_size:
+          self.indexes.popitem(last = False)
+
+      self.indexes.move_to_end(key)
+      return self.indexes[key]
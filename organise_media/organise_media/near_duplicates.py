@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from .file_operations import get_organised_files
+from .rules import DEFAULT_DESTINATION, as_ruleset
+
+# Pillow decodes the images and NumPy compares their hashes, both optional: see requirements/images.txt
+# Without NumPy, the hashes are compared through a BK-tree instead
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# Extensions of the image files Pillow can decode
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff', '.webp']
+
+# Side of the square the images are scaled down to before hashing, i.e. 8x8 pixels for 64-bit hashes
+HASH_SIZE = 8
+
+# Size images are decoded at, when their format can decode a scaled-down version directly (e.g. JPEG, whose decoder can skip most of the DCT work)
+DRAFT_SIZE = (HASH_SIZE * 8, HASH_SIZE * 8)
+
+# Number of images whose hashes are compared to as many other images at a time, which bounds the memory used by the vectorized comparisons,
+# i.e. a few tens of megabytes for each block of pairs
+COMPARE_ROWS = 512
+COMPARE_COLUMNS = 16384
+
+# Number of images sent to each worker process at a time
+HASH_CHUNK_SIZE = 64
+
+# Build the average hash of a grayscale image scaled down to HASH_SIZE x HASH_SIZE pixels, given as a flat sequence of pixels
+# Each bit tells whether a pixel is brighter than the average
+def average_hash(pixels):
+  average = sum(pixels) / len(pixels)
+  image_hash = 0
+
+  for pixel in pixels:
+    image_hash = (image_hash << 1) | (pixel > average)
+
+  return image_hash
+
+# Build the difference hash of a grayscale image scaled down to (HASH_SIZE + 1) x HASH_SIZE pixels, given as a flat sequence of pixels
+# Each bit tells whether a pixel is brighter than its right neighbour, i.e. follows the gradients, which survive re-encoding and resizing
+def difference_hash(pixels):
+  width = HASH_SIZE + 1
+  image_hash = 0
+
+  for row in range(HASH_SIZE):
+    for column in range(HASH_SIZE):
+      image_hash = (image_hash << 1) | (pixels[row * width + column] > pixels[row * width + column + 1])
+
+  return image_hash
+
+# Hash an image file, decoding it scaled down when its format allows it
+# Runs in the worker processes, so it only takes and returns plain values
+# Returns a (path, average hash, difference hash) tuple, with None hashes when the file cannot be decoded
+def hash_image(path):
+  from PIL import Image
+
+  try:
+    with Image.open(path) as image:
+      image.draft('L', DRAFT_SIZE)
+      image = image.convert('L')
+
+      return (
+        path,
+        average_hash(list(image.resize((HASH_SIZE, HASH_SIZE), Image.BILINEAR).tobytes())),
+        difference_hash(list(image.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR).tobytes()))
+      )
+  except Exception:
+    return path, None, None
+
+# Hash image files on a pool of up to max_workers processes, since decoding is CPU bound
+# Returns the list of paths that could be hashed, and the lists of their average and difference hashes, in the same order
+def hash_images(paths, max_workers = 4):
+  hashed_paths, average_hashes, difference_hashes = list(), list(), list()
+
+  with ProcessPoolExecutor(max_workers = max(1, max_workers)) as executor:
+    for path, image_average_hash, image_difference_hash in executor.map(hash_image, paths, chunksize = HASH_CHUNK_SIZE):
+      if image_average_hash is None:
+        logging.warning(f'Failed to decode image: {path}')
+        continue
+
+      hashed_paths.append(path)
+      average_hashes.append(image_average_hash)
+      difference_hashes.append(image_difference_hash)
+
+  return hashed_paths, average_hashes, difference_hashes
+
+# Number of bits set in each byte, to count the bits of the hashes with NumPy versions before bitwise_count
+POPCOUNT_TABLE = numpy.array([bin(byte).count('1') for byte in range(256)], dtype = numpy.uint8) if numpy is not None else None
+
+# Count the bits set in each 64-bit value of a NumPy array
+def popcount(values):
+  if hasattr(numpy, 'bitwise_count'):
+    return numpy.bitwise_count(values)
+
+  return POPCOUNT_TABLE[values.view(numpy.uint8)].reshape(values.shape + (8,)).sum(axis = -1)
+
+# Find the pairs of images whose hashes are both within a Hamming distance, comparing blocks of pairs with vectorized XORs and popcounts
+# The hashes are kept in packed uint64 arrays, so hundreds of thousands of images take a few megabytes, and only the pairs whose difference
+# hashes are near have their average hashes compared
+# Yields (index, other index) pairs, with index < other index
+def find_near_pairs_vectorized(average_hashes, difference_hashes, max_distance):
+  average_hashes = numpy.array(average_hashes, dtype = numpy.uint64)
+  difference_hashes = numpy.array(difference_hashes, dtype = numpy.uint64)
+  count = len(difference_hashes)
+
+  for row_start in range(0, count, COMPARE_ROWS):
+    rows = difference_hashes[row_start:row_start + COMPARE_ROWS]
+
+    # Each image is only compared to the images after it, so each pair is compared once
+    for column_start in range(row_start, count, COMPARE_COLUMNS):
+      columns = difference_hashes[column_start:column_start + COMPARE_COLUMNS]
+      row_indexes, column_indexes = numpy.nonzero(popcount(rows[:, None] ^ columns[None, :]) <= max_distance)
+
+      row_indexes += row_start
+      column_indexes += column_start
+      after = column_indexes > row_indexes
+      row_indexes, column_indexes = row_indexes[after], column_indexes[after]
+
+      near = popcount(average_hashes[row_indexes] ^ average_hashes[column_indexes]) <= max_distance
+      yield from zip(row_indexes[near].tolist(), column_indexes[near].tolist())
+
+# BK-tree of 64-bit hashes under the Hamming distance, whose triangle inequality lets a search skip the subtrees that are too far away
+# Each node is a [hash, index, children] list, whose children are keyed by their distance to the node
+class BKTree:
+  def __init__(self):
+    self.root = None
+
+  def add(self, image_hash, index):
+    if self.root is None:
+      self.root = [image_hash, index, dict()]
+      return
+
+    node = self.root
+    while True:
+      distance = bin(image_hash ^ node[0]).count('1')
+      if distance not in node[2]:
+        node[2][distance] = [image_hash, index, dict()]
+        return
+      node = node[2][distance]
+
+  # Get the indexes of the hashes within a Hamming distance of a hash
+  def search(self, image_hash, max_distance):
+    found = list()
+    nodes = [self.root] if self.root is not None else list()
+
+    while nodes:
+      node_hash, index, children = nodes.pop()
+      distance = bin(image_hash ^ node_hash).count('1')
+
+      if distance <= max_distance:
+        found.append(index)
+
+      for child_distance, child in children.items():
+        if distance - max_distance <= child_distance <= distance + max_distance:
+          nodes.append(child)
+
+    return found
+
+# Find the pairs of images whose hashes are both within a Hamming distance, indexing the difference hashes in a BK-tree
+# Yields (index, other index) pairs
+def find_near_pairs_with_bk_tree(average_hashes, difference_hashes, max_distance):
+  tree = BKTree()
+
+  for index, image_hash in enumerate(difference_hashes):
+    for other_index in tree.search(image_hash, max_distance):
+      if bin(average_hashes[index] ^ average_hashes[other_index]).count('1') <= max_distance:
+        yield other_index, index
+
+    tree.add(image_hash, index)
+
+# Find the pairs of near-duplicate images, with NumPy when it is installed, or with a BK-tree otherwise
+def find_near_pairs(average_hashes, difference_hashes, max_distance):
+  if numpy is not None:
+    return find_near_pairs_vectorized(average_hashes, difference_hashes, max_distance)
+
+  return find_near_pairs_with_bk_tree(average_hashes, difference_hashes, max_distance)
+
+# Group the images linked by near pairs into clusters, with a union-find
+# Returns the clusters of two or more images, as sorted lists of indexes, sorted by their first index
+def cluster_pairs(pairs, count):
+  parents = list(range(count))
+
+  def find(index):
+    while parents[index] != index:
+      parents[index] = parents[parents[index]]
+      index = parents[index]
+    return index
+
+  for index, other_index in pairs:
+    root, other_root = find(index), find(other_index)
+    if root != other_root:
+      parents[max(root, other_root)] = min(root, other_root)
+
+  clusters = dict()
+  for index in range(count):
+    clusters.setdefault(find(index), list()).append(index)
+
+  return sorted((cluster for cluster in clusters.values() if len(cluster) > 1), key = lambda cluster: cluster[0])
+
+# Find the clusters of near-duplicate images in the destination directories of the given directories, i.e. images that look the same,
+# e.g. the same photo saved again at another quality or resolution, whose average and difference hashes are within max_distance bits
+# The destination directories are those of the rules and the default destination of the configuration, see file_operations.get_organised_files
+# Returns the clusters as lists of paths
+def find_near_duplicates(dirs, max_distance = 6, max_workers = 4, rules = None, destination = DEFAULT_DESTINATION):
+  ruleset = as_ruleset(IMAGE_EXTENSIONS, rules, destination)
+  paths = list()
+
+  for dir in dirs:
+    if os.path.isdir(dir):
+      paths.extend(entry.path for entry in get_organised_files(dir, ruleset) if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS)
+
+  logging.info(f'Hashing {str(len(paths))} images...')
+  hashed_paths, average_hashes, difference_hashes = hash_images(paths, max_workers)
+
+  logging.info(f'Comparing the hashes of {str(len(hashed_paths))} images...')
+  clusters = cluster_pairs(find_near_pairs(average_hashes, difference_hashes, max_distance), len(hashed_paths))
+
+  return [[hashed_paths[index] for index in cluster] for cluster in clusters]
+
+# Write the clusters of near-duplicate images as JSON
+def write_near_duplicates(clusters, path):
+  os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+
+  with open(path, 'w') as report_file:
+    json.dump({ 'clusters': clusters }, report_file, indent = 1)
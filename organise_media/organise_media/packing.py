@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import shutil
+import stat as stat_module
+import struct
+import tarfile
+import zipfile
+from .logger_config import FILE_EVENTS_LOGGER_NAME
+
+# Archive formats the small files can be packed into, chosen with the pack_format configuration variable
+#  - tar: only ever appended to, so a crash can at worst leave an unindexed member at the end, which the next pack overwrites
+#  - zip: readable by more tools, but its central directory is read and written again at the end of the archive on every pack
+PACK_FORMATS = ['tar', 'zip']
+
+# Name of the archive of each destination directory, without its extension
+PACK_NAME = 'packed'
+
+# Suffix of the sidecar index of an archive, written next to it
+INDEX_SUFFIX = '.index'
+
+# Size of the blocks of a tar archive, which its headers and padded members fill
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+
+# Size of the fixed part of the local file header of a zip member, followed by its name, its extra field and its data
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+
+# Size of the chunks the files are copied in and out of the archives
+CHUNK_SIZE = 1024 * 1024
+
+file_events = logging.getLogger(FILE_EVENTS_LOGGER_NAME)
+
+# Get the path of the archive of a directory in a pack format
+def get_archive_path(dir, pack_format):
+  return os.path.join(dir, f'{PACK_NAME}.{pack_format}')
+
+# Get the path of the sidecar index of an archive
+def get_index_path(archive_path):
+  return archive_path + INDEX_SUFFIX
+
+# Read the sidecar index of an archive, in which each packed file is a JSON line with its member name, the offset of its data in the
+# archive, its size and its modification time, and each file taken out of the archive again is a line with its name and "deleted"
+# A line cut short by a crash is ignored, along with the member it indexed
+# Returns a dict of the entries of the files packed in the archive, by member name, and the offset where the indexed data ends
+def read_pack_index(archive_path):
+  entries = dict()
+  end = 0
+
+  try:
+    with open(get_index_path(archive_path)) as index_file:
+      for line in index_file:
+        try:
+          record = json.loads(line)
+        except ValueError:
+          continue
+
+        if record.get('deleted'):
+          entries.pop(record['name'], None)
+        else:
+          entries[record['name']] = record
+          end = max(end, record['offset'] + record['size'])
+  except FileNotFoundError:
+    pass
+
+  return entries, end
+
+# Append records to the sidecar index of an archive, flushed to disk before the packed files are deleted
+def append_pack_index(archive_path, records):
+  with open(get_index_path(archive_path), 'a') as index_file:
+    index_file.write(''.join(json.dumps(record) + '\n' for record in records))
+    index_file.flush()
+    os.fsync(index_file.fileno())
+
+# Get the names of the files packed in the archives of a directory, given the names of its entries, so the name index of the directory
+# (see name_index.NameIndex) keeps their names taken and the files moved into it later never clash with them
+def read_packed_names(dir, names):
+  packed_names = set()
+
+  for pack_format in PACK_FORMATS:
+    if os.path.basename(get_index_path(get_archive_path(dir, pack_format))) in names:
+      packed_names.update(read_pack_index(get_archive_path(dir, pack_format))[0])
+
+  return packed_names
+
+# Append files to a tar archive, right after the data of its last indexed member
+# Returns the index records of the appended files
+def append_to_tar(archive_path, paths, end):
+  records = list()
+
+  with open(archive_path, 'r+b' if os.path.exists(archive_path) else 'w+b') as archive:
+    archive.seek(-(-end // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE)
+
+    for path in paths:
+      stat = os.stat(path)
+      info = tarfile.TarInfo(os.path.basename(path))
+      info.size, info.mtime, info.mode = stat.st_size, stat.st_mtime, stat_module.S_IMODE(stat.st_mode)
+
+      archive.write(info.tobuf(tarfile.PAX_FORMAT))
+      records.append({ 'name': info.name, 'offset': archive.tell(), 'size': stat.st_size, 'mtime': stat.st_mtime })
+
+      with open(path, 'rb') as src_file:
+        shutil.copyfileobj(src_file, archive, CHUNK_SIZE)
+      archive.write(b'\0' * (-stat.st_size % TAR_BLOCK_SIZE))
+
+    # The end-of-archive marker, i.e. two empty blocks, is written again after the new members
+    archive.write(b'\0' * (2 * TAR_BLOCK_SIZE))
+    archive.truncate()
+    archive.flush()
+    os.fsync(archive.fileno())
+
+  return records
+
+# Append files to a zip archive, stored without compression so their data can be read straight from the archive
+# Returns the index records of the appended files
+def append_to_zip(archive_path, paths, end):
+  members = list()
+
+  with open(archive_path, 'r+b' if os.path.exists(archive_path) else 'w+b') as archive:
+    with zipfile.ZipFile(archive, 'a', zipfile.ZIP_STORED) as zip_file:
+      for path in paths:
+        stat = os.stat(path)
+        info = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+        info.compress_type = zipfile.ZIP_STORED
+
+        with open(path, 'rb') as src_file, zip_file.open(info, 'w') as member:
+          shutil.copyfileobj(src_file, member, CHUNK_SIZE)
+        members.append((info, stat))
+
+    # The data of each member follows its local header, whose name and extra field lengths are read back
+    records = list()
+    for info, stat in members:
+      archive.seek(info.header_offset)
+      header = ZIP_LOCAL_HEADER.unpack(archive.read(ZIP_LOCAL_HEADER.size))
+      offset = info.header_offset + ZIP_LOCAL_HEADER.size + header[-2] + header[-1]
+      records.append({ 'name': info.filename, 'offset': offset, 'size': stat.st_size, 'mtime': stat.st_mtime })
+
+    archive.flush()
+    os.fsync(archive.fileno())
+
+  return records
+
+# Pack files of a directory into its archive, by appending them to it and to its sidecar index, and then deleting them
+# The files are only deleted once the archive and the index are flushed to disk, so a crash leaves them where they were
+# Files whose name is already packed are left where they are
+# Returns the paths of the packed files
+def pack_files(dir, paths, pack_format = 'tar'):
+  archive_path = get_archive_path(dir, pack_format)
+  entries, end = read_pack_index(archive_path)
+  paths_to_pack = list()
+
+  for path in paths:
+    if os.path.basename(path) in entries:
+      file_events.warning(f'File already packed in archive: {archive_path}\n  Left unpacked: {path}')
+    else:
+      paths_to_pack.append(path)
+
+  if not paths_to_pack:
+    return list()
+
+  records = (append_to_tar if pack_format == 'tar' else append_to_zip)(archive_path, paths_to_pack, end)
+  append_pack_index(archive_path, records)
+
+  for path in paths_to_pack:
+    os.unlink(path)
+    file_events.info(f'Packed file: {path}\n  into: {archive_path}')
+
+  return paths_to_pack
+
+# Find the archive a file of a directory was packed into, reading the indexes of the archives through read_index, e.g. to cache them
+# Returns the path of the archive and the index entry of the file, or None when the file is not packed
+def find_packed_file(file_path, read_index = read_pack_index):
+  dir, file_name = os.path.split(file_path)
+
+  for pack_format in PACK_FORMATS:
+    archive_path = get_archive_path(dir, pack_format)
+    entry = read_index(archive_path)[0].get(file_name)
+
+    if entry is not None:
+      return archive_path, entry
+
+  return None
+
+# Copy a packed file out of its archive, reading its data straight from its offset, with its modification time
+def extract_entry(archive_path, entry, dest_file_path):
+  with open(archive_path, 'rb') as archive, open(dest_file_path, 'xb') as dest_file:
+    archive.seek(entry['offset'])
+    remaining = entry['size']
+
+    while remaining:
+      chunk = archive.read(min(CHUNK_SIZE, remaining))
+      if not chunk:
+        raise OSError(f'The archive ends before the end of the packed file: {entry["name"]}')
+      dest_file.write(chunk)
+      remaining -= len(chunk)
+
+  os.utime(dest_file_path, (entry['mtime'], entry['mtime']))
+
+# Take a packed file out of its archive into a path, e.g. to undo its move, marking it as deleted in the index of the archive
+# The archive and its index are removed once they hold no file anymore
+# Returns whether the file was packed
+def unpack_file(file_path, dest_file_path):
+  packed_file = find_packed_file(file_path)
+  if packed_file is None:
+    return False
+
+  archive_path, entry = packed_file
+  extract_entry(archive_path, entry, dest_file_path)
+  append_pack_index(archive_path, [{ 'name': entry['name'], 'deleted': True }])
+
+  if not read_pack_index(archive_path)[0]:
+    os.unlink(archive_path)
+    os.unlink(get_index_path(archive_path))
+
+  return True
+
+# List the files packed in an archive, from its sidecar index, without reading the archive
+# Returns the index entries, sorted by name
+def list_packed_files(archive_path):
+  return sorted(read_pack_index(archive_path)[0].values(), key = lambda entry: entry['name'])
+
+# Extract the files packed in an archive into a directory, all of them or only those with the given names
+# The files are left in the archive, and files that already exist in the directory are not replaced
+# Returns the number of files extracted
+def extract_packed_files(archive_path, dest_dir, names = None):
+  entries = read_pack_index(archive_path)[0]
+  os.makedirs(dest_dir, exist_ok = True)
+  file_count = 0
+
+  for name in names or sorted(entries):
+    if name not in entries:
+      logging.warning(f'File not found in archive: {name}')
+      continue
+
+    try:
+      extract_entry(archive_path, entries[name], os.path.join(dest_dir, name))
+      file_count += 1
+    except FileExistsError:
+      logging.warning(f'File already exists, not extracted: {os.path.join(dest_dir, name)}')
+
+  return file_count
@@ -0,0 +1,99 @@
+import queue
+import threading
+
+# Number of items passed between the stages of a pipeline at a time, and number of chunks a stage can get ahead of the next one
+PIPELINE_CHUNK_SIZE = 256
+PIPELINE_QUEUE_CHUNKS = 4
+
+# Seconds between checks of whether the pipeline was stopped, while a stage waits for the next one
+PIPELINE_POLL_SECONDS = 0.1
+
+END_OF_STREAM = object()
+
+# Pipeline of threads connected by bounded queues, each stage iterating over the items of the previous one
+# A stage blocks once its queue is full, so a fast stage (e.g. the scan) never gets more than a few chunks ahead of a slow one (e.g. the moves),
+# and the memory used only depends on the chunk size and the number of stages
+# Leaving the pipeline stops all stages, e.g. when the consumer of the last stage fails
+class Pipeline:
+  def __init__(self, chunk_size = PIPELINE_CHUNK_SIZE, queue_chunks = PIPELINE_QUEUE_CHUNKS):
+    self.chunk_size = chunk_size
+    self.queue_chunks = queue_chunks
+    self.stop_event = threading.Event()
+    self.stages = list()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.stop_event.set()
+
+    for stage in self.stages:
+      stage.join()
+
+  # Start a stage producing the items of an iterable, e.g. a generator consuming the items of a previous stage
+  def stage(self, name, items):
+    stage = PipelineStage(name, items, self)
+    self.stages.append(stage)
+    stage.start()
+
+    return stage
+
+# Thread of a pipeline stage, putting the items of an iterable into a bounded queue in chunks
+# Iterating over the stage, from another thread, yields its items, and raises the error that stopped the stage, if any
+class PipelineStage(threading.Thread):
+  def __init__(self, name, items, pipeline):
+    super().__init__(name = name, daemon = True)
+    self.items = items
+    self.pipeline = pipeline
+    self.queue = queue.Queue(pipeline.queue_chunks)
+    self.error = None
+
+  def run(self):
+    chunk = list()
+
+    try:
+      for item in self.items:
+        chunk.append(item)
+
+        if len(chunk) == self.pipeline.chunk_size:
+          if not self.put(chunk):
+            return
+          chunk = list()
+
+      if chunk:
+        self.put(chunk)
+    except BaseException as e:
+      self.error = e
+    finally:
+      self.put(END_OF_STREAM)
+
+  # Put a chunk in the queue, waiting for room unless the pipeline is stopped
+  # Returns whether the chunk was put
+  def put(self, chunk):
+    while not self.pipeline.stop_event.is_set():
+      try:
+        self.queue.put(chunk, timeout = PIPELINE_POLL_SECONDS)
+        return True
+      except queue.Full:
+        pass
+
+    return False
+
+  # Iterate over the chunks of items of the stage, until it ends or the pipeline is stopped
+  def chunks(self):
+    while not self.pipeline.stop_event.is_set():
+      try:
+        chunk = self.queue.get(timeout = PIPELINE_POLL_SECONDS)
+      except queue.Empty:
+        continue
+
+      if chunk is END_OF_STREAM:
+        if self.error is not None:
+          raise self.error
+        return
+
+      yield chunk
+
+  def __iter__(self):
+    for chunk in self.chunks():
+      yield from chunk
@@ -0,0 +1,115 @@
+import fnmatch
+import os
+import re
+from collections import namedtuple
+from types import MappingProxyType
+from .destinations import get_destination_template
+
+# Default destination of the organised files, relative to the organised directory, e.g. '2019/11_November'
+DEFAULT_DESTINATION = '{year}/{month:02}_{month_name}'
+
+# Keys of a rule declared in the rules configuration variable, and their types
+RULE_KEY_TYPES = {
+  'extensions': list,
+  'patterns': list,
+  'regex': str,
+  'min_size': int,
+  'max_size': int,
+  'destination': str
+}
+
+# A compiled rule, matching the files whose name and size meet all of its conditions
+#  - extensions: frozenset of lowercase extensions, or None to match any extension
+#  - pattern: compiled regex the whole file name must match, or None
+#  - min_size, max_size: bounds of the file size in bytes, or None
+#  - destination: compiled template of the sub-directory the matching files are organised into (see destinations.DestinationTemplate)
+Rule = namedtuple('Rule', ['extensions', 'pattern', 'min_size', 'max_size', 'destination'])
+
+# Immutable set of rules compiled from the configuration, matched against each directory entry
+# The rules are indexed by extension once, so matching a file is a single dict lookup followed by the few rules that can apply to its extension
+# The distinct destination templates of the rules are kept too, to find the directories the files were organised into
+class Ruleset:
+  __slots__ = ('rules', 'rules_by_extension', 'any_extension_rules', 'destinations')
+
+  def __init__(self, rules):
+    any_extension_rules = tuple(rule for rule in rules if rule.extensions is None)
+    extensions = { extension for rule in rules if rule.extensions is not None for extension in rule.extensions }
+
+    object.__setattr__(self, 'rules', tuple(rules))
+    object.__setattr__(self, 'any_extension_rules', any_extension_rules)
+    object.__setattr__(self, 'destinations', tuple(dict.fromkeys(rule.destination for rule in rules)))
+    object.__setattr__(self, 'rules_by_extension', MappingProxyType({
+      extension: tuple(rule for rule in rules if rule.extensions is None or extension in rule.extensions)
+      for extension in extensions
+    }))
+
+  def __setattr__(self, name, value):
+    raise AttributeError('Rulesets are immutable')
+
+  # Get the first rule matching a file name, calling get_size only when a rule has size conditions
+  # Returns None if no rule matches
+  def match(self, file_name, get_size = None):
+    for rule in self.rules_by_extension.get(os.path.splitext(file_name)[1].lower(), self.any_extension_rules):
+      if rule.pattern is not None and rule.pattern.fullmatch(file_name) is None:
+        continue
+
+      if rule.min_size is not None or rule.max_size is not None:
+        size = get_size()
+        if (rule.min_size is not None and size < rule.min_size) or (rule.max_size is not None and size > rule.max_size):
+          continue
+
+      return rule
+
+    return None
+
+  # Get the first rule matching a directory entry, using its cached stat info for the size conditions
+  def match_entry(self, entry):
+    return self.match(entry.name, lambda: entry.stat().st_size)
+
+# Compile a single rule declared in the configuration, whose destination defaults to the given default destination
+# The destination templates are looked up in, and added to, the given dict of compiled templates
+# Raises ValueError (or re.error, for an invalid regex) if the rule is not valid
+def compile_rule(rule, default_destination = DEFAULT_DESTINATION, templates = None):
+  if not isinstance(rule, dict):
+    raise ValueError('each rule must be a mapping')
+
+  for key, value in rule.items():
+    if key not in RULE_KEY_TYPES:
+      raise ValueError(f'unknown rule key {key}')
+    if not isinstance(value, RULE_KEY_TYPES[key]) or (RULE_KEY_TYPES[key] is int and isinstance(value, bool)):
+      raise ValueError(f'the rule key {key} must be of type {RULE_KEY_TYPES[key].__name__}')
+    if RULE_KEY_TYPES[key] is list and not all(isinstance(item, str) for item in value):
+      raise ValueError(f'the rule key {key} must be a list of str')
+
+  destination = get_destination_template(rule.get('destination', default_destination), dict() if templates is None else templates)
+
+  patterns = [fnmatch.translate(pattern) for pattern in rule.get('patterns', list())]
+  if 'regex' in rule:
+    patterns.append(f'(?:{rule["regex"]})')
+
+  return Rule(
+    extensions = frozenset(extension.lower() for extension in rule['extensions']) if 'extensions' in rule else None,
+    pattern = re.compile('|'.join(patterns), re.IGNORECASE) if patterns else None,
+    min_size = rule.get('min_size'),
+    max_size = rule.get('max_size'),
+    destination = destination
+  )
+
+# Compile the rules and the media extensions of the configuration into a ruleset
+# The media extensions make up the last rule, matched case-insensitively and organised into the default destination, so the more specific rules come first
+def compile_ruleset(media_extensions, rules = None, default_destination = DEFAULT_DESTINATION):
+  templates = dict()
+  compiled_rules = [compile_rule(rule, default_destination, templates) for rule in rules or list()]
+
+  if media_extensions:
+    destination = get_destination_template(default_destination, templates)
+    compiled_rules.append(Rule(frozenset(extension.lower() for extension in media_extensions), None, None, None, destination))
+
+  return Ruleset(compiled_rules)
+
+# Get the ruleset of a list of media extensions, or the ruleset itself if it is already compiled
+def as_ruleset(media_types, rules = None, default_destination = DEFAULT_DESTINATION):
+  if isinstance(media_types, Ruleset):
+    return media_types
+
+  return compile_ruleset(media_types, rules, default_destination)
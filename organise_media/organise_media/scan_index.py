@@ -0,0 +1,152 @@
+import os
+import sqlite3
+import threading
+import time
+
+RELATIVE_SCAN_INDEX_FILE_PATH = "../scan_index.sqlite3"
+
+# Status of the files recorded in the index:
+#  - organised: the file is in a year/month sub-directory, at the recorded path
+#  - skipped: the file is a duplicate that was left at the recorded path
+STATUS_ORGANISED = 'organised'
+STATUS_SKIPPED = 'skipped'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+  path TEXT PRIMARY KEY,
+  source_path TEXT,
+  dir TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  mtime REAL NOT NULL,
+  inode INTEGER,
+  hash TEXT,
+  status TEXT NOT NULL,
+  updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_by_dir ON files (dir, status);
+CREATE TABLE IF NOT EXISTS indexed_dirs (
+  dir TEXT PRIMARY KEY,
+  indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS capture_dates (
+  inode INTEGER NOT NULL,
+  size INTEGER NOT NULL,
+  mtime REAL NOT NULL,
+  capture_date REAL,
+  PRIMARY KEY (inode, size, mtime)
+);
+'''
+
+# A known hash is only kept when a file is recorded again with the same size and mtime
+UPSERT_FILE = '''
+INSERT INTO files (path, source_path, dir, size, mtime, inode, hash, status, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (path) DO UPDATE SET
+  source_path = excluded.source_path,
+  dir = excluded.dir,
+  size = excluded.size,
+  mtime = excluded.mtime,
+  inode = excluded.inode,
+  hash = CASE
+    WHEN files.size = excluded.size AND files.mtime = excluded.mtime THEN COALESCE(excluded.hash, files.hash)
+    ELSE excluded.hash
+  END,
+  status = excluded.status,
+  updated_at = excluded.updated_at
+'''
+
+# Get the default path of the scan index file, in the root directory of the project
+def default_scan_index_path():
+  return os.path.join(os.path.dirname(__file__), RELATIVE_SCAN_INDEX_FILE_PATH)
+
+# Persistent SQLite index of the files processed in previous runs, keyed by their absolute path
+# Lets later runs skip files that did not change, and look up the contents of the year/month sub-directories without walking them
+# A single connection is shared by all the worker threads, and guarded by a lock
+class ScanIndex:
+  def __init__(self, path = None):
+    path = path or default_scan_index_path()
+
+    if path != ':memory:':
+      os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+
+    self.connection = sqlite3.connect(path, check_same_thread = False)
+    self.connection.executescript(SCHEMA)
+    self.lock = threading.Lock()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def close(self):
+    with self.lock:
+      self.connection.close()
+
+  # Whether the year/month sub-directories of a directory were already walked and recorded in the index
+  def is_dir_indexed(self, dir):
+    with self.lock:
+      row = self.connection.execute('SELECT 1 FROM indexed_dirs WHERE dir = ?', (os.path.abspath(dir),)).fetchone()
+
+    return row is not None
+
+  def mark_dir_indexed(self, dir):
+    with self.lock, self.connection:
+      self.connection.execute('INSERT OR REPLACE INTO indexed_dirs (dir, indexed_at) VALUES (?, ?)', (os.path.abspath(dir), time.time()))
+
+  # Get the files recorded for a directory with the given status
+  # Returns a dict mapping each absolute path to its (size, mtime, inode, hash) tuple
+  def get_files(self, dir, status):
+    with self.lock:
+      rows = self.connection.execute(
+        'SELECT path, size, mtime, inode, hash FROM files WHERE dir = ? AND status = ?',
+        (os.path.abspath(dir), status)
+      ).fetchall()
+
+    return { path: (size, mtime, inode, file_hash) for path, size, mtime, inode, file_hash in rows }
+
+  # Record a batch of files in a single transaction
+  # Each file is a (path, source path, size, mtime, inode, hash) tuple
+  def record_files(self, dir, status, files):
+    now = time.time()
+    dir_key = os.path.abspath(dir)
+    rows = [
+      (os.path.abspath(path), source_path and os.path.abspath(source_path), dir_key, size, mtime, inode, file_hash, status, now)
+      for path, source_path, size, mtime, inode, file_hash in files
+    ]
+
+    with self.lock, self.connection:
+      self.connection.executemany(UPSERT_FILE, rows)
+
+  # Record the hashes computed for files already in the index, as long as their size and mtime did not change
+  # Each hash is a (path, size, mtime, hash) tuple
+  def record_hashes(self, hashes):
+    rows = [(file_hash, os.path.abspath(path), size, mtime) for path, size, mtime, file_hash in hashes]
+
+    with self.lock, self.connection:
+      self.connection.executemany('UPDATE files SET hash = ? WHERE path = ? AND size = ? AND mtime = ?', rows)
+
+  # Remove a batch of files from the index, e.g. when the moves that organised them are undone
+  def forget_files(self, paths):
+    with self.lock, self.connection:
+      self.connection.executemany('DELETE FROM files WHERE path = ?', [(os.path.abspath(path),) for path in paths])
+
+  # Get the capture dates recorded for a batch of (inode, size, mtime) keys
+  # Returns a dict mapping the keys found to their capture dates, which are None for files without a capture date
+  def get_capture_dates(self, keys):
+    found = dict()
+
+    with self.lock:
+      for key in keys:
+        row = self.connection.execute('SELECT capture_date FROM capture_dates WHERE inode = ? AND size = ? AND mtime = ?', key).fetchone()
+        if row is not None:
+          found[key] = row[0]
+
+    return found
+
+  # Record the capture dates of a batch of files, given as a dict mapping (inode, size, mtime) keys to capture dates
+  def record_capture_dates(self, dates):
+    rows = [(inode, size, mtime, date) for (inode, size, mtime), date in dates.items()]
+
+    with self.lock, self.connection:
+      self.connection.executemany('INSERT OR REPLACE INTO capture_dates (inode, size, mtime, capture_date) VALUES (?, ?, ?, ?)', rows)
\ No newline at end of file
@@ -0,0 +1,81 @@
+import os
+import struct
+from .move_plan import ACTION_HARDLINK
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+# ioctl request of the FIEMAP interface, mapping the logical extents of a file to their physical location on disk, see filesystems/fiemap.rst
+FS_IOC_FIEMAP = 0xC020660B
+
+# struct fiemap header (start, length, flags, mapped extents, extent count, reserved) and struct fiemap_extent, of which only the first is requested
+FIEMAP_HEADER = struct.Struct('=QQIIII')
+FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')
+
+# Move orders, each a function taking the moves of a plan and returning them in the order to execute them, see MOVE_ORDERS
+def order_as_planned(moves):
+  return list(moves)
+
+def order_by_destination(moves):
+  return sorted(moves, key = lambda move: os.path.dirname(move.dest_file_path))
+
+def order_by_inode(moves):
+  return sorted(moves, key = lambda move: move.inode)
+
+def order_by_physical_offset(moves):
+  keys = dict()
+
+  for move in moves:
+    offset = read_physical_offset(move.src_file_path)
+    keys[move.src_file_path] = (0, offset) if offset is not None else (1, move.inode)
+
+  return sorted(moves, key = lambda move: keys[move.src_file_path])
+
+# Move orders that can be chosen with the move_order configuration variable:
+#  - plan: the order of the plan, i.e. the order the files were found in
+#  - destination: grouped by destination directory, so each directory is created, loaded and written to in one go
+#  - inode: by source inode number, which on most filesystems roughly follows where the files were written on disk
+#  - physical: by the physical offset of the first extent of each source file, read with FIEMAP, or by inode for files without one
+# The orders by inode and physical offset keep the disk heads moving forward through the source data, which mostly matters for the
+# copies across filesystems on spinning disks, at the cost of going back and forth between the destination directories
+# Other orders can be added here, or passed as functions to schedule_moves
+MOVE_ORDERS = {
+  'plan': order_as_planned,
+  'destination': order_by_destination,
+  'inode': order_by_inode,
+  'physical': order_by_physical_offset
+}
+
+# Read the physical offset, in bytes, of the first extent of a file
+# Returns None when it cannot be read, e.g. for empty or inline files, or on platforms and filesystems without FIEMAP
+def read_physical_offset(path):
+  if fcntl is None:
+    return None
+
+  request = bytearray(FIEMAP_HEADER.size + FIEMAP_EXTENT.size)
+  FIEMAP_HEADER.pack_into(request, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+
+  try:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+      fcntl.ioctl(fd, FS_IOC_FIEMAP, request, True)
+    finally:
+      os.close(fd)
+  except (OSError, TypeError, ValueError):
+    return None
+
+  mapped_extents = FIEMAP_HEADER.unpack_from(request, 0)[3]
+  if mapped_extents == 0:
+    return None
+
+  return FIEMAP_EXTENT.unpack_from(request, FIEMAP_HEADER.size)[1]
+
+# Schedule the moves of a plan in a move order, given by its name or as a function
+# Hardlinks to the original files always come last, once the original files they point to were moved
+def schedule_moves(moves, order = 'destination'):
+  order = MOVE_ORDERS[order] if isinstance(order, str) else order
+  moves = list(moves)
+
+  return order([move for move in moves if move.action != ACTION_HARDLINK]) + order([move for move in moves if move.action == ACTION_HARDLINK])
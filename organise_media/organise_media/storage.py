@@ -0,0 +1,323 @@
+import errno
+import itertools
+import os
+import stat as stat_module
+import threading
+import time
+from collections import Counter, namedtuple
+from .metadata import MetadataPool
+from .transfer import copy_file
+
+# Storage backends that can be chosen with the storage configuration variable, see get_storage
+STORAGE_BACKENDS = ['local', 'object_store']
+
+# Number of paths sent in each batched call of the object store, like the batch limits of the object store APIs, e.g. 1000 keys per request
+OBJECT_STORE_BATCH_SIZE = 1000
+
+# Stat result of the backends that do not stat files through os.stat, with the fields read by file_operations
+StorageStat = namedtuple('StorageStat', ['st_mode', 'st_ino', 'st_dev', 'st_size', 'st_mtime'])
+
+# Directory entry of a backend, with the stat caching interface of os.DirEntry
+# The stat of a file is known as soon as its entry is listed, since the listings of these backends return it along with the names
+class StorageEntry:
+  __slots__ = ('path', 'name', 'cached_stat')
+
+  def __init__(self, path, stat):
+    self.path = path
+    self.name = os.path.basename(path)
+    self.cached_stat = stat
+
+  def stat(self):
+    return self.cached_stat
+
+  def is_file(self):
+    return stat_module.S_ISREG(self.cached_stat.st_mode)
+
+  def is_dir(self, follow_symlinks = True):
+    return stat_module.S_ISDIR(self.cached_stat.st_mode)
+
+# Storage backend of the local filesystem, calling the os module directly
+# The batched calls run on a metadata pool (see metadata.MetadataPool), so on a network share their round trips overlap instead of adding up
+# Copies can be queued in a transfer engine (see transfer.TransferEngine), since the files are local paths
+class LocalStorage:
+  queues_copies = True
+
+  def __init__(self, metadata_workers = 16, mount_concurrency = None):
+    self.metadata_pool = MetadataPool(metadata_workers, mount_concurrency)
+
+  # Call a function on each path on the metadata pool, and return the results in the order of the paths
+  def map(self, function, paths):
+    return self.metadata_pool.map(function, paths)
+
+  def is_dir(self, path):
+    return os.path.isdir(path)
+
+  # List the entries of a directory lazily, as os.DirEntry objects whose stat is cached once it is read, see stat_entries,
+  # so a scan never holds the whole listing of a large directory in memory
+  def list_dir(self, path):
+    with os.scandir(path) as entries:
+      yield from entries
+
+  # List the names of the entries of a directory, or an empty list when it does not exist
+  def list_names(self, path):
+    if not os.path.isdir(path):
+      return list()
+
+    with os.scandir(path) as entries:
+      return [entry.name for entry in entries]
+
+  def stat(self, path):
+    return os.stat(path)
+
+  # Stat a list of paths, returning None for the paths that do not exist
+  def stat_many(self, paths):
+    def stat_or_none(path):
+      try:
+        return os.stat(path)
+      except FileNotFoundError:
+        return None
+
+    return self.map(stat_or_none, paths)
+
+  # Read and cache the stats of listed entries, so the later phases do not stat the files again
+  def stat_entries(self, entries):
+    self.metadata_pool.map(lambda entry: entry.stat(), entries, lambda entry: entry.path)
+
+  def make_dirs(self, paths):
+    self.map(lambda path: os.makedirs(path, exist_ok = True), paths)
+
+  def rename(self, src_path, dest_path):
+    os.rename(src_path, dest_path)
+
+  def link(self, src_path, dest_path):
+    os.link(src_path, dest_path)
+
+  # Copy a file with its timestamps, cloning it when asked and supported, see transfer.copy_file
+  # Returns whether the file was cloned
+  def copy(self, src_path, dest_path, clone = False):
+    return copy_file(src_path, dest_path, clone = clone)
+
+  def delete(self, path):
+    os.unlink(path)
+
+# Stand-in for an object store (e.g. S3), backed by a local directory, which charges a simulated latency for each call it makes,
+# to measure the round trips and tune the concurrency of a run without real hardware
+# Like an object store:
+#  - listings return the stat of each file, so the files are not stat-ed again
+#  - stats and directory creations are sent in batches of OBJECT_STORE_BATCH_SIZE paths, each batch costing one call
+#  - renames are a copy and a delete, i.e. two calls, and hardlinks are not supported
+#  - copies happen on the store, without downloading the files, so they cost one call whatever their size
+# The calls made are counted by kind in calls
+class ObjectStoreStorage(LocalStorage):
+  queues_copies = False
+
+  def __init__(self, latency = 0.02, metadata_workers = 16, mount_concurrency = None):
+    super().__init__(metadata_workers, mount_concurrency)
+    self.latency = latency
+    self.calls = Counter()
+    self.lock = threading.Lock()
+
+  # Charge the latency of a call
+  def call(self, kind):
+    with self.lock:
+      self.calls[kind] += 1
+    time.sleep(self.latency)
+
+  # Charge one call per batch of paths, with the batches sent concurrently on the metadata pool, and return the results in the order of the paths
+  def call_batched(self, kind, function, paths):
+    paths = list(paths)
+    batches = [paths[start:start + OBJECT_STORE_BATCH_SIZE] for start in range(0, len(paths), OBJECT_STORE_BATCH_SIZE)]
+
+    def call_batch(batch):
+      self.call(kind)
+      return [function(path) for path in batch]
+
+    return list(itertools.chain.from_iterable(self.metadata_pool.map(call_batch, batches, lambda batch: batch[0])))
+
+  def is_dir(self, path):
+    self.call('stat')
+    return os.path.isdir(path)
+
+  # List the entries of a directory lazily, like the pages of an object store listing
+  def list_dir(self, path):
+    self.call('list')
+    with os.scandir(path) as entries:
+      for entry in entries:
+        yield StorageEntry(entry.path, entry.stat(follow_symlinks = False))
+
+  def list_names(self, path):
+    self.call('list')
+    return super().list_names(path)
+
+  def stat(self, path):
+    self.call('stat')
+    return os.stat(path)
+
+  def stat_many(self, paths):
+    def stat_or_none(path):
+      try:
+        return os.stat(path)
+      except FileNotFoundError:
+        return None
+
+    return self.call_batched('stat', stat_or_none, paths)
+
+  def stat_entries(self, entries):
+    pass
+
+  def make_dirs(self, paths):
+    self.call_batched('make_dirs', lambda path: os.makedirs(path, exist_ok = True), paths)
+
+  def rename(self, src_path, dest_path):
+    self.copy(src_path, dest_path)
+    self.delete(src_path)
+
+  def link(self, src_path, dest_path):
+    raise OSError(errno.EOPNOTSUPP, 'Hardlinks are not supported by object stores', src_path)
+
+  def copy(self, src_path, dest_path, clone = False):
+    self.call('copy')
+    copy_file(src_path, dest_path)
+    return False
+
+  def delete(self, path):
+    self.call('delete')
+    os.unlink(path)
+
+# Storage backend keeping the files in memory, e.g. to test or benchmark the planning and name clash handling without touching a disk
+# Files are created with write_file, and hold their contents and modification time, which copies keep like copy_file does
+# Hardlinks share the same file record, so they have the same inode number
+# Only the calls of this interface see the files: the file contents read by other phases, e.g. the capture dates and the hashes of the
+# duplicates, are read from the local filesystem, so these phases should be turned off (date_source: mtime, duplicates: keep)
+class MemoryStorage:
+  queues_copies = False
+
+  # Device number of all files, which are all on the same "filesystem"
+  DEVICE = 1
+
+  def __init__(self):
+    self.files = dict()
+    self.dirs = set()
+    self.inodes = itertools.count(1)
+    self.lock = threading.Lock()
+
+  # Normalise a path into the key of a file or directory
+  def key(self, path):
+    return os.path.normcase(os.path.normpath(os.path.abspath(path)))
+
+  # Create a file, and its parent directories, with the given contents and modification time
+  def write_file(self, path, contents = b'', mtime = None):
+    with self.lock:
+      self.add_dirs(os.path.dirname(self.key(path)))
+      self.files[self.key(path)] = [bytes(contents), time.time() if mtime is None else mtime, next(self.inodes)]
+
+  def read_file(self, path):
+    with self.lock:
+      return self.get_file(path)[0]
+
+  # Get the record of a file, raising the same errors as the os module when it does not exist
+  def get_file(self, path):
+    if self.key(path) not in self.files:
+      raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+    return self.files[self.key(path)]
+
+  # Add a directory and its parents, without locking
+  def add_dirs(self, key):
+    while key not in self.dirs:
+      self.dirs.add(key)
+      key, parent = os.path.dirname(key), key
+      if key == parent:
+        break
+
+  # Create a file record under a path, failing when the path is taken or its directory does not exist, without locking
+  def add_file(self, path, record):
+    if self.key(path) in self.files or self.key(path) in self.dirs:
+      raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+    if os.path.dirname(self.key(path)) not in self.dirs:
+      raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+    self.files[self.key(path)] = record
+
+  def map(self, function, paths):
+    return [function(path) for path in paths]
+
+  def is_dir(self, path):
+    with self.lock:
+      return self.key(path) in self.dirs
+
+  def list_dir(self, path):
+    with self.lock:
+      if self.key(path) not in self.dirs:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+      return [
+        StorageEntry(os.path.join(path, os.path.basename(key)), self.stat_key(key))
+        for key in itertools.chain(self.dirs, self.files) if os.path.dirname(key) == self.key(path) and key != self.key(path)
+      ]
+
+  def list_names(self, path):
+    return [entry.name for entry in self.list_dir(path)] if self.is_dir(path) else list()
+
+  # Stat a file or directory from its key, without locking
+  def stat_key(self, key):
+    if key in self.dirs:
+      return StorageStat(stat_module.S_IFDIR | 0o755, 0, self.DEVICE, 0, 0)
+
+    contents, mtime, inode = self.files[key]
+    return StorageStat(stat_module.S_IFREG | 0o644, inode, self.DEVICE, len(contents), mtime)
+
+  def stat(self, path):
+    with self.lock:
+      if self.key(path) not in self.dirs:
+        self.get_file(path)
+      return self.stat_key(self.key(path))
+
+  def stat_many(self, paths):
+    with self.lock:
+      return [self.stat_key(self.key(path)) if self.key(path) in self.files or self.key(path) in self.dirs else None for path in paths]
+
+  def stat_entries(self, entries):
+    pass
+
+  def make_dirs(self, paths):
+    with self.lock:
+      for path in paths:
+        if self.key(path) in self.files:
+          raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), path)
+        self.add_dirs(self.key(path))
+
+  # Rename a file, replacing the destination file if there is one, like os.rename
+  def rename(self, src_path, dest_path):
+    with self.lock:
+      record = self.get_file(src_path)
+      if os.path.dirname(self.key(dest_path)) not in self.dirs:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), dest_path)
+
+      del self.files[self.key(src_path)]
+      self.files[self.key(dest_path)] = record
+
+  def link(self, src_path, dest_path):
+    with self.lock:
+      self.add_file(dest_path, self.get_file(src_path))
+
+  def copy(self, src_path, dest_path, clone = False):
+    with self.lock:
+      contents, mtime, inode = self.get_file(src_path)
+      self.add_file(dest_path, [contents, mtime, next(self.inodes)])
+    return False
+
+  def delete(self, path):
+    with self.lock:
+      self.get_file(path)
+      del self.files[self.key(path)]
+
+# Backend of the local filesystem used when no other backend is given
+LOCAL_STORAGE = LocalStorage()
+
+# Build the storage backend chosen by the options, see STORAGE_BACKENDS
+#  - local: the local filesystem, including network shares mounted on it
+#  - object_store: the local filesystem through the object store stand-in, charging storage_latency_ms milliseconds for each call
+def get_storage(options):
+  if options.get('storage', 'local') == 'object_store':
+    return ObjectStoreStorage(options.get('storage_latency_ms', 20) / 1000, options.get('metadata_workers', 16), options.get('mount_concurrency'))
+
+  return LocalStorage(options.get('metadata_workers', 16), options.get('mount_concurrency'))
@@ -0,0 +1,229 @@
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .logger_config import FILE_EVENTS_LOGGER_NAME
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# ioctl request cloning a whole file, which shares its data blocks on copy-on-write filesystems (e.g. Btrfs or XFS) instead of copying them
+FICLONE = 0x40049409
+
+# Errors raised by FICLONE when the filesystem cannot clone a pair of files, e.g. across filesystems or on a filesystem without copy-on-write
+CLONE_UNSUPPORTED_ERRNOS = { errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTTY, errno.ENOSYS, errno.EBADF, errno.EPERM }
+
+# Errors raised by the zero-copy system calls when the kernel or filesystem does not support them for a pair of files
+ZERO_COPY_UNSUPPORTED_ERRNOS = { errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTSOCK }
+
+file_events = logging.getLogger(FILE_EVENTS_LOGGER_NAME)
+
+# Copy a chunk with copy_file_range, which lets the kernel (or the filesystem) copy the data without a user space buffer
+def copy_file_range_chunk(src_fd, dest_fd, offset, count):
+  return os.copy_file_range(src_fd, dest_fd, count, offset, offset)
+
+# Copy a chunk with sendfile, which avoids the user space buffer but writes at the destination's current position
+def sendfile_chunk(src_fd, dest_fd, offset, count):
+  os.lseek(dest_fd, offset, os.SEEK_SET)
+  return os.sendfile(dest_fd, src_fd, offset, count)
+
+ZERO_COPY_CHUNK_FUNCTIONS = [copy_file_range_chunk, sendfile_chunk]
+
+# Copy the contents of a file descriptor to another, trying the zero-copy paths first and falling back to a buffered copy
+# Returns the number of bytes copied
+def copy_file_contents(src_fd, dest_fd, size):
+  offset = 0
+
+  for copy_chunk in ZERO_COPY_CHUNK_FUNCTIONS:
+    try:
+      while offset < size:
+        copied = copy_chunk(src_fd, dest_fd, offset, min(CHUNK_SIZE, size - offset))
+        if copied == 0:
+          break
+        offset += copied
+
+      if offset >= size:
+        return offset
+    except AttributeError:
+      continue
+    except OSError as e:
+      if e.errno not in ZERO_COPY_UNSUPPORTED_ERRNOS:
+        raise
+
+  os.lseek(src_fd, offset, os.SEEK_SET)
+  os.lseek(dest_fd, offset, os.SEEK_SET)
+
+  while True:
+    chunk = os.read(src_fd, CHUNK_SIZE)
+    if not chunk:
+      return offset
+
+    view = memoryview(chunk)
+    while view:
+      written = os.write(dest_fd, view)
+      view = view[written:]
+      offset += written
+
+# Copy the contents of a file descriptor to another through a buffer, adding each chunk to a digest (e.g. hashlib.blake2b) on the way,
+# so hashing a copied file does not read it a second time, at the cost of the zero-copy paths
+# Returns the number of bytes copied
+def copy_hashed_file_contents(src_fd, dest_fd, digest):
+  offset = 0
+
+  while True:
+    chunk = os.read(src_fd, CHUNK_SIZE)
+    if not chunk:
+      return offset
+
+    digest.update(chunk)
+    view = memoryview(chunk)
+    while view:
+      written = os.write(dest_fd, view)
+      view = view[written:]
+      offset += written
+
+# Clone the contents of a file descriptor into another with FICLONE
+# Returns whether the file was cloned, which is false when the platform or the filesystem does not support it
+def clone_file_contents(src_fd, dest_fd):
+  if fcntl is None:
+    return False
+
+  try:
+    fcntl.ioctl(dest_fd, FICLONE, src_fd)
+  except OSError as e:
+    if e.errno not in CLONE_UNSUPPORTED_ERRNOS:
+      raise
+    return False
+
+  return True
+
+# Copy a file with its timestamps, cloning it instead when clone is true and the filesystem supports it
+# The copy is flushed to disk and its size checked against the source, otherwise the partial copy is removed
+# A destination that was already reserved (created empty) by the caller is truncated instead of failing because it exists
+# When a digest is given, the copied contents are added to it, unless the file was cloned, see copy_file_contents
+# Returns whether the file was cloned
+def copy_file(src_file_path, dest_file_path, reserved = False, clone = False, digest = None):
+  dest_file = open(dest_file_path, 'wb' if reserved else 'xb')
+
+  try:
+    with open(src_file_path, 'rb') as src_file, dest_file:
+      src_size = os.fstat(src_file.fileno()).st_size
+      cloned = clone and clone_file_contents(src_file.fileno(), dest_file.fileno())
+      if cloned:
+        copied = src_size
+      elif digest is not None:
+        copied = copy_hashed_file_contents(src_file.fileno(), dest_file.fileno(), digest)
+      else:
+        copied = copy_file_contents(src_file.fileno(), dest_file.fileno(), src_size)
+      os.fsync(dest_file.fileno())
+
+      if copied != src_size or os.fstat(dest_file.fileno()).st_size != src_size:
+        raise OSError(errno.EIO, f'Copied {str(copied)} of {str(src_size)} bytes', src_file_path)
+
+    shutil.copystat(src_file_path, dest_file_path)
+  except BaseException:
+    try:
+      os.unlink(dest_file_path)
+    except OSError:
+      pass
+    raise
+
+  return cloned
+
+# Move a file to another filesystem by copying its contents and timestamps, see copy_file
+# The source is only deleted once the copy is complete
+def move_across_devices(src_file_path, dest_file_path, reserved = False, digest = None):
+  copy_file(src_file_path, dest_file_path, reserved, digest = digest)
+  os.unlink(src_file_path)
+
+# Check whether a file is a link, clone or complete copy of another, from their stats: the same file, or a file with the same size and modification time,
+# which copy_file only sets once the copy is complete
+def is_copy_of(dest_stat, src_stat):
+  if (dest_stat.st_dev, dest_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino):
+    return True
+
+  return (dest_stat.st_size, dest_stat.st_mtime) == (src_stat.st_size, src_stat.st_mtime)
+
+# Pipelines cross-device moves on a bounded pool of threads, so reading some files overlaps with writing others
+# Destination file names are reserved synchronously on submit, so later moves to the same directory see them as taken
+# With hash_copies, the BLAKE2b hash of each file copied (but not cloned) is computed while it is copied, and kept in digests by source path
+class TransferEngine:
+  def __init__(self, max_workers = 4, journal = None, hash_copies = False):
+    self.max_workers = max(1, max_workers)
+    self.journal = journal
+    self.hash_copies = hash_copies
+    self.digests = dict()
+    self.executor = None
+    self.slots = threading.BoundedSemaphore(self.max_workers * 2)
+    self.lock = threading.Lock()
+    self.failures = list()
+    self.copy_seconds = dict()
+    self.cloned = set()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.wait()
+
+  # Queue a file to be moved, blocking while the number of queued transfers is at its limit
+  # With keep_source, the file is cloned or copied instead, and the source is kept
+  def submit(self, src_file_path, dest_file_path, keep_source = False):
+    open(dest_file_path, 'xb').close()
+
+    if self.executor is None:
+      self.executor = ThreadPoolExecutor(max_workers = self.max_workers, thread_name_prefix = 'transfer')
+
+    self.slots.acquire()
+    try:
+      future = self.executor.submit(self.transfer, src_file_path, dest_file_path, keep_source)
+    except BaseException:
+      self.slots.release()
+      os.unlink(dest_file_path)
+      raise
+
+    future.add_done_callback(lambda future: self.slots.release())
+
+  # Move (or clone or copy) a file, recording the time its copy took, or the error that stopped it
+  def transfer(self, src_file_path, dest_file_path, keep_source = False):
+    start = time.perf_counter()
+    digest = hashlib.blake2b() if self.hash_copies else None
+
+    try:
+      if keep_source:
+        cloned = copy_file(src_file_path, dest_file_path, reserved = True, clone = True, digest = digest)
+      else:
+        cloned = False
+        move_across_devices(src_file_path, dest_file_path, reserved = True, digest = digest)
+
+      with self.lock:
+        self.copy_seconds[src_file_path] = time.perf_counter() - start
+        if cloned:
+          self.cloned.add(src_file_path)
+        elif digest is not None:
+          self.digests[src_file_path] = digest.hexdigest()
+      if self.journal is not None:
+        self.journal.commit(src_file_path, dest_file_path)
+    except Exception as e:
+      file_events.error(f'Failed to {"copy" if keep_source else "move"} file: {src_file_path}\n  to: {dest_file_path}', exc_info=True)
+      with self.lock:
+        self.failures.append((src_file_path, e))
+      if self.journal is not None:
+        self.journal.abort(src_file_path, dest_file_path)
+
+  # Wait for all queued transfers to finish
+  # Returns the list of (source path, exception) pairs of the transfers that failed
+  def wait(self):
+    if self.executor is not None:
+      self.executor.shutdown(wait = True)
+      self.executor = None
+
+    return self.failures
@@ -0,0 +1,125 @@
+import errno
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .configuration_reader import apply_config_defaults
+from .file_operations import reserve_dest_file_name
+from .logger_config import FILE_EVENTS_LOGGER_NAME
+from .move_journal import MoveJournal, read_journal
+from .move_plan import ACTION_HARDLINK, ACTION_LINK
+from .name_index import NameIndex
+from .packing import unpack_file
+from .transfer import move_across_devices
+
+file_events = logging.getLogger(FILE_EVENTS_LOGGER_NAME)
+
+# Get the moves of a run that can be undone, i.e. the moves it committed that were not undone yet
+# Returns a list of (source path, destination path, action) tuples
+def get_moves_to_undo(journal_path):
+  plan, begun, committed, ended = read_journal(journal_path)
+
+  return [
+    (src_file_path, record['dest'], begun.get(src_file_path, {}).get('action'))
+    for src_file_path, record in committed.items()
+  ]
+
+# Undo the moves of a run recorded in its journal, moving each file back to its source directory under its original name
+# The moves are grouped by source directory, and up to max_workers directories are restored concurrently
+# Every undone move is recorded in the journal, so an interrupted undo can simply be run again
+# The destination (and duplicates) directories left empty are removed, and the undone files are removed from the scan index, when one is given
+# Returns the number of files restored, and the number of files that could not be restored
+def undo_run(journal_path, options = None, scan_index = None):
+  options = apply_config_defaults(options)
+  moves_by_dir = dict()
+
+  for move in get_moves_to_undo(journal_path):
+    moves_by_dir.setdefault(os.path.dirname(move[0]), list()).append(move)
+
+  with MoveJournal(journal_path) as journal:
+    with ThreadPoolExecutor(max_workers = max(1, options['max_workers']), thread_name_prefix = 'undo') as executor:
+      results = list(executor.map(lambda dir_moves: undo_dir_moves(*dir_moves, journal), moves_by_dir.items()))
+
+  restored_moves = [move for restored, failed_count in results for move in restored]
+  remove_empty_dirs((src_file_path, dest_file_path) for src_file_path, dest_file_path, action in restored_moves)
+
+  if scan_index is not None:
+    scan_index.forget_files([dest_file_path for src_file_path, dest_file_path, action in restored_moves])
+
+  return len(restored_moves), sum(failed_count for restored, failed_count in results)
+
+# Move the files of a single source directory back into it
+# Returns the moves that were undone, and the number of files that could not be restored
+def undo_dir_moves(src_dir, moves, journal):
+  restored = list()
+  failed_count = 0
+
+  os.makedirs(src_dir, exist_ok = True)
+  name_index = NameIndex(src_dir)
+
+  for move in moves:
+    try:
+      restore_file(*move, name_index)
+      journal.undo(move[0], move[1])
+      restored.append(move)
+    except Exception:
+      file_events.error(f'Failed to restore file: {move[1]}\n  to: {move[0]}', exc_info=True)
+      failed_count += 1
+
+  logging.info(f'Restored {str(len(restored))} files in: {src_dir}')
+  return restored, failed_count
+
+# Move a file back to its source path, or to the next free numbered name if another file took its original name in the meantime
+# Hardlinks are copied back, so the restored file no longer shares its contents with the original file it was linked to
+# Files organised in a link mode were kept in their source directory, so only their link is removed, unless the source file was removed since
+# Files packed into the archive of their destination directory since they were moved are taken out of it, see packing.unpack_file
+def restore_file(src_file_path, dest_file_path, action, name_index):
+  if action == ACTION_LINK and os.path.lexists(src_file_path):
+    os.unlink(dest_file_path)
+    return
+
+  src_dir, src_file_name = os.path.split(src_file_path)
+  file_name = reserve_dest_file_name(name_index, src_file_name, src_file_name)
+  restored_file_path = os.path.join(src_dir, file_name)
+
+  if file_name != src_file_name:
+    file_events.warning(f'Original filename taken in directory: {src_dir}\n  Restored a file as: {file_name}')
+
+  try:
+    if not os.path.lexists(dest_file_path) and unpack_file(dest_file_path, restored_file_path):
+      return
+
+    if action == ACTION_HARDLINK:
+      move_across_devices(dest_file_path, restored_file_path)
+      return
+
+    try:
+      os.rename(dest_file_path, restored_file_path)
+    except OSError as e:
+      if e.errno != errno.EXDEV:
+        raise
+
+      move_across_devices(dest_file_path, restored_file_path)
+  except BaseException:
+    name_index.release(file_name)
+    raise
+
+# Remove the destination directories of the restored moves that were left empty, e.g. the month and duplicates directories, and then their
+# parent directories that were left empty, e.g. the year directories, whatever the destination template, up to the organised directory,
+# i.e. the deepest directory holding both the source and the destination of a move
+def remove_empty_dirs(moves):
+  dirs = set()
+
+  for src_file_path, dest_file_path in moves:
+    organised_dir = os.path.commonpath([os.path.dirname(src_file_path), os.path.dirname(dest_file_path)])
+    dir = os.path.dirname(dest_file_path)
+
+    while dir != organised_dir and dir.startswith(organised_dir):
+      dirs.add(dir)
+      dir = os.path.dirname(dir)
+
+  # The deepest directories are removed first, so their parents can be empty by the time they are removed
+  for dir in sorted(dirs, key = lambda dir: dir.count(os.sep), reverse = True):
+    try:
+      os.rmdir(dir)
+    except OSError:
+      pass
@@ -1,34 +1,239 @@
+import contextlib
+import importlib.util
 import logging
 import os
+import signal
 import sys
-from .configuration_reader import read_config_file
-from .file_operations import organise_media
-from .logger_config import config_logger
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .configuration_reader import apply_config_defaults, read_config_file
+from .file_operations import execute_plan, plan_media, stream_media
+from .logger_config import apply_logging_options, config_logger
+from .manifest import RunManifest, new_manifest_path
+from .metrics import ProgressReporter, RunMetrics, write_metrics_report
+from .move_journal import MoveJournal, find_journals, find_unfinished_journals, new_journal_path, new_run_file_name, recover_journal
+from .move_plan import check_free_space, read_plan, summarise_plan, write_plan
+from .rules import as_ruleset
+from .scan_index import ScanIndex
 
 RELATIVE_CONFIG_FILE_PATH = "../config.yaml"
 
+# Configuration variables recorded in the metrics reports, so the reports of runs with different settings can be compared
+METRICS_SETTINGS = ['move_order', 'organise_mode', 'streaming', 'max_workers', 'transfer_workers', 'storage', 'storage_latency_ms', 'pack_threshold', 'pack_format']
+
 # Main script logic
 def run():
   config = init()
+  handle_unfinished_runs(config)
 
   target_dirs = config['folders_to_organise']
   media_types = config['media_extensions']
+  recursive = config['recursive']
 
   # Confirmation prompt
   logging.info(''.join([
     'Will organise all files with extension:\n- ',
     '\n- '.join(media_types),
+    f'\nand the files matching the {str(len(config["rules"]))} configured rules' if config['rules'] else '',
     '\n\nin the following folders:\n- ',
     '\n- '.join(target_dirs),
-    '\n\nby creation_date in "year/month/" directories.'
+    f'\n\nby creation_date in "{config["destination"]}" directories.',
+    '\nSub-directories will also be scanned.' if recursive else '',
+    f'\n\nDry run: the planned moves will be written to {get_plan_file_path(config)} and no file will be moved.' if config['dry_run'] else ''
   ]))
   answer = input('\nType [yes] to continue, or something else to abort\n\n>> ')
 
-  handle_prompt_answer(answer, target_dirs, media_types)
+  scan_index = ScanIndex() if config['scan_index'] else None
+  try:
+    handle_prompt_answer(answer, target_dirs, config['ruleset'], config, scan_index)
+  finally:
+    if scan_index is not None:
+      scan_index.close()
+
+  input('\nPress any key to exit...')
+  logging.info('Done!')
+
+# Execute the moves planned by a previous dry run
+def run_plan(plan_file_path = None):
+  config = init()
+  plan_file_path = plan_file_path or get_plan_file_path(config)
+
+  try:
+    plan = read_plan(plan_file_path)
+  except (OSError, ValueError, KeyError, TypeError) as e:
+    terminate_with_error(f'Failed to read the plan file: {plan_file_path}\n  {e}')
+
+  # Confirmation prompt
+  logging.info(f'Will execute the plan in: {plan_file_path}\n{format_plan_summary(plan)}')
+  answer = input('\nType [yes] to continue, or something else to abort\n\n>> ')
+  print('')
+
+  if answer.lower() in ["yes"]:
+    scan_index = ScanIndex() if config['scan_index'] else None
+    metrics = RunMetrics()
+    try:
+      with ProgressReporter(metrics, config['progress_interval']):
+        log_summary(execute_journaled_plans(group_plan_by_dir(plan), config, scan_index, metrics), metrics)
+      write_run_metrics(metrics, config)
+    finally:
+      if scan_index is not None:
+        scan_index.close()
+  else:
+    logging.info('Script aborted.')
+
+  input('\nPress any key to exit...')
+  logging.info('Done!')
+
+# Undo the moves of a run, read from the journal given as argument or from the journal of the most recent run
+def run_undo(journal_path = None):
+  # Imported when needed, like the watcher, to keep the start of the other commands fast
+  from .undo import get_moves_to_undo, undo_run
+
+  config = init()
+  journal_dir = get_journal_dir(config)
+  journal_paths = find_journals(journal_dir) if journal_dir is not None else list()
+
+  if journal_path is None and not journal_paths:
+    terminate_with_error('No run journal was found to undo. Script aborted.')
+  journal_path = journal_path or journal_paths[-1]
+
+  try:
+    move_count = len(get_moves_to_undo(journal_path))
+  except (OSError, ValueError, KeyError, TypeError) as e:
+    terminate_with_error(f'Failed to read the run journal: {journal_path}\n  {e}')
+
+  # Confirmation prompt
+  logging.info(f'Will move {str(move_count)} files back to where they were before the run recorded in: {journal_path}')
+  answer = input('\nType [yes] to continue, or something else to abort\n\n>> ')
+  print('')
+
+  if answer.lower() in ["yes"]:
+    scan_index = ScanIndex() if config['scan_index'] else None
+    try:
+      restored_count, failed_count = undo_run(journal_path, config, scan_index)
+      logging.info(f'Summary: restored {str(restored_count)} files ({str(failed_count)} failed).')
+    finally:
+      if scan_index is not None:
+        scan_index.close()
+  else:
+    logging.info('Script aborted.')
+
+  input('\nPress any key to exit...')
+  logging.info('Done!')
+
+# Find the near-duplicate images in the destination directories of the configured directories, and write their clusters to the near_duplicates_file
+# Nothing is moved or deleted, so the clusters can be reviewed before removing any image
+def run_near_duplicates():
+  # Imported when needed, like the watcher, to keep the start of the other commands fast
+  from .near_duplicates import find_near_duplicates, write_near_duplicates
+
+  config = init()
+
+  if importlib.util.find_spec('PIL') is None:
+    terminate_with_error('Finding near-duplicate images needs Pillow, install it with: pip install -r requirements/images.txt. Script aborted.')
+
+  clusters = find_near_duplicates(config['folders_to_organise'], config['near_duplicate_distance'], config['near_duplicate_workers'], config['rules'], config['destination'])
+
+  near_duplicates_file_path = get_near_duplicates_file_path(config)
+  write_near_duplicates(clusters, near_duplicates_file_path)
+  logging.info(f'Found {str(len(clusters))} groups of near-duplicate images ({str(sum(len(cluster) for cluster in clusters))} images), written to: {near_duplicates_file_path}')
 
   input('\nPress any key to exit...')
   logging.info('Done!')
 
+# Watch the configured directories, organising the media files as they arrive, until the script is interrupted or terminated
+# Interrupted runs are resumed and all directories are organised once first, so the files added while the script was not running are not missed
+def run_watch():
+  from .watcher import MediaWatcher
+
+  config = init()
+
+  if config['dry_run']:
+    terminate_with_error('The watch mode cannot be used with dry_run. Script aborted.')
+
+  journal_dir = get_journal_dir(config)
+  for journal_path in find_unfinished_journals(journal_dir) if journal_dir is not None else list():
+    logging.info(f'Found an interrupted run, recorded in: {journal_path}')
+    resume_run('yes', journal_path, config)
+
+  stop_event = threading.Event()
+  signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+  scan_index = ScanIndex() if config['scan_index'] else None
+  metrics = RunMetrics()
+  try:
+    # The directories are watched before they are organised, so the files arriving in the meantime are caught by either
+    with MediaWatcher(
+      config['folders_to_organise'], config['ruleset'],
+      lambda dir, paths: organise_new_files(dir, paths, config['ruleset'], config, scan_index, metrics),
+      config['recursive'], config['watch_quiet_period'], config['watch_batch_size']
+    ) as watcher:
+      handle_prompt_answer('yes', config['folders_to_organise'], config['ruleset'], config, scan_index)
+
+      logging.info(f'Watching {str(len(config["folders_to_organise"]))} directories for new files. Press Ctrl+C to stop.')
+      with ProgressReporter(metrics, config['progress_interval']):
+        watcher.run(stop_event)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    if scan_index is not None:
+      scan_index.close()
+
+  print('')
+  logging.info('Stopped watching.')
+  write_run_metrics(metrics, config)
+  logging.info('Done!')
+
+# Organise a batch of new files reported by the watch mode, recording their moves in a new journal
+def organise_new_files(dir, paths, media_types, options = None, scan_index = None, metrics = None):
+  plan = plan_media(dir, media_types, options, scan_index, metrics, paths)
+
+  if plan:
+    log_summary(execute_journaled_plans([(dir, plan)], options, scan_index, metrics))
+
+# Get the path of the plan file written by a dry run, relative to the root directory of the project unless it is absolute
+def get_plan_file_path(options):
+  return os.path.join(os.path.dirname(__file__), '..', options['plan_file'])
+
+# Get the path of the file the near-duplicate images are written to, relative to the root directory of the project unless it is absolute
+def get_near_duplicates_file_path(options):
+  return os.path.join(os.path.dirname(__file__), '..', options['near_duplicates_file'])
+
+# Get the path of the directory holding the move journals, or None if the journal is disabled
+def get_journal_dir(options):
+  if not options['journal_dir']:
+    return None
+
+  return os.path.normpath(os.path.join(os.path.dirname(__file__), '..', options['journal_dir']))
+
+# Get the path of the directory holding the manifests of the moved files
+def get_manifest_dir(options):
+  return os.path.normpath(os.path.join(os.path.dirname(__file__), '..', options['manifest_dir']))
+
+# Open the manifest of a run started now, in the configured manifest directory, or a null context if manifests are disabled
+def open_run_manifest(options):
+  if not options['manifest']:
+    return contextlib.nullcontext()
+
+  manifest_path = new_manifest_path(get_manifest_dir(options))
+  logging.info(f'Recording the moved files in the manifest: {manifest_path}')
+  return RunManifest(manifest_path)
+
+# Get the path of the metrics report of a run started now, in the configured metrics directory, or None if reports are disabled
+def get_metrics_file_path(options):
+  if not options['metrics_dir']:
+    return None
+
+  return os.path.normpath(os.path.join(os.path.dirname(__file__), '..', options['metrics_dir'], new_run_file_name('run_', '.json')))
+
+# Write the metrics report of a run, if reports are enabled
+def write_run_metrics(metrics, options):
+  metrics_file_path = get_metrics_file_path(options)
+
+  if metrics_file_path is not None:
+    write_metrics_report(metrics, metrics_file_path, { name: options.get(name) for name in METRICS_SETTINGS })
+    logging.info(f'Wrote the run metrics to: {metrics_file_path}')
+
 # Initial operations
 def init():
   print('')
@@ -41,6 +246,7 @@ def init():
   if not valid:
     terminate_with_error(error_msg)
 
+  apply_logging_options(config)
   return config
 
 # Log a fatal error and exit the script
@@ -51,17 +257,198 @@ def terminate_with_error(error_str):
   sys.exit()
 
 # Handles confirmation prompt answer by the user by either organising the media files in the input directories in different folders, or aborting the script
-def handle_prompt_answer(answer, dirs, media_types):
+# All directories are planned first, and then the plans are either written to the plan file (on a dry run) or executed
+# With the streaming option, and unless duplicates are looked for or on a dry run, the directories are organised as they are scanned instead
+# Independent directories are planned and organised concurrently by a pool of up to max_workers threads
+# The options are the optional configuration variables, see configuration_reader.OPTIONAL_CONFIG_DEFAULTS
+# The counters and timers of the run are added to the given run metrics, and written to a report in the configured metrics directory
+def handle_prompt_answer(answer, dirs, media_types, options = None, scan_index = None, metrics = None):
+  options = apply_config_defaults(options)
+  media_types = as_ruleset(media_types, options['rules'], options['destination'])
+  metrics = metrics or RunMetrics()
   print('')
 
   if answer.lower() in ["yes"]:
-    for dir in dirs:
-      try:
-        organise_media(dir, media_types)
-      except Exception as e:
-        logging.error(e, exc_info=True)
+    with ProgressReporter(metrics, options['progress_interval']):
+      if options['streaming'] and options['duplicates'] == 'keep' and not options['dry_run']:
+        log_summary(stream_dirs(dirs, media_types, options, scan_index, metrics), metrics)
+      else:
+        with ThreadPoolExecutor(max_workers = max(1, options['max_workers']), thread_name_prefix = 'organise') as executor:
+          plans = list(executor.map(lambda dir: plan_dir(dir, media_types, options, scan_index, metrics), dirs))
+
+        if options['dry_run']:
+          write_dry_run_plan([move for dir, plan in plans for move in plan], get_plan_file_path(options))
+        else:
+          log_summary(execute_journaled_plans(plans, options, scan_index, metrics), metrics)
 
-      print('')
+    write_run_metrics(metrics, options)
+    print('')
 
   else:
-    logging.info('Script aborted.')
\ No newline at end of file
+    logging.info('Script aborted.')
+
+# Look for runs that were interrupted, e.g. because the process was killed or a drive was disconnected, and ask whether to resume each of them
+def handle_unfinished_runs(options):
+  journal_dir = get_journal_dir(options)
+  if journal_dir is None:
+    return
+
+  for journal_path in find_unfinished_journals(journal_dir):
+    logging.info(f'Found an interrupted run, recorded in: {journal_path}')
+    answer = input('\nType [yes] to resume it, or something else to only finish or roll back the moves it was executing\n\n>> ')
+
+    scan_index = ScanIndex() if options['scan_index'] else None
+    try:
+      resume_run(answer, journal_path, options, scan_index)
+    finally:
+      if scan_index is not None:
+        scan_index.close()
+
+# Resume an interrupted run from its journal, without scanning its directories again
+# The moves the run was executing are finished or rolled back first, and the moves left are only executed if the answer is yes
+# Either way, the journal is then marked as ended
+def resume_run(answer, journal_path, options = None, scan_index = None, metrics = None):
+  options = apply_config_defaults(options)
+  metrics = metrics or RunMetrics()
+  print('')
+
+  with MoveJournal(journal_path) as journal:
+    remaining, completed = recover_journal(journal)
+
+    if answer.lower() in ["yes"]:
+      logging.info(f'Resuming the interrupted run: {str(len(completed))} files were already moved, and {str(len(remaining))} are left.')
+
+      with ProgressReporter(metrics, options['progress_interval']), open_run_manifest(options) as manifest:
+        log_summary(execute_plans(group_plan_by_dir(remaining), options, scan_index, metrics, journal, manifest), metrics)
+
+      write_run_metrics(metrics, options)
+    else:
+      logging.info(f'The interrupted run was not resumed, and its {str(len(remaining))} files left were not moved.')
+
+    journal.end()
+
+  print('')
+
+# Execute the plans of several directories, recording them in a new move journal first, unless the journal is disabled
+# The moved files are recorded in a new manifest, when manifests are enabled
+# Returns the results of execute_plans
+def execute_journaled_plans(plans, options = None, scan_index = None, metrics = None):
+  options = apply_config_defaults(options)
+  journal_dir = get_journal_dir(options)
+
+  with open_run_manifest(options) as manifest:
+    if journal_dir is None:
+      return execute_plans(plans, options, scan_index, metrics, manifest = manifest)
+
+    with MoveJournal(new_journal_path(journal_dir)) as journal:
+      journal.record_plan([move for dir, plan in plans for move in plan])
+      results = execute_plans(plans, options, scan_index, metrics, journal, manifest)
+      journal.end()
+
+  return results
+
+# Organise several directories concurrently with the streaming pipeline (see file_operations.stream_media), recording their moves in a new move journal, unless the journal is disabled
+# The moved files are recorded in a new manifest, when manifests are enabled
+# Returns the number of files moved, and the error raised while organising each directory (if any), like execute_plans
+def stream_dirs(dirs, media_types, options = None, scan_index = None, metrics = None):
+  options = apply_config_defaults(options)
+  journal_dir = get_journal_dir(options)
+
+  with MoveJournal(new_journal_path(journal_dir)) if journal_dir is not None else contextlib.nullcontext() as journal, open_run_manifest(options) as manifest:
+    with ThreadPoolExecutor(max_workers = max(1, options['max_workers']), thread_name_prefix = 'organise') as executor:
+      results = list(executor.map(lambda dir: stream_dir(dir, media_types, options, scan_index, metrics, journal, manifest), dirs))
+
+    if journal is not None:
+      journal.end()
+
+  return results
+
+# Organise a single directory with the streaming pipeline, reporting any error instead of letting it stop the other workers
+def stream_dir(dir, media_types, options = None, scan_index = None, metrics = None, journal = None, manifest = None):
+  try:
+    return stream_media(dir, media_types, options, scan_index, metrics, journal, manifest = manifest), None
+  except Exception as e:
+    if metrics is not None:
+      metrics.for_dir(dir).count('errors')
+    logging.error(f'Failed to organise directory: {dir}', exc_info=True)
+    return 0, e
+
+# Plan a single directory, reporting any error instead of letting it stop the other workers
+# Returns the directory and its plan, which is empty if the directory could not be planned
+def plan_dir(dir, media_types, options = None, scan_index = None, metrics = None):
+  try:
+    return dir, plan_media(dir, media_types, options, scan_index, metrics)
+  except Exception:
+    if metrics is not None:
+      metrics.for_dir(dir).count('errors')
+    logging.error(f'Failed to plan directory: {dir}', exc_info=True)
+    return dir, list()
+
+# Execute the plans of several directories concurrently, after checking each directory has enough free space
+# Returns the number of files moved, and the error raised while organising each directory (if any)
+def execute_plans(plans, options = None, scan_index = None, metrics = None, journal = None, manifest = None):
+  options = apply_config_defaults(options)
+
+  with ThreadPoolExecutor(max_workers = max(1, options['max_workers']), thread_name_prefix = 'organise') as executor:
+    return list(executor.map(lambda dir_plan: execute_dir_plan(*dir_plan, options, scan_index, metrics, journal, manifest), plans))
+
+# Execute the plan of a single directory, reporting any error instead of letting it stop the other workers
+def execute_dir_plan(dir, plan, options = None, scan_index = None, metrics = None, journal = None, manifest = None):
+  try:
+    free_space_errors = check_free_space(plan)
+    if free_space_errors:
+      raise OSError('\n'.join(free_space_errors))
+
+    file_count = execute_plan(plan, options, scan_index, metrics, journal, manifest = manifest)
+    logging.info(f'Finished moving {str(file_count)} files in: {dir}!')
+    return file_count, None
+  except Exception as e:
+    if metrics is not None:
+      metrics.for_dir(dir).count('errors')
+    logging.error(f'Failed to organise directory: {dir}', exc_info=True)
+    return 0, e
+
+# Group the moves of a plan by the directory they organise, keeping the order of the directories
+def group_plan_by_dir(plan):
+  plans = dict()
+
+  for move in plan:
+    plans.setdefault(move.dir, list()).append(move)
+
+  return list(plans.items())
+
+# Write the combined plan of a dry run, and log its summary
+def write_dry_run_plan(plan, plan_file_path):
+  write_plan(plan, plan_file_path)
+  logging.info(f'Dry run: wrote the plan to: {plan_file_path}\n{format_plan_summary(plan)}')
+
+# Format the summary of a plan to be logged
+def format_plan_summary(plan):
+  summary = summarise_plan(plan)
+
+  return ''.join([
+    f'- {str(summary["move"])} files to move ({str(summary["renamed"])} renamed to avoid name clashes)\n',
+    f'- {str(summary["link"])} files to link, clone or copy, keeping the originals\n',
+    f'- {str(summary["hardlink"])} duplicated files to hardlink\n',
+    f'- {str(summary["skip"])} duplicated files to skip\n',
+    f'- {str(summary["bytes"])} bytes involved, of which {str(summary["copied_bytes"])} are copied across filesystems'
+  ])
+
+# Log a combined summary of the work done by every worker, and of the run metrics when they are given
+def log_summary(results, metrics = None):
+  file_count = sum(count for count, error in results)
+  failed_count = sum(1 for count, error in results if error is not None)
+
+  logging.info(f'Summary: moved {str(file_count)} files in {str(len(results))} directories ({str(failed_count)} failed).')
+
+  if metrics is not None:
+    totals = metrics.totals()
+    counters = totals['counters']
+
+    logging.info(''.join([
+      f'Moved {str(counters["moved_bytes"])} bytes in {metrics.elapsed():.1f} seconds: ',
+      f'{str(counters["renames"])} renamed, {str(counters["cross_device_copies"])} copied across filesystems, {str(counters["hardlinks"])} hardlinked, ',
+      f'{str(counters["collisions"])} name clashes, {str(counters["errors"])} errors\n',
+      'Time spent in each phase: ',
+      ', '.join(f'{phase} {seconds:.2f}s' for phase, seconds in totals['timers'].items())
+    ]))
\ No newline at end of file
@@ -0,0 +1,232 @@
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from collections import OrderedDict
+from .file_operations import is_organised_dir
+
+# inotify event masks, see inotify(7)
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_CLOSE_WRITE = 0x00000008
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# Events watched in each directory: files written and closed, files and directories moved in, and directories created
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+EVENT_HEADER = struct.Struct('iIII')
+EVENT_BUFFER_SIZE = 64 * 1024
+
+# Longest wait for events, so the watcher regularly checks whether it was asked to stop
+POLL_SECONDS = 1.0
+
+# Thin wrapper of a Linux inotify instance, reading its events without blocking for longer than a timeout
+class Inotify:
+  def __init__(self):
+    if not sys.platform.startswith('linux'):
+      raise OSError(errno.ENOSYS, 'The watch mode needs Linux inotify')
+
+    self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+    self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), 'Failed to start inotify')
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  # Watch a directory, returning its watch descriptor
+  def add_watch(self, path, mask = WATCH_MASK):
+    wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+    if wd < 0:
+      error = ctypes.get_errno()
+      raise OSError(error, os.strerror(error), path)
+
+    return wd
+
+  # Read the events available within a timeout, as (watch descriptor, mask, file name) tuples
+  def read_events(self, timeout):
+    if not select.select([self.fd], [], [], timeout)[0]:
+      return list()
+
+    try:
+      data = os.read(self.fd, EVENT_BUFFER_SIZE)
+    except BlockingIOError:
+      return list()
+
+    events = list()
+    offset = 0
+
+    while offset + EVENT_HEADER.size <= len(data):
+      wd, mask, cookie, name_length = EVENT_HEADER.unpack_from(data, offset)
+      offset += EVENT_HEADER.size
+      name = os.fsdecode(data[offset:offset + name_length].rstrip(b'\x00'))
+      offset += name_length
+      events.append((wd, mask, name))
+
+    return events
+
+  def close(self):
+    os.close(self.fd)
+
+# Files reported by the watcher that are waiting for their writes to settle, in the order of their last event
+# Each file is only held until it is organised, so the memory used only depends on the files arriving within a quiet period
+class PendingFiles:
+  def __init__(self):
+    self.files = OrderedDict()
+
+  def __len__(self):
+    return len(self.files)
+
+  # Add a file of an organised directory, or push it back if it was already pending
+  def add(self, path, dir, now):
+    self.files.pop(path, None)
+    self.files[path] = (dir, now)
+
+  # Take up to batch_size files whose last event is older than the quiet period
+  # Returns a dict mapping each organised directory to the paths of its settled files
+  def pop_settled(self, now, quiet_period, batch_size):
+    batches = dict()
+    file_count = 0
+
+    while self.files and file_count < batch_size:
+      path, (dir, event_time) = next(iter(self.files.items()))
+      if now - event_time < quiet_period:
+        break
+
+      del self.files[path]
+      batches.setdefault(dir, list()).append(path)
+      file_count += 1
+
+    return batches
+
+  # Get the number of seconds until the oldest pending file settles, or None if no file is pending
+  def next_settle_delay(self, now, quiet_period):
+    if not self.files:
+      return None
+
+    dir, event_time = next(iter(self.files.values()))
+    return max(0.0, event_time + quiet_period - now)
+
+# Watch the configured directories and organise the media files written into them once they settle
+# New files are reported when they are closed after a write, or moved into a watched directory, and are organised once no event was seen
+# for them during the quiet period, in batches of up to batch_size files passed to organise_files(dir, paths)
+# Directories created inside watched directories are watched too when recursive, except for the year and duplicates directories
+class MediaWatcher:
+  def __init__(self, dirs, ruleset, organise_files, recursive = False, quiet_period = 5, batch_size = 100):
+    self.dirs = dirs
+    self.ruleset = ruleset
+    self.organise_files = organise_files
+    self.recursive = recursive
+    self.quiet_period = quiet_period
+    self.batch_size = max(1, batch_size)
+    self.pending = PendingFiles()
+    self.watched_dirs = dict()
+    self.inotify = None
+
+  def __enter__(self):
+    self.inotify = Inotify()
+    for dir in self.dirs:
+      self.watch_tree(dir, dir)
+
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.inotify.close()
+    self.watched_dirs = dict()
+
+  # Watch a directory and, when recursive, its sub-directories
+  # Returns the files found in the sub-directories, which may have been moved in along with them
+  def watch_tree(self, path, root_dir):
+    found_files = list()
+    dirs = [path]
+
+    while dirs:
+      dir = dirs.pop()
+      try:
+        self.watched_dirs[self.inotify.add_watch(dir)] = (dir, root_dir)
+
+        with os.scandir(dir) as entries:
+          for entry in entries:
+            if entry.is_file():
+              found_files.append(entry.path)
+            elif self.recursive and entry.is_dir(follow_symlinks = False) and self.is_watched_subdir(entry.path, root_dir):
+              dirs.append(entry.path)
+      except OSError as e:
+        logging.warning(f'Failed to watch directory: {dir}\n  {e}')
+
+    return found_files
+
+  # The destination and duplicates directories of the ruleset are not watched, since they hold files that were already organised
+  def is_watched_subdir(self, path, root_dir):
+    return not is_organised_dir(tuple(os.path.relpath(path, root_dir).split(os.sep)), self.ruleset)
+
+  # Handle inotify events until the stop event is set, organising the settled files as they come
+  def run(self, stop_event):
+    while not stop_event.is_set():
+      delay = self.pending.next_settle_delay(time.monotonic(), self.quiet_period)
+      events = self.inotify.read_events(POLL_SECONDS if delay is None else min(delay, POLL_SECONDS))
+
+      now = time.monotonic()
+      for event in events:
+        self.handle_event(*event, now)
+
+      self.organise_settled(now)
+
+  def handle_event(self, wd, mask, name, now):
+    if mask & IN_Q_OVERFLOW:
+      logging.warning('Missed some file events, scanning the watched directories again')
+      for dir in self.dirs:
+        for path in self.watch_tree(dir, dir):
+          self.add_file(path, dir, now)
+      return
+
+    if wd not in self.watched_dirs:
+      return
+
+    dir, root_dir = self.watched_dirs[wd]
+
+    # The watches of removed or moved directories are dropped, since their paths are no longer valid
+    if mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF):
+      del self.watched_dirs[wd]
+      if dir == root_dir:
+        logging.warning(f'Stopped watching a directory that was removed or moved: {dir}')
+    elif mask & IN_ISDIR:
+      path = os.path.join(dir, name)
+      if self.recursive and self.is_watched_subdir(path, root_dir):
+        for file_path in self.watch_tree(path, root_dir):
+          self.add_file(file_path, root_dir, now)
+    elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+      self.add_file(os.path.join(dir, name), root_dir, now)
+
+  def add_file(self, path, root_dir, now):
+    try:
+      if self.ruleset.match(os.path.basename(path), lambda: os.stat(path).st_size) is not None:
+        self.pending.add(path, root_dir, now)
+    except OSError:
+      pass
+
+  # Organise the files that settled, in batches of up to batch_size files
+  def organise_settled(self, now):
+    while True:
+      batches = self.pending.pop_settled(now, self.quiet_period, self.batch_size)
+      if not batches:
+        return
+
+      for dir, paths in batches.items():
+        try:
+          self.organise_files(dir, paths)
+        except Exception:
+          logging.error(f'Failed to organise new files in: {dir}', exc_info=True)
@@ -0,0 +1,28 @@
+import argparse
+import json
+import logging
+import yaml
+from organise_media.benchmark import BENCHMARKS, run_benchmarks
+
+# Run the benchmarks on synthetic media trees, and write their results as JSON
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description = 'Benchmark organise_media on synthetic media trees.')
+  parser.add_argument('--benchmark', action = 'append', choices = BENCHMARKS, help = 'a benchmark to run, can be repeated (default: all)')
+  parser.add_argument('--spec', help = 'a YAML file overriding the tree spec, see benchmark.TREE_DEFAULTS')
+  parser.add_argument('--file-count', type = int, help = 'the number of files to organise')
+  parser.add_argument('--base-dir', help = 'the directory to build the trees in, e.g. a tmpfs mount (default: the system temporary directory)')
+  parser.add_argument('--output', default = 'benchmark_results.json', help = 'the file to write the results to (default: benchmark_results.json)')
+  args = parser.parse_args()
+
+  spec = dict()
+  if args.spec:
+    with open(args.spec) as spec_file:
+      spec = yaml.safe_load(spec_file) or dict()
+  if args.file_count is not None:
+    spec['file_count'] = args.file_count
+
+  logging.basicConfig(level = logging.ERROR)
+  results = run_benchmarks(args.benchmark, args.base_dir, spec, args.output)
+
+  for result in results:
+    print(json.dumps({ key: result[key] for key in ['benchmark', 'files', 'seconds', 'files_per_sec', 'fs_calls_per_file', 'peak_rss_kb'] }))
@@ -0,0 +1,6 @@
+import sys
+from organise_media.cli import main
+
+# Organise the configured directories without any prompt, e.g. from cron or from other scripts, see cli.parse_args for the arguments
+if __name__ == '__main__':
+  sys.exit(main())
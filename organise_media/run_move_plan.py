@@ -0,0 +1,6 @@
+import sys
+from organise_media.user_prompt import run_plan
+
+# Execute the plan written by a dry run, read from the path given as argument or from the configured plan_file
+if __name__ == '__main__':
+  run_plan(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,5 @@
+from organise_media.user_prompt import run_near_duplicates
+
+# Find the near-duplicate images already organised in the configured directories
+if __name__ == '__main__':
+  run_near_duplicates()
@@ -0,0 +1,30 @@
+import argparse
+import datetime
+import logging
+import sys
+from organise_media.packing import extract_packed_files, list_packed_files
+
+# List or extract the small files packed into the archive of a directory, through its sidecar index
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description = 'List or extract the files packed into an archive by organise_media.')
+  commands = parser.add_subparsers(dest = 'command', required = True)
+
+  list_parser = commands.add_parser('list', help = 'list the packed files, with their size and modification date')
+  list_parser.add_argument('archive', help = 'the archive, e.g. 2020/05_May/packed.tar')
+
+  extract_parser = commands.add_parser('extract', help = 'extract packed files, leaving them in the archive')
+  extract_parser.add_argument('archive', help = 'the archive, e.g. 2020/05_May/packed.tar')
+  extract_parser.add_argument('name', nargs = '*', help = 'a packed file to extract (default: all of them)')
+  extract_parser.add_argument('--dest', default = '.', help = 'the directory to extract the files to (default: the current directory)')
+  args = parser.parse_args()
+
+  logging.basicConfig(level = logging.INFO, format = '%(message)s')
+
+  if args.command == 'list':
+    for entry in list_packed_files(args.archive):
+      print(f'{str(entry["size"]):>12}  {datetime.datetime.fromtimestamp(entry["mtime"]):%Y-%m-%d %H:%M:%S}  {entry["name"]}')
+  else:
+    file_count = extract_packed_files(args.archive, args.dest, args.name)
+    logging.info(f'Extracted {str(file_count)} files to: {args.dest}')
+    if args.name and file_count < len(args.name):
+      sys.exit(1)
@@ -0,0 +1,6 @@
+import sys
+from organise_media.user_prompt import run_undo
+
+# Undo the moves of a run, read from the journal given as argument or from the journal of the most recent run
+if __name__ == '__main__':
+  run_undo(sys.argv[1] if len(sys.argv) > 1 else None)
\ No newline at end of file
@@ -0,0 +1,6 @@
+import sys
+from organise_media.cli import verify_main
+
+# Verify the files moved by a run against its manifest, e.g. on a schedule, see cli.parse_verify_args for the arguments
+if __name__ == '__main__':
+  sys.exit(verify_main())
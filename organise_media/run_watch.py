@@ -0,0 +1,5 @@
+from organise_media.user_prompt import run_watch
+
+# Watch the configured directories and organise the media files as they arrive
+if __name__ == '__main__':
+  run_watch()
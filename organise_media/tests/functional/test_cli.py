@@ -0,0 +1,93 @@
+import datetime
+import os
+import subprocess
+import sys
+import pytest
+from organise_media.organise_media.cli import EXIT_INVALID_CONFIG, EXIT_NOT_CONFIRMED, EXIT_PARTIAL, EXIT_SUCCESS, main, parse_args, run_headless
+from organise_media.organise_media.move_journal import MoveJournal
+from organise_media.organise_media.move_plan import ACTION_MOVE, PlannedMove, read_plan
+from organise_media.tests.test_helpers import FakeFile, create_test_file, create_test_files, assert_file_exists_with_content
+
+def test_cli_moves_files_of_folders_and_extensions_given_as_arguments_with_yes(fs):
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/file1.png", "PNG File 1", datetime.datetime(2009, 10, 5))
+    ])
+
+    exit_code = run_headless(parse_args(["--config", "./missing.yaml", "--folder", "./test_dir/", "--extension", ".jpg", "--workers", "2", "--yes"]))
+
+    assert exit_code == EXIT_SUCCESS
+    assert_file_exists_with_content(fs, "./test_dir/2009/10_October/file1.jpg", "JPG File 1")
+    assert fs.exists("./test_dir/file1.png")
+
+def test_cli_returns_partial_exit_code_when_a_folder_does_not_exist(fs):
+    create_test_files(fs, [FakeFile("./test_dir/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5))])
+
+    exit_code = run_headless(parse_args(["--config", "./missing.yaml", "--folder", "./test_dir/", "--folder", "./missing_dir/", "--extension", ".jpg", "--yes"]))
+
+    assert exit_code == EXIT_PARTIAL
+    assert_file_exists_with_content(fs, "./test_dir/2009/10_October/file1.jpg", "JPG File 1")
+
+def test_cli_returns_partial_exit_code_when_a_resumed_move_fails(fs):
+    create_test_files(fs, [
+        FakeFile("/test_dir/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5)),
+        FakeFile("/test_dir/2009", "Not a directory"),
+        FakeFile("./config.yaml", "folders_to_organise:\n    - /other_dir/\n\nmedia_extensions:\n    - .jpg\n\njournal_dir: /journal\n")
+    ])
+    fs.create_dir("/other_dir")
+    with MoveJournal("/journal/run_1.jsonl") as journal:
+        journal.record_plan([PlannedMove(ACTION_MOVE, "/test_dir", "/test_dir/file1.jpg", "/test_dir/2009/10_October/file1.jpg", 10, 0.0, 1, False, None, None)])
+
+    exit_code = run_headless(parse_args(["--config", "./config.yaml", "--yes"]))
+
+    assert exit_code == EXIT_PARTIAL
+    assert_file_exists_with_content(fs, "/test_dir/file1.jpg", "JPG File 1")
+
+def test_cli_does_not_move_files_without_yes(fs):
+    create_test_files(fs, [FakeFile("./test_dir/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5))])
+
+    exit_code = run_headless(parse_args(["--config", "./missing.yaml", "--folder", "./test_dir/", "--extension", ".jpg"]))
+
+    assert exit_code == EXIT_NOT_CONFIRMED
+    assert fs.exists("./test_dir/file1.jpg")
+
+def test_cli_writes_plan_on_dry_run_without_yes(fs):
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5)),
+        FakeFile("./config.yaml", "folders_to_organise:\n    - ./test_dir/\n\nmedia_extensions:\n    - .jpg\n")
+    ])
+
+    exit_code = run_headless(parse_args(["--config", "./config.yaml", "--dry-run", "--plan-file", "/plans/plan.json"]))
+
+    assert exit_code == EXIT_SUCCESS
+    assert fs.exists("./test_dir/file1.jpg")
+    assert [move.src_file_path for move in read_plan("/plans/plan.json")] == [os.path.join("./test_dir/", "file1.jpg")]
+
+def test_cli_writes_plan_file_relative_to_the_current_directory(fs):
+    create_test_files(fs, [FakeFile("/work/test_dir/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5))])
+    os.chdir("/work")
+
+    exit_code = run_headless(parse_args(["--config", "./missing.yaml", "--folder", "test_dir", "--extension", ".jpg", "--dry-run", "--plan-file", "plan.json"]))
+
+    assert exit_code == EXIT_SUCCESS
+    assert [move.src_file_path for move in read_plan("/work/plan.json")] == ["/work/test_dir/file1.jpg"]
+
+def test_cli_returns_invalid_config_exit_code(fs):
+    create_test_file(fs, FakeFile("./config.yaml", "folders_to_organise: ./test_dir/\n"))
+
+    assert run_headless(parse_args(["--config", "./config.yaml", "--yes"])) == EXIT_INVALID_CONFIG
+    assert run_headless(parse_args(["--config", "./missing.yaml", "--folder", "./test_dir/", "--yes"])) == EXIT_INVALID_CONFIG
+
+def test_cli_exits_with_usage_error_for_invalid_arguments():
+    with pytest.raises(SystemExit) as exit_info:
+        main(["--workers", "many"])
+
+    assert exit_info.value.code == 2
+
+def test_cli_does_not_import_the_organising_modules_to_parse_arguments():
+    code = "import sys; from organise_media.organise_media.cli import parse_args; parse_args([]); print(sorted(name for name in sys.modules if name.startswith('organise_media') or name == 'yaml'))"
+    root_dir = os.path.join(os.path.dirname(__file__), "..", "..", "..")
+
+    output = subprocess.run([sys.executable, "-c", code], cwd = root_dir, capture_output = True, text = True, check = True).stdout
+
+    assert output.strip() == "['organise_media', 'organise_media.organise_media', 'organise_media.organise_media.cli']"
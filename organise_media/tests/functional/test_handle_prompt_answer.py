@@ -1,4 +1,8 @@
 import datetime
+import json
+import logging
+import os
+from organise_media.organise_media.move_plan import read_plan
 from organise_media.organise_media.user_prompt import handle_prompt_answer
 from organise_media.tests.test_helpers import FakeFile, create_test_files, assert_file_exists_with_content, assert_only_moved_files_with_extension_in_media_types
 
@@ -204,16 +208,114 @@ def test_script_does_not_overwrite_existing_files(fs):
         FakeFile("./test_dir/second_dir_to_organise/file2.png", "PNG File 2", datetime.datetime(2010, 3, 5)),
         FakeFile("./test_dir/first_dir_to_organise/2009/09_September/file1.jpg", "Existing JPG File 1", datetime.datetime(2009, 9, 5)),
         FakeFile("./test_dir/second_dir_to_organise/2010/03_March/file2.png", "Existing PNG File 2", datetime.datetime(2010, 3, 5)),
-        FakeFile("./test_dir/second_dir_to_organise/2010/03_March/file2_copy.png", "Existing PNG File 2 Copy", datetime.datetime(2010, 3, 5))
+        FakeFile("./test_dir/second_dir_to_organise/2010/03_March/file2 (2).png", "Existing PNG File 2 Copy", datetime.datetime(2010, 3, 5))
     ]
 
     create_test_files(fs, test_files)
     handle_prompt_answer(prompt_answer, dirs_to_organise, media_types)
 
     assert_file_exists_with_content(fs, "./test_dir/first_dir_to_organise/2009/09_September/file1.jpg", "Existing JPG File 1")
-    assert_file_exists_with_content(fs, "./test_dir/first_dir_to_organise/2009/09_September/file1_copy.jpg", "JPG File 1")
+    assert_file_exists_with_content(fs, "./test_dir/first_dir_to_organise/2009/09_September/file1 (2).jpg", "JPG File 1")
     assert_file_exists_with_content(fs, "./test_dir/first_dir_to_organise/2009/09_September/file1.png", "PNG File 1")
     assert_file_exists_with_content(fs, "./test_dir/second_dir_to_organise/2010/03_March/file2.jpg", "JPG File 2")
     assert_file_exists_with_content(fs, "./test_dir/second_dir_to_organise/2010/03_March/file2.png", "Existing PNG File 2")
-    assert_file_exists_with_content(fs, "./test_dir/second_dir_to_organise/2010/03_March/file2_copy.png", "Existing PNG File 2 Copy")
-    assert_file_exists_with_content(fs, "./test_dir/second_dir_to_organise/2010/03_March/file2_copy_copy.png", "PNG File 2")
+    assert_file_exists_with_content(fs, "./test_dir/second_dir_to_organise/2010/03_March/file2 (2).png", "Existing PNG File 2 Copy")
+    assert_file_exists_with_content(fs, "./test_dir/second_dir_to_organise/2010/03_March/file2 (3).png", "PNG File 2")
+
+
+def test_script_organises_dirs_concurrently_with_multiple_workers(fs):
+    prompt_answer = "yes"
+    dirs_to_organise = [
+        "./test_dir/first_dir_to_organise/",
+        "./test_dir/second_dir_to_organise/",
+        "./test_dir/third_dir_to_organise/"
+    ]
+    media_types = [".jpg", ".png"]
+
+    test_files = [
+        FakeFile("./test_dir/first_dir_to_organise/file1.jpg", "JPG File 1", datetime.datetime(2009, 9, 5)),
+        FakeFile("./test_dir/second_dir_to_organise/file2.jpg", "JPG File 2", datetime.datetime(2010, 3, 5)),
+        FakeFile("./test_dir/third_dir_to_organise/file3.png", "PNG File 3", datetime.datetime(2011, 6, 5)),
+        FakeFile("./test_dir/third_dir_to_organise/file3.mp4", "MP4 File 3", datetime.datetime(2011, 6, 5))
+    ]
+
+    create_test_files(fs, test_files)
+    handle_prompt_answer(prompt_answer, dirs_to_organise, media_types, { "max_workers": 3 })
+
+    assert_only_moved_files_with_extension_in_media_types(fs, test_files, media_types)
+
+    assert_file_exists_with_content(fs, "./test_dir/first_dir_to_organise/2009/09_September/file1.jpg", "JPG File 1")
+    assert_file_exists_with_content(fs, "./test_dir/second_dir_to_organise/2010/03_March/file2.jpg", "JPG File 2")
+    assert_file_exists_with_content(fs, "./test_dir/third_dir_to_organise/2011/06_June/file3.png", "PNG File 3")
+
+def test_script_logs_combined_summary_of_all_dirs(fs, caplog):
+    prompt_answer = "yes"
+    dirs_to_organise = [
+        "./non_existant_dir/",
+        "./test_dir/first_dir_to_organise/",
+        "./test_dir/second_dir_to_organise/"
+    ]
+    media_types = [".jpg"]
+
+    test_files = [
+        FakeFile("./test_dir/first_dir_to_organise/file1.jpg", "JPG File 1", datetime.datetime(2009, 9, 5)),
+        FakeFile("./test_dir/second_dir_to_organise/file2.jpg", "JPG File 2", datetime.datetime(2010, 3, 5)),
+        FakeFile("./test_dir/second_dir_to_organise/file3.jpg", "JPG File 3", datetime.datetime(2010, 3, 5))
+    ]
+
+    create_test_files(fs, test_files)
+
+    with caplog.at_level(logging.INFO):
+        handle_prompt_answer(prompt_answer, dirs_to_organise, media_types, { "max_workers": 2 })
+
+    assert "Summary: moved 3 files in 3 directories (0 failed)." in caplog.messages
+
+def test_script_writes_plan_and_moves_zero_files_on_dry_run(fs):
+    prompt_answer = "yes"
+    dirs_to_organise = [
+        "./test_dir/first_dir_to_organise/",
+        "./test_dir/second_dir_to_organise/"
+    ]
+    media_types = [".jpg"]
+
+    test_files = [
+        FakeFile("./test_dir/first_dir_to_organise/file1.jpg", "JPG File 1", datetime.datetime(2009, 9, 5)),
+        FakeFile("./test_dir/second_dir_to_organise/file2.jpg", "JPG File 2", datetime.datetime(2010, 3, 5))
+    ]
+
+    create_test_files(fs, test_files)
+    handle_prompt_answer(prompt_answer, dirs_to_organise, media_types, { "dry_run": True, "plan_file": "/test_dir/plan.json" })
+
+    for test_file in test_files:
+        assert fs.exists(test_file.path)
+
+    plan = read_plan("/test_dir/plan.json")
+    assert sorted(move.src_file_path for move in plan) == [
+        "./test_dir/first_dir_to_organise/file1.jpg",
+        "./test_dir/second_dir_to_organise/file2.jpg"
+    ]
+
+def test_script_writes_run_metrics_report(fs):
+    prompt_answer = "yes"
+    dirs_to_organise = [
+        "./test_dir/first_dir_to_organise/",
+        "./test_dir/second_dir_to_organise/"
+    ]
+    media_types = [".jpg"]
+
+    test_files = [
+        FakeFile("./test_dir/first_dir_to_organise/file1.jpg", "JPG File 1", datetime.datetime(2009, 9, 5)),
+        FakeFile("./test_dir/second_dir_to_organise/file2.jpg", "JPG File 2", datetime.datetime(2010, 3, 5))
+    ]
+
+    create_test_files(fs, test_files)
+    handle_prompt_answer(prompt_answer, dirs_to_organise, media_types, { "metrics_dir": "/test_dir/metrics" })
+
+    report_file_names = os.listdir("/test_dir/metrics")
+    assert len(report_file_names) == 1
+
+    with open(os.path.join("/test_dir/metrics", report_file_names[0]), "r") as report_file:
+        report = json.load(report_file)
+
+    assert report["totals"]["counters"]["moved_files"] == 2
+    assert sorted(report["dirs"]) == dirs_to_organise
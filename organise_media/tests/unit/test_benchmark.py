@@ -0,0 +1,69 @@
+import os
+from organise_media.organise_media.benchmark import FsCallCounter, generate_media_tree, run_benchmark
+
+SPEC = {
+    "file_count": 50,
+    "min_size": 10,
+    "max_size": 100,
+    "organised_ratio": 0.4,
+    "collision_ratio": 0.5,
+    "sub_dir_count": 2
+}
+
+def list_files(root):
+    return [os.path.join(dir, file_name) for dir, dir_names, file_names in os.walk(root) for file_name in file_names]
+
+def test_generate_media_tree_writes_files_to_organise_and_organised_files(tmp_path):
+    root = str(tmp_path / "media")
+
+    stats = generate_media_tree(root, SPEC)
+
+    assert stats["files"] == 50
+    assert stats["organised_files"] == 20
+    assert stats["collisions"] > 0
+    assert len(list_files(root)) == 70
+    assert sum(os.path.getsize(path) for path in list_files(root)) == stats["bytes"]
+    assert all(10 <= os.path.getsize(path) <= 100 for path in list_files(root))
+    assert os.path.isdir(os.path.join(root, "sub_1", "sub_2"))
+
+def test_generate_media_tree_is_reproducible_with_the_same_seed(tmp_path):
+    generate_media_tree(str(tmp_path / "first"), SPEC)
+    generate_media_tree(str(tmp_path / "second"), SPEC)
+
+    first_files = sorted(os.path.relpath(path, str(tmp_path / "first")) for path in list_files(str(tmp_path / "first")))
+    second_files = sorted(os.path.relpath(path, str(tmp_path / "second")) for path in list_files(str(tmp_path / "second")))
+
+    assert first_files == second_files
+
+def test_fs_call_counter_counts_calls_and_restores_functions(tmp_path):
+    stat = os.stat
+
+    with FsCallCounter() as counter:
+        os.stat(str(tmp_path))
+        os.listdir(str(tmp_path))
+
+    assert counter.count == 1
+    assert os.stat is stat
+
+def test_fs_call_counter_counts_the_first_stat_of_scandir_entries(tmp_path):
+    (tmp_path / "file.jpg").write_bytes(b"data")
+
+    with FsCallCounter() as counter:
+        with os.scandir(str(tmp_path)) as entries:
+            entry = next(iter(entries))
+            entry.stat()
+            entry.stat()
+
+    assert counter.count == 2
+    assert entry.name == "file.jpg"
+    assert entry.stat().st_size == 4
+
+def test_run_benchmark_reports_throughput_and_removes_tree(tmp_path):
+    result = run_benchmark("organise_media", str(tmp_path), { **SPEC, "sub_dir_count": 0, "extensions": { ".jpg": 1 }, "options": { "date_source": "mtime" } })
+
+    assert result["benchmark"] == "organise_media"
+    assert result["files"] == 50
+    assert result["files_per_sec"] > 0
+    assert result["fs_calls_per_file"] > 0
+    assert result["peak_rss_kb"] > 0
+    assert os.listdir(str(tmp_path)) == []
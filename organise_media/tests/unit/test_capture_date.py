@@ -0,0 +1,190 @@
+import datetime
+import random
+import struct
+import time
+import pytest
+from organise_media.organise_media.capture_date import CaptureDateCache, read_camera_model, read_capture_date, resolve_creation_dates
+from organise_media.organise_media.file_operations import get_media_files, organise_media
+from organise_media.organise_media.scan_index import ScanIndex
+from organise_media.tests.test_helpers import FakeFile, create_test_file, create_test_files
+
+CAPTURE_DATE = datetime.datetime(2015, 6, 20, 10, 30, 0)
+CAPTURE_EPOCH = time.mktime(CAPTURE_DATE.timetuple())
+
+# Build big-endian TIFF data with an EXIF IFD holding a DateTimeOriginal tag
+def build_tiff(date = CAPTURE_DATE):
+    date_value = date.strftime("%Y:%m:%d %H:%M:%S").encode("ascii") + b"\x00"
+    ifd0 = struct.pack(">H", 1) + struct.pack(">HHII", 0x8769, 4, 1, 26) + struct.pack(">I", 0)
+    exif_ifd = struct.pack(">H", 1) + struct.pack(">HHII", 0x9003, 2, 20, 44) + struct.pack(">I", 0)
+    return b"MM\x00\x2a" + struct.pack(">I", 8) + ifd0 + exif_ifd + date_value
+
+# Build big-endian TIFF data with an IFD0 holding a Model tag
+def build_tiff_with_model(model):
+    model_value = model.encode("ascii") + b"\x00"
+    ifd0 = struct.pack(">H", 1) + struct.pack(">HHII", 0x0110, 2, len(model_value), 26) + struct.pack(">I", 0)
+    return b"MM\x00\x2a" + struct.pack(">I", 8) + ifd0 + model_value
+
+def build_jpeg(date = CAPTURE_DATE, tiff = None):
+    app1 = b"Exif\x00\x00" + (tiff or build_tiff(date))
+    return b"\xFF\xD8" + b"\xFF\xE0" + struct.pack(">H", 4) + b"JF" + b"\xFF\xE1" + struct.pack(">H", len(app1) + 2) + app1 + b"\xFF\xDA" + b"image data"
+
+def build_png(date = CAPTURE_DATE):
+    exif = build_tiff(date)
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I4s", 0, b"IHDR") + b"crc!" + struct.pack(">I4s", len(exif), b"eXIf") + exif + b"crc!"
+
+def build_box(box_type, content):
+    return struct.pack(">I4s", len(content) + 8, box_type) + content
+
+def build_mp4(epoch = CAPTURE_EPOCH):
+    mvhd = build_box(b"mvhd", b"\x00\x00\x00\x00" + struct.pack(">II", int(epoch) + 2082844800, 0) + b"\x00" * 88)
+    return build_box(b"ftyp", b"isom\x00\x00\x02\x00") + build_box(b"mdat", b"video data" * 10) + build_box(b"moov", mvhd)
+
+def build_heic(date = CAPTURE_DATE):
+    ftyp = build_box(b"ftyp", b"heic\x00\x00\x00\x00")
+    infe = build_box(b"infe", b"\x02\x00\x00\x00" + struct.pack(">HH", 7, 0) + b"Exif")
+    iinf = build_box(b"iinf", b"\x00\x00\x00\x00" + struct.pack(">H", 1) + infe)
+    exif_item = struct.pack(">I", 6) + b"Exif\x00\x00" + build_tiff(date)
+    iloc_size = 8 + 4 + 2 + 2 + 2 + 2 + 2 + 4 + 4
+    meta_size = 8 + 4 + len(iinf) + iloc_size
+    exif_offset = len(ftyp) + meta_size
+    iloc = build_box(b"iloc", b"\x00\x00\x00\x00" + bytes([0x44, 0x00]) + struct.pack(">HHHHII", 1, 7, 0, 1, exif_offset, len(exif_item)))
+    meta = build_box(b"meta", b"\x00\x00\x00\x00" + iinf + iloc)
+    return ftyp + meta + exif_item
+
+def create_binary_test_file(fs, path, content, creation_date = datetime.datetime(2001, 1, 1)):
+    create_test_file(fs, FakeFile(path, content, creation_date))
+
+def test_read_capture_date_reads_jpeg_exif_date(fs):
+    create_binary_test_file(fs, "./test_dir/file.jpg", build_jpeg())
+
+    assert read_capture_date("./test_dir/file.jpg") == CAPTURE_EPOCH
+
+def test_read_capture_date_reads_png_exif_date(fs):
+    create_binary_test_file(fs, "./test_dir/file.png", build_png())
+
+    assert read_capture_date("./test_dir/file.png") == CAPTURE_EPOCH
+
+def test_read_capture_date_reads_mp4_movie_header_date(fs):
+    create_binary_test_file(fs, "./test_dir/file.mp4", build_mp4())
+
+    assert read_capture_date("./test_dir/file.mp4") == CAPTURE_EPOCH
+
+def test_read_capture_date_reads_heic_exif_item_date(fs):
+    create_binary_test_file(fs, "./test_dir/file.heic", build_heic())
+
+    assert read_capture_date("./test_dir/file.heic") == CAPTURE_EPOCH
+
+def test_read_capture_date_returns_none_for_files_without_metadata(fs):
+    create_test_files(fs, [FakeFile("./test_dir/file.jpg", "Not a JPG File")])
+
+    assert read_capture_date("./test_dir/file.jpg") is None
+
+def test_read_capture_date_returns_none_for_jpeg_files_with_invalid_date(fs):
+    create_binary_test_file(fs, "./test_dir/file.jpg", build_jpeg().replace(b"2015:06:20", b"0000:00:00"))
+
+    assert read_capture_date("./test_dir/file.jpg") is None
+
+def test_read_capture_date_returns_none_for_heic_files_with_an_out_of_range_exif_offset(fs):
+    heic = build_heic()
+    # Offsets of 12 bytes in the item location box, starting with a set byte, so the Exif offset is past the range of a file offset
+    sizes_offset = heic.index(b"iloc") + 8
+    extent_offset = sizes_offset + 10
+    heic = heic[:sizes_offset] + b"\xC8" + heic[sizes_offset + 1:extent_offset] + b"\x98" + heic[extent_offset + 1:]
+    create_binary_test_file(fs, "./test_dir/file.heic", heic)
+
+    assert read_capture_date("./test_dir/file.heic") is None
+
+@pytest.mark.parametrize("build", [build_jpeg, build_png, build_mp4, build_heic])
+def test_read_capture_date_and_camera_model_return_none_or_a_value_for_truncated_and_corrupted_headers(fs, build):
+    data = build()
+    rng = random.Random(0)
+    corrupted_files = [data[:length] for length in range(len(data))]
+
+    for index in range(200):
+        corrupted = bytearray(data)
+        for position in rng.sample(range(len(data)), rng.randint(1, 4)):
+            corrupted[position] = rng.randrange(256)
+        corrupted_files.append(bytes(corrupted))
+
+    create_binary_test_file(fs, "./test_dir/file", b"")
+    for corrupted in corrupted_files:
+        with open("./test_dir/file", "wb") as file:
+            file.write(corrupted)
+
+        assert read_capture_date("./test_dir/file") is None or isinstance(read_capture_date("./test_dir/file"), (int, float))
+        assert read_camera_model("./test_dir/file") is None or isinstance(read_camera_model("./test_dir/file"), str)
+
+def test_resolve_creation_dates_falls_back_to_mtime(fs):
+    create_test_files(fs, [FakeFile("./test_dir/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5))])
+    create_binary_test_file(fs, "./test_dir/file2.jpg", build_jpeg())
+
+    dates = { entry.name: date for entry, date in resolve_creation_dates(get_media_files("./test_dir/", [".jpg"])) }
+
+    assert dates["file1.jpg"] == time.mktime(datetime.datetime(2009, 10, 5).timetuple())
+    assert dates["file2.jpg"] == CAPTURE_EPOCH
+
+def test_resolve_creation_dates_reuses_cached_dates_of_unchanged_files(fs):
+    create_binary_test_file(fs, "./test_dir/file.jpg", build_jpeg())
+    entry = next(get_media_files("./test_dir/", [".jpg"]))
+    cache = CaptureDateCache()
+
+    cache.put((entry.stat().st_ino, entry.stat().st_size, entry.stat().st_mtime), 0.0)
+
+    assert list(resolve_creation_dates([entry], cache = cache)) == [(entry, 0.0)]
+
+def test_bounded_cache_keeps_most_recently_used_dates_and_looks_up_evicted_ones_in_scan_index():
+    with ScanIndex(":memory:") as scan_index:
+        cache = CaptureDateCache(scan_index, max_size = 2)
+        for inode in range(3):
+            cache.put((inode, 8, 0.0), float(inode))
+        cache.flush()
+
+        assert list(cache.dates) == [(1, 8, 0.0), (2, 8, 0.0)]
+        assert cache.new_dates == {}
+        assert cache.get_many([(0, 8, 0.0)]) == { (0, 8, 0.0): 0.0 }
+        assert len(cache.dates) == 2
+
+def test_resolve_creation_dates_records_dates_in_scan_index_after_each_batch(fs, monkeypatch):
+    monkeypatch.setattr("organise_media.organise_media.capture_date.DATE_BATCH_SIZE", 2)
+    create_test_files(fs, [FakeFile(f"./test_dir/file{str(i)}.jpg", "JPG File", datetime.datetime(2009, 10, 5)) for i in range(4)])
+
+    with ScanIndex(":memory:") as scan_index:
+        cache = CaptureDateCache(scan_index, max_size = 2)
+        dated_entries = resolve_creation_dates(get_media_files("./test_dir/", [".jpg"]), cache = cache)
+        next(dated_entries)
+        next(dated_entries)
+        next(dated_entries)
+
+        assert len(cache.new_dates) <= 2
+        assert len(scan_index.get_capture_dates([(entry.stat().st_ino, entry.stat().st_size, entry.stat().st_mtime) for entry in get_media_files("./test_dir/", [".jpg"])])) >= 2
+
+def test_organise_media_uses_capture_date_instead_of_mtime(fs):
+    create_binary_test_file(fs, "./test_dir/dir_to_organise/file.jpg", build_jpeg(), datetime.datetime(2021, 3, 1))
+
+    organise_media("./test_dir/dir_to_organise/", [".jpg"])
+
+    assert fs.exists("./test_dir/dir_to_organise/2015/06_June/file.jpg")
+
+def test_organise_media_uses_mtime_when_date_source_is_mtime(fs):
+    create_binary_test_file(fs, "./test_dir/dir_to_organise/file.jpg", build_jpeg(), datetime.datetime(2021, 3, 1))
+
+    organise_media("./test_dir/dir_to_organise/", [".jpg"], { "date_source": "mtime" })
+
+    assert fs.exists("./test_dir/dir_to_organise/2021/03_March/file.jpg")
+
+def test_read_camera_model_reads_jpeg_exif_model(fs):
+    create_binary_test_file(fs, "./test_dir/file.jpg", build_jpeg(tiff = build_tiff_with_model("Pixel 4a/5G ")))
+    create_binary_test_file(fs, "./test_dir/other.jpg", build_jpeg())
+
+    assert read_camera_model("./test_dir/file.jpg") == "Pixel 4a_5G"
+    assert read_camera_model("./test_dir/other.jpg") is None
+    assert read_camera_model("./test_dir/missing.jpg") is None
+
+def test_organise_media_moves_files_to_camera_destination(fs):
+    create_binary_test_file(fs, "./test_dir/file.jpg", build_jpeg(tiff = build_tiff_with_model("Pixel")), datetime.datetime(2015, 6, 20))
+    create_binary_test_file(fs, "./test_dir/clip.mp4", build_mp4())
+
+    organise_media("./test_dir", [".jpg", ".mp4"], { "destination": "{camera}/{year}" })
+
+    assert fs.exists("./test_dir/Pixel/2015/file.jpg")
+    assert fs.exists("./test_dir/Unknown camera/2015/clip.mp4")
@@ -44,12 +44,51 @@ def test_is_valid_config_returns_false_when_media_extensions_is_of_wrong_type():
     assert not valid
     assert error_msg == 'The configuration file "config.yaml" must have a variable media_extensions of type list. Script aborted.'
 
+def test_is_valid_config_returns_false_when_media_extensions_has_a_non_string_extension():
+    valid, error_msg = is_valid_config({ "folders_to_organise": ["./test_dir/"], "media_extensions": [".jpg", 3] })
+
+    assert not valid
+    assert error_msg == 'The configuration variable media_extensions in "config.yaml" must be a list of str. Script aborted.'
+
+def test_is_valid_config_returns_false_for_rule_with_non_string_extension():
+    valid, error_msg = is_valid_config({ "folders_to_organise": [], "media_extensions": [], "rules": [{ "extensions": [None] }] })
+
+    assert not valid
+    assert error_msg == 'The rule number 1 in "config.yaml" is not valid: the rule key extensions must be a list of str. Script aborted.'
+
 def test_is_valid_config_returns_true_when_config_is_complete_with_correct_types():
     config = { 'folders_to_organise': list(), 'media_extensions': list() }
     valid, error_msg = is_valid_config(config)
 
     assert valid
 
+def test_is_valid_config_returns_false_when_recursive_is_of_wrong_type():
+    config = { 'folders_to_organise': list(), 'media_extensions': list(), 'recursive': "yes" }
+    valid, error_msg = is_valid_config(config)
+
+    assert not valid
+    assert error_msg == 'The configuration variable recursive in "config.yaml" must be of type bool. Script aborted.'
+
+def test_is_valid_config_returns_false_when_max_workers_is_of_wrong_type():
+    config = { 'folders_to_organise': list(), 'media_extensions': list(), 'max_workers': "4" }
+    valid, error_msg = is_valid_config(config)
+
+    assert not valid
+    assert error_msg == 'The configuration variable max_workers in "config.yaml" must be of type int. Script aborted.'
+
+def test_is_valid_config_returns_false_when_max_workers_is_a_bool():
+    valid, error_msg = is_valid_config({ "folders_to_organise": [], "media_extensions": [], "max_workers": True })
+
+    assert not valid
+    assert error_msg == 'The configuration variable max_workers in "config.yaml" must be of type int. Script aborted.'
+
+def test_is_valid_config_returns_false_when_duplicates_is_not_an_allowed_value():
+    config = { 'folders_to_organise': list(), 'media_extensions': list(), 'duplicates': "delete" }
+    valid, error_msg = is_valid_config(config)
+
+    assert not valid
+    assert error_msg == 'The configuration variable duplicates in "config.yaml" must be one of: keep, skip, hardlink, move. Script aborted.'
+
 def test_read_config_file_returns_false_for_non_existant_config_file():
     config_file = FakeFile("./test_dir/config.yaml")
 
@@ -134,4 +173,64 @@ def test_read_config_file_returns_true_and_config_matching_yaml_attributes(fs):
     assert config["folders_to_organise"][0] == "D:\\test\\data"
     assert config["folders_to_organise"][1] == "E:\\some\\folder"
     assert config["media_extensions"][0] == ".jpg"
-    assert config["media_extensions"][1] == ".png"
\ No newline at end of file
+    assert config["media_extensions"][1] == ".png"
+    assert config["recursive"] == False
+    assert config["max_workers"] == 1
+
+def test_read_config_file_returns_declared_recursive_value(fs):
+    config_file = FakeFile(
+        "./test_dir/config.yaml",
+        "".join([
+            "folders_to_organise:\n",
+            "    - D:\\test\\data\n",
+            "\n",
+            "media_extensions:\n",
+            "    - .jpg\n",
+            "\n",
+            "recursive: true\n"
+        ])
+    )
+
+    create_test_file(fs, config_file)
+    config, valid, error_msg = read_config_file(config_file.path)
+
+    assert valid
+    assert config["recursive"] == True
+
+def test_is_valid_config_returns_false_for_rule_with_unknown_destination_field():
+    config = { 'folders_to_organise': list(), 'media_extensions': list(), 'rules': [{ 'destination': '{lens}/{year}' }] }
+    valid, error_msg = is_valid_config(config)
+
+    assert not valid
+    assert error_msg == 'The rule number 1 in "config.yaml" is not valid: unknown field \'lens\' in destination {lens}/{year}. Script aborted.'
+
+def test_is_valid_config_returns_false_for_non_positive_mount_concurrency():
+    config = { 'folders_to_organise': list(), 'media_extensions': list(), 'mount_concurrency': { '/mnt/nas': 0 } }
+    valid, error_msg = is_valid_config(config)
+
+    assert not valid
+    assert error_msg == 'The concurrency limit of mount point /mnt/nas in "config.yaml" must be a positive int. Script aborted.'
+
+def test_read_config_file_compiles_ruleset(fs):
+    config_file = FakeFile(
+        "./test_dir/config.yaml",
+        "".join([
+            "folders_to_organise:\n",
+            "    - D:\\test\\data\n",
+            "\n",
+            "media_extensions:\n",
+            "    - .jpg\n",
+            "\n",
+            "rules:\n",
+            "    - extensions: [.mov]\n",
+            "      destination: videos/{year}\n"
+        ])
+    )
+
+    create_test_file(fs, config_file)
+    config, valid, error_msg = read_config_file(config_file.path)
+
+    assert valid
+    assert config["ruleset"].match("clip.MOV").destination.template == "videos/{year}"
+    assert config["ruleset"].match("photo.jpg") is not None
+    assert config["ruleset"].match("notes.txt") is None
@@ -0,0 +1,70 @@
+import datetime
+import os
+import pytest
+import time
+from organise_media.organise_media.destinations import UNKNOWN_CAMERA, DestinationTemplate
+
+def epoch(*date):
+    return time.mktime(datetime.datetime(*date).timetuple())
+
+def test_destination_template_formats_date_fields():
+    template = DestinationTemplate("{year}/{month:02}_{month_name}/{day:02}")
+
+    assert template.format(epoch(2019, 11, 1, 10, 20)) == os.path.join("2019", "11_November", "01")
+
+def test_destination_template_formats_iso_week_and_camera():
+    template = DestinationTemplate("{camera}/{year}/{week:02}")
+
+    assert template.format(epoch(2020, 1, 8), "Pixel") == os.path.join("Pixel", "2020", "02")
+    assert template.format(epoch(2020, 1, 8)) == os.path.join(UNKNOWN_CAMERA, "2020", "02")
+
+def test_destination_template_formats_each_bucket_once():
+    template = DestinationTemplate("{year}/{month:02}")
+    formatted_buckets = list()
+    format_bucket = template.format_bucket
+
+    def counting_format_bucket(bucket_epoch, camera):
+        formatted_buckets.append(bucket_epoch)
+        return format_bucket(bucket_epoch, camera)
+
+    template.format_bucket = counting_format_bucket
+    destinations = [template.format(epoch(2020, month, day)) for month in [3, 1, 3] for day in [1, 15, 31]]
+
+    assert len(formatted_buckets) == 2
+    assert destinations[0] == destinations[8] == os.path.join("2020", "03")
+    assert destinations[3] == os.path.join("2020", "01")
+    assert template.format(epoch(2020, 2, 29, 23, 59, 59)) == os.path.join("2020", "02")
+    assert template.format(epoch(2020, 4, 1)) == os.path.join("2020", "04")
+
+def test_destination_template_buckets_split_weeks_crossing_years():
+    template = DestinationTemplate("{year}/{week:02}")
+
+    assert template.format(epoch(2019, 12, 31)) == os.path.join("2019", "01")
+    assert template.format(epoch(2020, 1, 1)) == os.path.join("2020", "01")
+
+def test_destination_template_puts_weeks_under_their_iso_year():
+    template = DestinationTemplate("{iso_year}/{week:02}")
+
+    assert template.format(epoch(2019, 12, 31)) == os.path.join("2020", "01")
+    assert template.format(epoch(2021, 1, 1)) == os.path.join("2020", "53")
+    assert template.format(epoch(2021, 1, 4)) == os.path.join("2021", "01")
+    assert template.format(epoch(2020, 12, 28)) == os.path.join("2020", "53")
+
+def test_destination_template_keeps_camera_models_inside_the_organised_directory():
+    template = DestinationTemplate("{camera}/{year}")
+
+    assert template.format(epoch(2020, 1, 8), "..") == os.path.join("__", "2020")
+    assert template.format(epoch(2020, 1, 8), "A/B") == os.path.join("A_B", "2020")
+
+def test_destination_template_raises_for_invalid_templates():
+    with pytest.raises(ValueError):
+        DestinationTemplate("{lens}/{year}")
+    with pytest.raises(ValueError):
+        DestinationTemplate("{}/{year}")
+    with pytest.raises(ValueError):
+        DestinationTemplate("{month_name:d}")
+
+@pytest.mark.parametrize("destination", ["/photos/{year}", "../{year}", "{year}/../{month}", "{year}//{month}", "{year}/"])
+def test_destination_template_raises_for_destinations_outside_the_organised_directory(destination):
+    with pytest.raises(ValueError):
+        DestinationTemplate(destination)
@@ -0,0 +1,101 @@
+import os
+from organise_media.organise_media import duplicates
+from organise_media.organise_media.duplicates import find_duplicates, full_hash, partial_hash, safe_hash
+from organise_media.tests.test_helpers import FakeFile, create_test_files
+
+def files_with_sizes(paths):
+    return [(path, os.path.getsize(path)) for path in paths]
+
+def test_find_duplicates_returns_zero_duplicates_for_files_with_different_sizes(fs):
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg", "JPG File"),
+        FakeFile("./test_dir/file2.jpg", "Other JPG File")
+    ])
+
+    result = find_duplicates(files_with_sizes(["./test_dir/file1.jpg", "./test_dir/file2.jpg"]))
+
+    assert result == {}
+
+def test_find_duplicates_returns_zero_duplicates_for_files_with_same_size_and_different_contents(fs):
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg", "JPG File 1"),
+        FakeFile("./test_dir/file2.jpg", "JPG File 2")
+    ])
+
+    result = find_duplicates(files_with_sizes(["./test_dir/file1.jpg", "./test_dir/file2.jpg"]))
+
+    assert result == {}
+
+def test_find_duplicates_maps_identical_files_to_the_first_one(fs):
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg", "JPG File"),
+        FakeFile("./test_dir/file2.jpg", "JPG File"),
+        FakeFile("./test_dir/file3.jpg", "JPG File")
+    ])
+
+    result = find_duplicates(files_with_sizes(["./test_dir/file1.jpg", "./test_dir/file2.jpg", "./test_dir/file3.jpg"]))
+
+    assert result == { "./test_dir/file2.jpg": "./test_dir/file1.jpg", "./test_dir/file3.jpg": "./test_dir/file1.jpg" }
+
+def test_find_duplicates_prefers_organised_files_as_originals(fs):
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg", "JPG File"),
+        FakeFile("./test_dir/2009/10_October/file1.jpg", "JPG File"),
+        FakeFile("./test_dir/2009/10_October/file2.jpg", "JPG File")
+    ])
+
+    result = find_duplicates(
+        files_with_sizes(["./test_dir/file1.jpg"]),
+        files_with_sizes(["./test_dir/2009/10_October/file1.jpg", "./test_dir/2009/10_October/file2.jpg"])
+    )
+
+    assert result == { "./test_dir/file1.jpg": "./test_dir/2009/10_October/file1.jpg" }
+
+def test_find_duplicates_compares_full_contents_of_large_files_with_same_start_and_end(fs, monkeypatch):
+    monkeypatch.setattr(duplicates, "PARTIAL_HASH_SIZE", 4)
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg", "HEAD-middle-1-TAIL"),
+        FakeFile("./test_dir/file2.jpg", "HEAD-middle-2-TAIL"),
+        FakeFile("./test_dir/file3.jpg", "HEAD-middle-1-TAIL")
+    ])
+
+    result = find_duplicates(files_with_sizes(["./test_dir/file1.jpg", "./test_dir/file2.jpg", "./test_dir/file3.jpg"]))
+
+    assert partial_hash("./test_dir/file1.jpg", 18) == partial_hash("./test_dir/file2.jpg", 18)
+    assert full_hash("./test_dir/file1.jpg", 18) != full_hash("./test_dir/file2.jpg", 18)
+    assert result == { "./test_dir/file3.jpg": "./test_dir/file1.jpg" }
+
+def test_find_duplicates_ignores_empty_files(fs):
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg", ""),
+        FakeFile("./test_dir/file2.jpg", "")
+    ])
+
+    result = find_duplicates(files_with_sizes(["./test_dir/file1.jpg", "./test_dir/file2.jpg"]))
+
+    assert result == {}
+
+def test_full_hash_reads_large_files_through_mmap(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "file.jpg")
+
+    with open(file_path, "wb") as file:
+        file.write(b"JPG File" * 1000)
+
+    expected_hash = full_hash(file_path, 8000)
+    monkeypatch.setattr(duplicates, "MMAP_THRESHOLD", 1)
+
+    assert full_hash(file_path, 8000) == expected_hash
+
+def test_full_hash_reads_files_that_shrank_since_they_were_stat_ed_without_mmap(tmp_path, monkeypatch):
+    file_path = str(tmp_path / "file.jpg")
+    open(file_path, "wb").close()
+    monkeypatch.setattr(duplicates, "MMAP_THRESHOLD", 1)
+
+    assert full_hash(file_path, 8000) == full_hash(file_path, 0)
+
+def test_safe_hash_skips_files_whose_hash_raises_a_value_error(tmp_path):
+    def failing_hash(path, size):
+        raise ValueError("mmap length is greater than file size")
+
+    assert safe_hash(failing_hash, str(tmp_path / "file.jpg"), 8000) is None
@@ -1,6 +1,10 @@
 import datetime
 import os
-from organise_media.organise_media.file_operations import organise_media, get_media_files, safe_move
+import pytest
+from organise_media.organise_media import duplicates, file_operations, transfer
+from organise_media.organise_media.file_operations import organise_media, execute_plan, get_media_files, plan_media, safe_move
+from organise_media.organise_media.rules import as_ruleset
+from organise_media.organise_media.scan_index import STATUS_ORGANISED, ScanIndex
 from organise_media.tests.test_helpers import FakeFile, create_test_dir, create_test_file, create_test_files, assert_file_exists_with_content, assert_only_moved_files_with_extension_in_media_types
 
 def test_get_media_files_returns_zero_files_for_invalid_path():
@@ -33,7 +37,7 @@ def test_get_media_files_ignores_directories(fs):
     result = list(get_media_files(test_dir_path, media_types))
 
     assert len(result) == 1
-    assert result[0] == "file.jpg"
+    assert result[0].name == "file.jpg"
 
 def test_get_media_files_returns_files_matching_media_types_array(fs):
     test_dir_path = "./test_dir/"
@@ -52,10 +56,75 @@ def test_get_media_files_returns_files_matching_media_types_array(fs):
     result = list(get_media_files(test_dir_path, media_types))
 
     assert len(result) == 4
-    assert result[0] == "file1.jpg"
-    assert result[1] == "file2.jpg"
-    assert result[2] == "file1.png"
-    assert result[3] == "file2.png"
+    assert sorted(entry.name for entry in result) == ["file1.jpg", "file1.png", "file2.jpg", "file2.png"]
+
+def test_get_media_files_returns_entries_with_paths_in_the_input_directory(fs):
+    test_dir_path = "./test_dir/"
+    media_types = [".jpg"]
+
+    create_test_file(fs, FakeFile("./test_dir/file.jpg"))
+    result = list(get_media_files(test_dir_path, media_types))
+
+    assert len(result) == 1
+    assert result[0].path == os.path.join(test_dir_path, "file.jpg")
+    assert result[0].stat().st_mtime == os.stat("./test_dir/file.jpg").st_mtime
+
+def test_get_media_files_ignores_subdirectories_when_not_recursive(fs):
+    test_dir_path = "./test_dir/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg"),
+        FakeFile("./test_dir/subdir/file2.jpg")
+    ])
+    result = list(get_media_files(test_dir_path, media_types))
+
+    assert [entry.name for entry in result] == ["file1.jpg"]
+
+def test_get_media_files_scans_nested_subdirectories_when_recursive(fs):
+    test_dir_path = "./test_dir/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg"),
+        FakeFile("./test_dir/subdir/file2.jpg"),
+        FakeFile("./test_dir/subdir/nested/file3.jpg"),
+        FakeFile("./test_dir/subdir/nested/file3.png")
+    ])
+    result = list(get_media_files(test_dir_path, media_types, recursive = True))
+
+    assert sorted(entry.name for entry in result) == ["file1.jpg", "file2.jpg", "file3.jpg"]
+
+def test_get_media_files_does_not_descend_into_organised_year_dirs_when_recursive(fs):
+    test_dir_path = "./test_dir/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg"),
+        FakeFile("./test_dir/2019/11_November/file2.jpg"),
+        FakeFile("./test_dir/holidays/2019/file3.jpg")
+    ])
+    result = list(get_media_files(test_dir_path, media_types, recursive = True))
+
+    assert sorted(entry.name for entry in result) == ["file1.jpg", "file3.jpg"]
+
+@pytest.mark.parametrize("destination, organised_dir", [
+    ("{year}", "2019"),
+    ("{year}/{month:02}/{day:02}", "2019/11/05"),
+    ("videos/{year}", "videos/2019"),
+    ("{camera}/{year}", "Unknown camera/2019")
+])
+def test_get_media_files_does_not_descend_into_dirs_of_other_destinations_when_recursive(fs, destination, organised_dir):
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg"),
+        FakeFile(f"./test_dir/{organised_dir}/file2.jpg"),
+        FakeFile("./test_dir/holidays/file3.jpg")
+    ])
+    ruleset = as_ruleset([".jpg"], None, destination)
+
+    result = list(get_media_files("./test_dir/", ruleset, recursive = True))
+
+    assert sorted(entry.name for entry in result) == ["file1.jpg", "file3.jpg"]
 
 def test_safe_move_to_existing_dir(fs):
     src_file = FakeFile("./test_dir/source/file.jpg", "JPG File")
@@ -78,7 +147,7 @@ def test_safe_move_doesnt_overwrite_existing_files(fs):
     test_files = [
         file_to_move,
         FakeFile("./test_dir/destination/file.jpg", "Existing JPG File"),
-        FakeFile("./test_dir/destination/file_copy.jpg", "Existing JPG File Copy")
+        FakeFile("./test_dir/destination/file (2).jpg", "Existing JPG File Copy")
     ]
 
     create_test_files(fs, test_files)
@@ -86,8 +155,8 @@ def test_safe_move_doesnt_overwrite_existing_files(fs):
 
     assert not fs.exists(file_to_move.path)
     assert_file_exists_with_content(fs, "./test_dir/destination/file.jpg", "Existing JPG File")
-    assert_file_exists_with_content(fs, "./test_dir/destination/file_copy.jpg", "Existing JPG File Copy")
-    assert_file_exists_with_content(fs, "./test_dir/destination/file_copy_copy.jpg", "JPG File")
+    assert_file_exists_with_content(fs, "./test_dir/destination/file (2).jpg", "Existing JPG File Copy")
+    assert_file_exists_with_content(fs, "./test_dir/destination/file (3).jpg", "JPG File")
 
 def test_organise_media_moves_zero_files_for_non_existant_directory(fs):
     dir_to_organise = "./non_existant_dir/"
@@ -220,7 +289,7 @@ def test_organise_media_moves_files_without_overwriting_existing_ones(fs):
         FakeFile("./test_dir/dir_to_organise/2010/07_July/file3.jpg", "Existing JPG File 3", datetime.datetime(2010, 7, 5)),
         FakeFile("./test_dir/dir_to_organise/file4.png", "PNG File 4", datetime.datetime(2011, 5, 5)),
         FakeFile("./test_dir/dir_to_organise/2011/05_May/file4.png", "Existing PNG File 4", datetime.datetime(2011, 5, 5)),
-        FakeFile("./test_dir/dir_to_organise/2011/05_May/file4_copy.png", "Existing PNG File 4 Copy", datetime.datetime(2011, 5, 5))
+        FakeFile("./test_dir/dir_to_organise/2011/05_May/file4 (2).png", "Existing PNG File 4 Copy", datetime.datetime(2011, 5, 5))
     ]
 
     create_test_files(fs, test_files)
@@ -229,7 +298,303 @@ def test_organise_media_moves_files_without_overwriting_existing_ones(fs):
     assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1.jpg", "JPG File 1")
     assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file2.jpg", "Existing JPG File 2")
     assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2010/07_July/file3.jpg", "Existing JPG File 3")
-    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2010/07_July/file3_copy.jpg", "JPG File 3")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2010/07_July/file3 (2).jpg", "JPG File 3")
     assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2011/05_May/file4.png", "Existing PNG File 4")
-    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2011/05_May/file4_copy.png", "Existing PNG File 4 Copy")
-    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2011/05_May/file4_copy_copy.png", "PNG File 4")
\ No newline at end of file
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2011/05_May/file4 (2).png", "Existing PNG File 4 Copy")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2011/05_May/file4 (3).png", "PNG File 4")
+
+def test_organise_media_moves_files_in_subdirectories_when_recursive(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    test_files = [
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/subdir/file2.jpg", "JPG File 2", datetime.datetime(2013, 7, 10)),
+        FakeFile("./test_dir/dir_to_organise/2009/10_October/file3.jpg", "Existing JPG File 3", datetime.datetime(2009, 10, 5))
+    ]
+
+    create_test_files(fs, test_files)
+    organise_media(dir_to_organise, media_types, { "recursive": True })
+
+    assert not fs.exists("./test_dir/dir_to_organise/file1.jpg")
+    assert not fs.exists("./test_dir/dir_to_organise/subdir/file2.jpg")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1.jpg", "JPG File 1")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2013/07_July/file2.jpg", "JPG File 2")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file3.jpg", "Existing JPG File 3")
+
+def test_safe_move_adds_number_before_the_real_extension_for_names_with_many_dots(fs):
+    file_to_move = FakeFile("./test_dir/source/IMG.2020.jpg", "JPG File")
+    dest_dir_path = "./test_dir/destination/"
+
+    create_test_files(fs, [file_to_move, FakeFile("./test_dir/destination/IMG.2020.jpg", "Existing JPG File")])
+    safe_move(file_to_move.path, dest_dir_path)
+
+    assert_file_exists_with_content(fs, "./test_dir/destination/IMG.2020.jpg", "Existing JPG File")
+    assert_file_exists_with_content(fs, "./test_dir/destination/IMG.2020 (2).jpg", "JPG File")
+
+
+def test_organise_media_keeps_duplicated_files_by_default(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/2009/10_October/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5))
+    ])
+    organise_media(dir_to_organise, media_types)
+
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1 (2).jpg", "JPG File")
+
+def test_organise_media_skips_duplicated_files(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/file2.jpg", "JPG File", datetime.datetime(2013, 7, 10)),
+        FakeFile("./test_dir/dir_to_organise/file3.jpg", "Existing JPG File", datetime.datetime(2013, 7, 10)),
+        FakeFile("./test_dir/dir_to_organise/2009/10_October/file3.jpg", "Existing JPG File", datetime.datetime(2009, 10, 5))
+    ])
+    file_count = organise_media(dir_to_organise, media_types, { "duplicates": "skip" })
+
+    assert file_count == 1
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1.jpg", "JPG File")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/file2.jpg", "JPG File")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/file3.jpg", "Existing JPG File")
+    assert not fs.exists("./test_dir/dir_to_organise/2013")
+
+@pytest.mark.parametrize("destination, organised_dir", [
+    ("{year}", "2009"),
+    ("{year}/{month:02}/{day:02}", "2009/10/05"),
+    ("videos/{year}", "videos/2009")
+])
+def test_organise_media_skips_duplicates_of_files_organised_into_other_destinations(fs, destination, organised_dir):
+    create_test_files(fs, [
+        FakeFile("./test_dir/file1.jpg", "Existing JPG File", datetime.datetime(2009, 10, 5)),
+        FakeFile(f"./test_dir/{organised_dir}/file1.jpg", "Existing JPG File", datetime.datetime(2009, 10, 5))
+    ])
+
+    file_count = organise_media("./test_dir/", [".jpg"], { "date_source": "mtime", "duplicates": "skip", "destination": destination })
+
+    assert file_count == 0
+    assert_file_exists_with_content(fs, "./test_dir/file1.jpg", "Existing JPG File")
+    assert os.listdir(f"./test_dir/{organised_dir}") == ["file1.jpg"]
+
+def test_organise_media_hardlinks_duplicated_files_to_their_originals(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/file2.jpg", "JPG File", datetime.datetime(2013, 7, 10))
+    ])
+    file_count = organise_media(dir_to_organise, media_types, { "duplicates": "hardlink" })
+
+    assert file_count == 2
+    assert not fs.exists("./test_dir/dir_to_organise/file1.jpg")
+    assert not fs.exists("./test_dir/dir_to_organise/file2.jpg")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1.jpg", "JPG File")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2013/07_July/file2.jpg", "JPG File")
+    assert os.path.samefile("./test_dir/dir_to_organise/2009/10_October/file1.jpg", "./test_dir/dir_to_organise/2013/07_July/file2.jpg")
+
+def test_organise_media_hardlinks_files_and_keeps_originals_in_hardlink_mode(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/2009/10_October/file1.jpg", "Other JPG File", datetime.datetime(2009, 10, 5))
+    ])
+    file_count = organise_media(dir_to_organise, media_types, { "organise_mode": "hardlink" })
+
+    assert file_count == 1
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/file1.jpg", "JPG File")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1.jpg", "Other JPG File")
+    assert os.path.samefile("./test_dir/dir_to_organise/file1.jpg", "./test_dir/dir_to_organise/2009/10_October/file1 (2).jpg")
+
+def test_organise_media_does_not_link_files_again_in_hardlink_mode(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/2009/10_October/file1.jpg", "Other JPG File", datetime.datetime(2009, 10, 5))
+    ])
+    organise_media(dir_to_organise, media_types, { "organise_mode": "hardlink" })
+    file_count = organise_media(dir_to_organise, media_types, { "organise_mode": "hardlink", "duplicates": "move" })
+
+    assert file_count == 0
+    assert sorted(os.listdir("./test_dir/dir_to_organise/2009/10_October")) == ["file1 (2).jpg", "file1.jpg"]
+    assert not fs.exists("./test_dir/dir_to_organise/duplicates")
+
+def test_organise_media_copies_files_when_they_cannot_be_cloned_in_reflink_mode(fs, monkeypatch):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+    monkeypatch.setattr(transfer, "clone_file_contents", lambda src_fd, dest_fd: False)
+
+    create_test_files(fs, [FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5))])
+    file_count = organise_media(dir_to_organise, media_types, { "organise_mode": "reflink" })
+
+    assert file_count == 1
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/file1.jpg", "JPG File")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1.jpg", "JPG File")
+    assert not os.path.samefile("./test_dir/dir_to_organise/file1.jpg", "./test_dir/dir_to_organise/2009/10_October/file1.jpg")
+    assert os.stat("./test_dir/dir_to_organise/2009/10_October/file1.jpg").st_mtime == os.stat("./test_dir/dir_to_organise/file1.jpg").st_mtime
+
+def test_organise_media_moves_duplicated_files_to_duplicates_dir(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/2009/10_October/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5))
+    ])
+    organise_media(dir_to_organise, media_types, { "duplicates": "move" })
+
+    assert not fs.exists("./test_dir/dir_to_organise/file1.jpg")
+    assert not fs.exists("./test_dir/dir_to_organise/2009/10_October/file1 (2).jpg")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/duplicates/file1.jpg", "JPG File")
+
+def test_organise_media_records_moved_files_in_scan_index(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5))])
+
+    with ScanIndex(":memory:") as scan_index:
+        organise_media(dir_to_organise, media_types, None, scan_index)
+        recorded_files = scan_index.get_files(dir_to_organise, STATUS_ORGANISED)
+
+    assert list(recorded_files) == [os.path.abspath("./test_dir/dir_to_organise/2009/10_October/file1.jpg")]
+
+def test_organise_media_does_not_rehash_unchanged_skipped_duplicates_with_scan_index(fs, monkeypatch):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/2009/10_October/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5))
+    ])
+
+    with ScanIndex(":memory:") as scan_index:
+        organise_media(dir_to_organise, media_types, { "duplicates": "skip" }, scan_index)
+
+        def fail(*args):
+            raise AssertionError("The directory should not be read again")
+
+        monkeypatch.setattr(duplicates, "partial_hash", fail)
+        monkeypatch.setattr(file_operations, "get_organised_files", fail)
+        file_count = organise_media(dir_to_organise, media_types, { "duplicates": "skip" }, scan_index)
+
+    assert file_count == 0
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/file1.jpg", "JPG File")
+
+def test_organise_media_finds_duplicates_of_indexed_organised_files(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File", datetime.datetime(2009, 10, 5))])
+
+    with ScanIndex(":memory:") as scan_index:
+        organise_media(dir_to_organise, media_types, { "duplicates": "move" }, scan_index)
+        create_test_files(fs, [FakeFile("./test_dir/dir_to_organise/file2.jpg", "JPG File", datetime.datetime(2013, 7, 10))])
+        organise_media(dir_to_organise, media_types, { "duplicates": "move" }, scan_index)
+
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1.jpg", "JPG File")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/duplicates/file2.jpg", "JPG File")
+
+def test_plan_media_resolves_destinations_and_name_clashes_without_moving_files(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    test_files = [
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/2009/10_October/file1.jpg", "Existing JPG File 1", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/file2.jpg", "JPG File 2", datetime.datetime(2013, 7, 10))
+    ]
+
+    create_test_files(fs, test_files)
+    plan = plan_media(dir_to_organise, media_types)
+
+    for test_file in test_files:
+        assert fs.exists(test_file.path)
+
+    assert sorted((move.action, move.dest_file_path, move.size) for move in plan) == [
+        ("move", os.path.join(dir_to_organise, "2009", "10_October", "file1 (2).jpg"), 10),
+        ("move", os.path.join(dir_to_organise, "2013", "07_July", "file2.jpg"), 10)
+    ]
+    assert not fs.exists("./test_dir/dir_to_organise/2013")
+
+def test_execute_plan_resolves_names_taken_after_planning(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    media_types = [".jpg"]
+
+    create_test_files(fs, [FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5))])
+    plan = plan_media(dir_to_organise, media_types)
+
+    create_test_files(fs, [FakeFile("./test_dir/dir_to_organise/2009/10_October/file1.jpg", "New JPG File 1", datetime.datetime(2009, 10, 5))])
+    file_count = execute_plan(plan)
+
+    assert file_count == 1
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1.jpg", "New JPG File 1")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1 (2).jpg", "JPG File 1")
+
+def test_organise_media_matches_extensions_case_insensitively(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+
+    create_test_files(fs, [FakeFile("./test_dir/dir_to_organise/file1.JPG", "JPG File 1", datetime.datetime(2009, 10, 5))])
+    organise_media(dir_to_organise, [".jpg"], { "date_source": "mtime" })
+
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1.JPG", "JPG File 1")
+
+def test_organise_media_moves_files_matching_rules_to_their_destination(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+    rules = [{ "patterns": ["IMG-*-WA*"], "destination": "whatsapp/{year}/{month:02}-{day:02}" }]
+
+    test_files = [
+        FakeFile("./test_dir/dir_to_organise/IMG-20091005-WA0001.jpg", "WhatsApp JPG File", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/whatsapp/2009/10-05/IMG-20091005-WA0002.jpg", "Organised WhatsApp JPG File", datetime.datetime(2009, 10, 5))
+    ]
+
+    create_test_files(fs, test_files)
+    organise_media(dir_to_organise, [".jpg"], { "date_source": "mtime", "recursive": True, "rules": rules })
+
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/whatsapp/2009/10-05/IMG-20091005-WA0001.jpg", "WhatsApp JPG File")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/whatsapp/2009/10-05/IMG-20091005-WA0002.jpg", "Organised WhatsApp JPG File")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file1.jpg", "JPG File 1")
+
+def test_plan_media_only_plans_given_paths(fs):
+    dir_to_organise = "./test_dir/dir_to_organise/"
+
+    test_files = [
+        FakeFile("./test_dir/dir_to_organise/file1.jpg", "JPG File 1", datetime.datetime(2009, 10, 5)),
+        FakeFile("./test_dir/dir_to_organise/file2.jpg", "JPG File 2", datetime.datetime(2013, 7, 10)),
+        FakeFile("./test_dir/dir_to_organise/notes.txt", "Text File", datetime.datetime(2013, 7, 10))
+    ]
+
+    create_test_files(fs, test_files)
+    plan = plan_media(dir_to_organise, [".jpg"], { "date_source": "mtime" }, paths = [
+        os.path.join(dir_to_organise, "file2.jpg"),
+        os.path.join(dir_to_organise, "notes.txt"),
+        os.path.join(dir_to_organise, "missing.jpg")
+    ])
+
+    assert [move.dest_file_path for move in plan] == [os.path.join(dir_to_organise, "2013", "07_July", "file2.jpg")]
+
+def test_stream_media_moves_files_without_overwriting_existing_ones(fs, monkeypatch):
+    monkeypatch.setattr(file_operations, "STREAM_NAME_INDEX_CACHE_SIZE", 1)
+    dir_to_organise = "./test_dir/dir_to_organise/"
+
+    test_files = [FakeFile(f"./test_dir/dir_to_organise/file{index}.jpg", f"JPG File {index}", datetime.datetime(2009 + index % 3, 10, 5)) for index in range(300)]
+    test_files.append(FakeFile("./test_dir/dir_to_organise/2009/10_October/file0.jpg", "Existing JPG File 0", datetime.datetime(2009, 10, 5)))
+    test_files.append(FakeFile("./test_dir/dir_to_organise/notes.txt", "Text File", datetime.datetime(2009, 10, 5)))
+
+    create_test_files(fs, test_files)
+    file_count = organise_media(dir_to_organise, [".jpg"], { "date_source": "mtime", "streaming": True })
+
+    assert file_count == 300
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file0.jpg", "Existing JPG File 0")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2009/10_October/file0 (2).jpg", "JPG File 0")
+    assert_file_exists_with_content(fs, "./test_dir/dir_to_organise/2011/10_October/file299.jpg", "JPG File 299")
+    assert fs.exists("./test_dir/dir_to_organise/notes.txt")
@@ -0,0 +1,93 @@
+import io
+import logging
+import queue
+import time
+from organise_media.organise_media.logger_config import (
+    FILE_EVENTS_LOGGER_NAME, BatchingFileHandler, FlushingQueueListener, RateLimitedStreamHandler, apply_logging_options
+)
+
+def make_record(msg, level = logging.INFO):
+    return logging.LogRecord("test", level, __file__, 1, msg, None, None)
+
+def read_log_file(path):
+    with open(path, "r") as file:
+        return file.read()
+
+def test_batching_file_handler_only_flushes_complete_batches(tmp_path):
+    log_file_path = str(tmp_path / "test.log")
+    handler = BatchingFileHandler(log_file_path, flush_records = 3, flush_seconds = 3600)
+
+    handler.emit(make_record("first"))
+    handler.emit(make_record("second"))
+    assert read_log_file(log_file_path) == ""
+
+    handler.emit(make_record("third"))
+    assert read_log_file(log_file_path) == "first\nsecond\nthird\n"
+
+    handler.close()
+
+def test_batching_file_handler_flushes_errors_straight_away(tmp_path):
+    log_file_path = str(tmp_path / "test.log")
+    handler = BatchingFileHandler(log_file_path, flush_records = 100, flush_seconds = 3600)
+
+    handler.emit(make_record("info"))
+    handler.emit(make_record("error", logging.ERROR))
+
+    assert read_log_file(log_file_path) == "info\nerror\n"
+
+    handler.close()
+
+def test_batching_file_handler_flushes_pending_records_when_closed(tmp_path):
+    log_file_path = str(tmp_path / "test.log")
+    handler = BatchingFileHandler(log_file_path, flush_records = 100, flush_seconds = 3600)
+
+    handler.emit(make_record("info"))
+    handler.close()
+
+    assert read_log_file(log_file_path) == "info\n"
+
+def test_flushing_queue_listener_flushes_pending_records_while_idle(tmp_path):
+    log_file_path = str(tmp_path / "test.log")
+    handler = BatchingFileHandler(log_file_path, flush_records = 100, flush_seconds = 3600)
+    log_queue = queue.SimpleQueue()
+    listener = FlushingQueueListener(log_queue, handler, flush_seconds = 0.05)
+    listener.start()
+
+    log_queue.put(make_record("info"))
+    deadline = time.monotonic() + 5
+    while read_log_file(log_file_path) == "" and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert read_log_file(log_file_path) == "info\n"
+
+    listener.stop()
+    handler.close()
+
+def test_rate_limited_stream_handler_suppresses_records_over_the_limit_and_reports_them():
+    stream = io.StringIO()
+    handler = RateLimitedStreamHandler(stream, rate_limit = 2)
+
+    for index in range(5):
+        handler.emit(make_record(f"record {str(index)}"))
+    handler.emit(make_record("error", logging.ERROR))
+
+    assert stream.getvalue() == "record 0\nrecord 1\n... 3 log entries were only written to the log file\nerror\n"
+
+def test_rate_limited_stream_handler_does_not_limit_when_rate_limit_is_zero():
+    stream = io.StringIO()
+    handler = RateLimitedStreamHandler(stream, rate_limit = 0)
+
+    for index in range(5):
+        handler.emit(make_record(f"record {str(index)}"))
+
+    assert stream.getvalue().count("\n") == 5
+
+def test_apply_logging_options_sets_file_events_log_level():
+    file_events = logging.getLogger(FILE_EVENTS_LOGGER_NAME)
+    level = file_events.level
+
+    try:
+        apply_logging_options({ "file_log_level": "INFO", "console_rate_limit": 50 })
+        assert file_events.getEffectiveLevel() == logging.INFO
+    finally:
+        file_events.setLevel(level)
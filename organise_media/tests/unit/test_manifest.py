@@ -0,0 +1,110 @@
+import os
+from organise_media.organise_media import transfer
+from organise_media.organise_media.duplicates import full_hash
+from organise_media.organise_media.file_operations import execute_plan, organise_media, plan_media
+from organise_media.organise_media.manifest import (
+    STATUS_HASH_MISMATCH, STATUS_MISSING, STATUS_MTIME_CHANGED, STATUS_OK, STATUS_SIZE_MISMATCH, RunManifest, read_manifest, verify_manifest
+)
+from organise_media.organise_media.metrics import RunMetrics
+from organise_media.organise_media.transfer import TransferEngine
+
+MAY_2020 = 1589100000
+
+def write_file(path, contents, mtime = MAY_2020):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, "wb") as file:
+        file.write(contents)
+    os.utime(path, (mtime, mtime))
+
+def organise_with_manifest(dir, options, manifest_path):
+    with RunManifest(manifest_path) as manifest:
+        return organise_media(dir, [".jpg"], { "date_source": "mtime", **options }, manifest = manifest)
+
+def test_organise_media_records_the_moved_files_in_the_manifest(tmp_path):
+    dir = str(tmp_path / "media")
+    write_file(os.path.join(dir, "a.jpg"), b"first")
+    write_file(os.path.join(dir, "b.jpg"), b"second")
+
+    organise_with_manifest(dir, {}, str(tmp_path / "manifest.jsonl"))
+
+    records = sorted(read_manifest(str(tmp_path / "manifest.jsonl")), key = lambda record: record["path"])
+    assert [record["path"] for record in records] == [os.path.join(dir, "2020", "05_May", name) for name in ["a.jpg", "b.jpg"]]
+    assert records[0]["size"] == 5
+    assert records[0]["mtime"] == MAY_2020
+    assert records[0]["blake2b"] == full_hash(records[0]["path"], 5)
+
+def test_organise_media_reuses_the_hashes_of_the_duplicates(tmp_path, monkeypatch):
+    dir = str(tmp_path / "media")
+    write_file(os.path.join(dir, "a.jpg"), b"same" * 10000)
+    write_file(os.path.join(dir, "b.jpg"), b"same" * 10000)
+    hashed_paths = list()
+    monkeypatch.setattr("organise_media.organise_media.file_operations.full_hash", lambda path, size: hashed_paths.append(path))
+
+    organise_with_manifest(dir, { "duplicates": "move" }, str(tmp_path / "manifest.jsonl"))
+
+    assert hashed_paths == []
+    assert len(list(read_manifest(str(tmp_path / "manifest.jsonl")))) == 2
+
+def test_transfer_engine_hashes_files_while_copying_them(tmp_path, monkeypatch):
+    src_file_path = str(tmp_path / "file.jpg")
+    write_file(src_file_path, b"contents" * 1000)
+    expected_hash = full_hash(src_file_path, 8000)
+    monkeypatch.setattr(transfer, "ZERO_COPY_CHUNK_FUNCTIONS", [])
+
+    with TransferEngine(2, hash_copies = True) as transfer_engine:
+        transfer_engine.submit(src_file_path, str(tmp_path / "copy.jpg"))
+
+    assert transfer_engine.digests == { src_file_path: expected_hash }
+    assert (tmp_path / "copy.jpg").read_bytes() == b"contents" * 1000
+    assert not os.path.exists(src_file_path)
+
+def test_verify_manifest_reports_missing_and_changed_files_in_manifest_order(tmp_path):
+    dir = str(tmp_path / "media")
+    for name in ["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg"]:
+        write_file(os.path.join(dir, name), b"contents")
+    organise_with_manifest(dir, {}, str(tmp_path / "manifest.jsonl"))
+
+    month_dir = os.path.join(dir, "2020", "05_May")
+    os.unlink(os.path.join(month_dir, "b.jpg"))
+    write_file(os.path.join(month_dir, "c.jpg"), b"changed!")
+    write_file(os.path.join(month_dir, "d.jpg"), b"longer contents")
+    os.utime(os.path.join(month_dir, "e.jpg"), (MAY_2020 + 1, MAY_2020 + 1))
+
+    results = list(verify_manifest(str(tmp_path / "manifest.jsonl"), max_workers = 2))
+
+    assert [record["path"] for record, status in results] == [record["path"] for record in read_manifest(str(tmp_path / "manifest.jsonl"))]
+    assert { os.path.basename(record["path"]): status for record, status in results } == {
+        "a.jpg": STATUS_OK,
+        "b.jpg": STATUS_MISSING,
+        "c.jpg": STATUS_HASH_MISMATCH,
+        "d.jpg": STATUS_SIZE_MISMATCH,
+        "e.jpg": STATUS_MTIME_CHANGED
+    }
+
+def test_verify_manifest_checks_packed_files_in_their_archive(tmp_path):
+    dir = str(tmp_path / "media")
+    write_file(os.path.join(dir, "small.jpg"), b"small")
+    write_file(os.path.join(dir, "large.jpg"), b"large file" * 100)
+
+    organise_with_manifest(dir, { "pack_threshold": 100 }, str(tmp_path / "manifest.jsonl"))
+
+    assert not os.path.exists(os.path.join(dir, "2020", "05_May", "small.jpg"))
+    assert [status for record, status in verify_manifest(str(tmp_path / "manifest.jsonl"))] == [STATUS_OK, STATUS_OK]
+
+def test_execute_plan_keeps_moving_and_records_the_moved_files_when_a_planned_file_is_gone(tmp_path):
+    dir = str(tmp_path / "media")
+    names = ["a.jpg", "b.jpg", "c.jpg", "d.jpg", "e.jpg"]
+    for name in names:
+        write_file(os.path.join(dir, name), name.encode())
+    options = { "date_source": "mtime", "move_order": "plan" }
+    plan = plan_media(dir, [".jpg"], options)
+    os.unlink(os.path.join(dir, "c.jpg"))
+    metrics = RunMetrics()
+
+    with RunManifest(str(tmp_path / "manifest.jsonl")) as manifest:
+        file_count = execute_plan(plan, options, metrics = metrics, manifest = manifest)
+
+    assert file_count == 4
+    assert sorted(os.path.basename(record["path"]) for record in read_manifest(str(tmp_path / "manifest.jsonl"))) == ["a.jpg", "b.jpg", "d.jpg", "e.jpg"]
+    assert metrics.totals()["counters"]["moved_files"] == 4
+    assert metrics.totals()["counters"]["errors"] == 1
@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+import pytest
+from organise_media.organise_media.metadata import MetadataPool
+from organise_media.organise_media.name_index import NameIndexCache
+
+def test_metadata_pool_returns_results_in_the_order_of_the_items():
+    pool = MetadataPool(8)
+
+    assert pool.map(lambda number: number * 2, range(20)) == [number * 2 for number in range(20)]
+
+def test_metadata_pool_raises_errors_of_the_calls():
+    def fail_on_three(number):
+        if number == 3:
+            raise OSError("Failed")
+        return number
+
+    with pytest.raises(OSError):
+        MetadataPool(4).map(fail_on_three, range(6))
+
+def test_metadata_pool_limits_concurrent_calls_on_configured_mount_points():
+    pool = MetadataPool(8, { "/mnt/nas": 2 })
+    lock = threading.Lock()
+    active = { "/mnt/nas": 0, "/local": 0 }
+    highest = { "/mnt/nas": 0, "/local": 0 }
+
+    def slow_call(path):
+        mount = "/mnt/nas" if path.startswith("/mnt/nas") else "/local"
+        with lock:
+            active[mount] += 1
+            highest[mount] = max(highest[mount], active[mount])
+        time.sleep(0.02)
+        with lock:
+            active[mount] -= 1
+
+    pool.map(slow_call, [f"/mnt/nas/photos/{str(number)}.jpg" for number in range(8)] + [f"/local/{str(number)}.jpg" for number in range(8)])
+
+    assert highest["/mnt/nas"] <= 2
+    assert highest["/local"] > 2
+
+def test_metadata_pool_does_not_apply_mount_limit_to_sibling_paths():
+    pool = MetadataPool(8, { "/mnt/nas": 2 })
+
+    assert pool.get_mount_limit("/mnt/nas/photos/file.jpg") == ("/mnt/nas", 2)
+    assert pool.get_mount_limit("/mnt/nas") == ("/mnt/nas", 2)
+    assert pool.get_mount_limit("/mnt/nas2/file.jpg") is None
+
+def test_name_index_cache_loads_directories_concurrently_once(tmp_path):
+    dirs = [str(tmp_path / str(number)) for number in range(4)]
+    for dir in dirs:
+        os.makedirs(dir)
+    name_indexes = NameIndexCache()
+
+    indexes = MetadataPool(8).map(name_indexes.get, dirs + dirs)
+
+    assert [id(index) for index in indexes[:4]] == [id(index) for index in indexes[4:]]
@@ -0,0 +1,82 @@
+import datetime
+import json
+import logging
+from organise_media.organise_media.file_operations import organise_media
+from organise_media.organise_media.metrics import ProgressReporter, RunMetrics, write_metrics_report
+from organise_media.tests.test_helpers import FakeFile, create_test_files
+
+def test_run_metrics_adds_up_the_metrics_of_each_dir():
+    metrics = RunMetrics()
+
+    metrics.for_dir("/dir1").count("moved_files", 2)
+    metrics.for_dir("/dir2").count("moved_files")
+    metrics.for_dir("/dir2").add_time("move", 0.5)
+
+    totals = metrics.totals()
+
+    assert totals["counters"]["moved_files"] == 3
+    assert totals["timers"]["move"] == 0.5
+    assert metrics.for_dir("/dir1") is metrics.for_dir("/dir1")
+
+def test_dir_metrics_timer_adds_the_time_spent_in_the_context():
+    metrics = RunMetrics()
+
+    with metrics.for_dir("/dir").timer("scan"):
+        pass
+    with metrics.for_dir("/dir").timer("scan"):
+        pass
+
+    assert metrics.totals()["timers"]["scan"] > 0
+
+def test_write_metrics_report_writes_totals_and_dirs_with_rates(fs):
+    metrics = RunMetrics()
+    metrics.for_dir("/dir").count("moved_files", 4)
+    metrics.for_dir("/dir").count("moved_bytes", 400)
+
+    write_metrics_report(metrics, "/reports/run.json", { "move_order": "inode" })
+
+    with open("/reports/run.json", "r") as report_file:
+        report = json.load(report_file)
+
+    assert report["totals"]["counters"]["moved_files"] == 4
+    assert report["dirs"]["/dir"]["counters"]["moved_bytes"] == 400
+    assert report["totals"]["files_per_sec"] > 0
+    assert report["totals"]["bytes_per_sec"] > 0
+    assert report["settings"] == { "move_order": "inode" }
+
+def test_organise_media_records_counters_of_each_phase(fs):
+    test_files = [
+        FakeFile("/test_dir/file.jpg", "JPG File", datetime.datetime(2020, 5, 10)),
+        FakeFile("/test_dir/2020/05_May/file.jpg", "Organised JPG File", datetime.datetime(2020, 5, 10)),
+        FakeFile("/test_dir/other.png", "PNG File", datetime.datetime(2021, 7, 10))
+    ]
+    create_test_files(fs, test_files)
+    metrics = RunMetrics()
+
+    organise_media("/test_dir", [".jpg", ".png"], { "date_source": "mtime" }, metrics = metrics)
+
+    counters = metrics.for_dir("/test_dir").snapshot()["counters"]
+    assert counters["scanned_files"] == 2
+    assert counters["planned_files"] == 2
+    assert counters["moved_files"] == 2
+    assert counters["moved_bytes"] == len("JPG File") + len("PNG File")
+    assert counters["renames"] == 2
+    assert counters["cross_device_copies"] == 0
+    assert counters["planned_collisions"] == 1
+    assert counters["collisions"] == 1
+    assert counters["dest_dirs"] == 2
+    assert counters["errors"] == 0
+
+def test_progress_reporter_logs_progress_lines_while_active(caplog):
+    metrics = RunMetrics()
+    metrics.for_dir("/dir").count("planned_files", 10)
+
+    with caplog.at_level(logging.INFO):
+        with ProgressReporter(metrics, 0.01) as reporter:
+            reporter.stopped.wait(0.1)
+
+    assert any(message.startswith("Progress: moved 0 of 10 planned files") for message in caplog.messages)
+
+def test_progress_reporter_does_not_start_a_thread_when_interval_is_zero():
+    with ProgressReporter(RunMetrics(), 0) as reporter:
+        assert reporter.thread is None
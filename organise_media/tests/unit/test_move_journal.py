@@ -0,0 +1,221 @@
+import datetime
+import os
+import pytest
+import shutil
+from organise_media.organise_media import file_operations
+from organise_media.organise_media.file_operations import execute_plan, plan_media
+from organise_media.organise_media.move_journal import MoveJournal, find_unfinished_journals, new_journal_path, read_journal, recover_journal, recover_move
+from organise_media.organise_media.move_plan import ACTION_HARDLINK, ACTION_LINK, ACTION_MOVE, PlannedMove
+from organise_media.organise_media.packing import pack_files
+from organise_media.organise_media.user_prompt import resume_run
+from organise_media.tests.test_helpers import FakeFile, create_test_files, assert_file_exists_with_content
+
+def planned_move(src_file_path, dest_file_path, action = ACTION_MOVE, cross_device = False, original_path = None):
+    return PlannedMove(action, "/test_dir", src_file_path, dest_file_path, 8, 0.0, 1, cross_device, original_path, None)
+
+def begin_record(src_file_path, dest_file_path, action = ACTION_MOVE, cross_device = False, original_path = None):
+    return { "src": src_file_path, "dest": dest_file_path, "action": action, "cross_device": cross_device, "original_path": original_path }
+
+def test_journal_records_plan_begun_and_committed_moves(fs):
+    move = planned_move("/test_dir/file.jpg", "/test_dir/2020/05_May/file.jpg")
+
+    with MoveJournal("/journal/run.jsonl") as journal:
+        journal.record_plan([move])
+        journal.begin([(move, "/test_dir/2020/05_May/file (2).jpg", None)])
+        journal.commit("/test_dir/file.jpg", "/test_dir/2020/05_May/file (2).jpg")
+
+    plan, begun, committed, ended = read_journal("/journal/run.jsonl")
+
+    assert plan == [move]
+    assert begun["/test_dir/file.jpg"]["dest"] == "/test_dir/2020/05_May/file (2).jpg"
+    assert committed["/test_dir/file.jpg"]["dest"] == "/test_dir/2020/05_May/file (2).jpg"
+    assert not ended
+
+def test_read_journal_ignores_last_record_cut_short(fs):
+    with MoveJournal("/journal/run.jsonl") as journal:
+        journal.record_plan([planned_move("/test_dir/file.jpg", "/test_dir/2020/05_May/file.jpg")])
+
+    with open("/journal/run.jsonl", "a") as journal_file:
+        journal_file.write('{"type": "begin", "src": "/test_')
+
+    plan, begun, committed, ended = read_journal("/journal/run.jsonl")
+
+    assert len(plan) == 1
+    assert begun == {}
+
+def test_find_unfinished_journals_returns_journals_without_end_record(fs):
+    with MoveJournal("/journal/run_1.jsonl") as journal:
+        journal.end()
+    with MoveJournal("/journal/run_2.jsonl") as journal:
+        journal.record_plan([])
+    fs.create_file("/journal/run_3.jsonl", contents = '{"type": "end", "ended_at": 0}\n')
+
+    assert find_unfinished_journals("/journal") == ["/journal/run_2.jsonl"]
+    assert sorted(os.listdir("/journal")) == ["run_1.ended.jsonl", "run_2.jsonl", "run_3.ended.jsonl"]
+    assert find_unfinished_journals("/missing") == []
+
+def test_journals_of_runs_started_in_the_same_second_are_all_kept(fs):
+    paths = list()
+    for _ in range(2):
+        with MoveJournal(new_journal_path("/journal")) as journal:
+            journal.end()
+        paths.append(journal.path)
+
+    assert paths[0] != paths[1]
+    assert sorted(os.listdir("/journal")) == sorted(os.path.basename(path) for path in paths)
+
+def test_closing_ended_journal_never_replaces_existing_ended_journal(fs):
+    fs.create_file("/journal/run_1.ended.jsonl", contents = "earlier run\n")
+
+    with MoveJournal("/journal/run_1.jsonl") as journal:
+        journal.end()
+
+    assert journal.path == "/journal/run_1.jsonl"
+    assert_file_exists_with_content(fs, "/journal/run_1.ended.jsonl", "earlier run\n")
+
+def test_recover_move_completes_rename_when_source_is_gone(fs):
+    fs.create_file("/test_dir/2020/05_May/file.jpg")
+
+    assert recover_move(begin_record("/test_dir/file.jpg", "/test_dir/2020/05_May/file.jpg"))
+
+def test_recover_move_completes_rename_when_destination_was_packed_since(fs):
+    fs.create_file("/test_dir/2020/05_May/file.jpg", contents = "Small")
+    pack_files("/test_dir/2020/05_May", ["/test_dir/2020/05_May/file.jpg"])
+
+    assert recover_move(begin_record("/test_dir/file.jpg", "/test_dir/2020/05_May/file.jpg"))
+    assert not recover_move(begin_record("/test_dir/other.jpg", "/test_dir/2020/05_May/other.jpg"))
+
+def test_execute_plan_writes_commits_before_packing_moved_files(fs, monkeypatch):
+    create_test_files(fs, [FakeFile("/test_dir/file.jpg", "Small", datetime.datetime(2020, 5, 10))])
+    committed_when_packed = list()
+
+    def record_commits_and_pack(*args):
+        committed_when_packed.extend(read_journal("/journal/run.jsonl")[2])
+        return pack_files(*args)
+
+    monkeypatch.setattr(file_operations, "pack_files", record_commits_and_pack)
+    plan = plan_media("/test_dir", [".jpg"], { "date_source": "mtime" })
+
+    with MoveJournal("/journal/run.jsonl") as journal:
+        journal.record_plan(plan)
+        execute_plan(plan, { "pack_threshold": 10 }, journal = journal)
+
+    assert committed_when_packed == ["/test_dir/file.jpg"]
+
+def test_recover_move_rolls_back_interrupted_copy(fs):
+    fs.create_file("/test_dir/file.jpg", contents = "JPG File")
+    fs.create_file("/other_fs/2020/05_May/file.jpg", contents = "JPG")
+
+    assert not recover_move(begin_record("/test_dir/file.jpg", "/other_fs/2020/05_May/file.jpg", cross_device = True))
+    assert not fs.exists("/other_fs/2020/05_May/file.jpg")
+    assert fs.exists("/test_dir/file.jpg")
+
+def test_recover_move_rolls_back_partial_copy_of_a_rename_and_finishes_a_complete_one(fs):
+    fs.create_file("/test_dir/file.jpg", contents = "JPG File")
+    fs.create_file("/test_dir/2020/05_May/file.jpg", contents = "JPG")
+
+    assert not recover_move(begin_record("/test_dir/file.jpg", "/test_dir/2020/05_May/file.jpg"))
+    assert not fs.exists("/test_dir/2020/05_May/file.jpg")
+
+    shutil.copy2("/test_dir/file.jpg", "/test_dir/2020/05_May/file.jpg")
+
+    assert recover_move(begin_record("/test_dir/file.jpg", "/test_dir/2020/05_May/file.jpg"))
+    assert not fs.exists("/test_dir/file.jpg")
+
+def test_recover_move_finishes_hardlink_whose_source_was_not_removed(fs):
+    fs.create_file("/test_dir/2020/05_May/original.jpg", contents = "JPG File")
+    fs.create_file("/test_dir/file.jpg", contents = "JPG File")
+    os.link("/test_dir/2020/05_May/original.jpg", "/test_dir/2020/05_May/file.jpg")
+
+    assert recover_move(begin_record("/test_dir/file.jpg", "/test_dir/2020/05_May/file.jpg", ACTION_HARDLINK, original_path = "/test_dir/2020/05_May/original.jpg"))
+    assert not fs.exists("/test_dir/file.jpg")
+
+def test_recover_move_rolls_back_interrupted_link_copy_and_keeps_complete_link(fs):
+    fs.create_file("/test_dir/file.jpg", contents = "JPG File")
+    fs.create_file("/test_dir/2020/05_May/file.jpg", contents = "JPG")
+    os.link("/test_dir/file.jpg", "/test_dir/2020/05_May/linked.jpg")
+
+    assert not recover_move(begin_record("/test_dir/file.jpg", "/test_dir/2020/05_May/file.jpg", ACTION_LINK))
+    assert not fs.exists("/test_dir/2020/05_May/file.jpg")
+    assert recover_move(begin_record("/test_dir/file.jpg", "/test_dir/2020/05_May/linked.jpg", ACTION_LINK))
+    assert fs.exists("/test_dir/file.jpg")
+
+def test_execute_plan_records_begin_and_commit_of_each_move(fs):
+    test_files = [
+        FakeFile("/test_dir/file.jpg", "JPG File", datetime.datetime(2020, 5, 10)),
+        FakeFile("/test_dir/other.jpg", "Other JPG File", datetime.datetime(2021, 7, 10))
+    ]
+    create_test_files(fs, test_files)
+    options = { "date_source": "mtime" }
+
+    with MoveJournal("/journal/run.jsonl") as journal:
+        execute_plan(plan_media("/test_dir", [".jpg"], options), options, journal = journal)
+
+    plan, begun, committed, ended = read_journal("/journal/run.jsonl")
+
+    assert sorted(begun) == ["/test_dir/file.jpg", "/test_dir/other.jpg"]
+    assert committed["/test_dir/file.jpg"]["dest"] == "/test_dir/2020/05_May/file.jpg"
+    assert committed["/test_dir/other.jpg"]["dest"] == "/test_dir/2021/07_July/other.jpg"
+
+class FsyncCountingJournal(MoveJournal):
+    fsyncs = 0
+
+    def flush_buffer(self):
+        self.fsyncs += bool(self.buffer)
+        super().flush_buffer()
+
+@pytest.mark.parametrize("move_order", ["plan", "destination", "inode", "physical"])
+def test_execute_plan_fsyncs_begin_records_once_per_batch_in_every_move_order(fs, move_order):
+    create_test_files(fs, [
+        FakeFile(f"/test_dir/file{index}.jpg", f"JPG File {index}", datetime.datetime(2009, 1 + index % 2, 5)) for index in range(20)
+    ])
+    options = { "date_source": "mtime", "move_order": move_order }
+    plan = plan_media("/test_dir", [".jpg"], options)
+
+    with FsyncCountingJournal("/journal/run.jsonl") as journal:
+        file_count = execute_plan(plan, options, journal = journal)
+        fsyncs = journal.fsyncs
+
+    assert file_count == 20
+    assert fsyncs == 1
+
+def test_recover_journal_returns_moves_left_and_skips_completed_moves(fs):
+    first_move = planned_move("/test_dir/first.jpg", "/test_dir/2020/05_May/first.jpg")
+    second_move = planned_move("/test_dir/second.jpg", "/test_dir/2020/05_May/second.jpg")
+    third_move = planned_move("/test_dir/third.jpg", "/test_dir/2020/05_May/third.jpg")
+    fs.create_file("/test_dir/2020/05_May/first.jpg")
+    fs.create_file("/test_dir/2020/05_May/second.jpg")
+    fs.create_file("/test_dir/third.jpg")
+
+    with MoveJournal("/journal/run.jsonl") as journal:
+        journal.record_plan([first_move, second_move, third_move])
+        journal.begin([(first_move, first_move.dest_file_path, None), (second_move, second_move.dest_file_path, None)])
+        journal.commit(first_move.src_file_path, first_move.dest_file_path)
+        journal.flush()
+
+        remaining, completed = recover_journal(journal)
+
+    assert remaining == [third_move]
+    assert completed == { "/test_dir/first.jpg": "/test_dir/2020/05_May/first.jpg", "/test_dir/second.jpg": "/test_dir/2020/05_May/second.jpg" }
+    assert "/test_dir/second.jpg" in read_journal("/journal/run.jsonl")[2]
+
+def test_resume_run_moves_files_left_and_ends_journal(fs):
+    test_files = [
+        FakeFile("/test_dir/2020/05_May/first.jpg", "JPG File 1", datetime.datetime(2020, 5, 10)),
+        FakeFile("/test_dir/second.jpg", "JPG File 2", datetime.datetime(2020, 5, 10))
+    ]
+    create_test_files(fs, test_files)
+    first_move = planned_move("/test_dir/first.jpg", "/test_dir/2020/05_May/first.jpg")
+    second_move = planned_move("/test_dir/second.jpg", "/test_dir/2020/05_May/second.jpg")
+
+    with MoveJournal("/journal/run_1.jsonl") as journal:
+        journal.record_plan([first_move, second_move])
+        journal.begin([(first_move, first_move.dest_file_path, None)])
+
+    resume_run("yes", "/journal/run_1.jsonl", { "metrics_dir": "" })
+
+    assert not fs.exists("/test_dir/second.jpg")
+    assert_file_exists_with_content(fs, "/test_dir/2020/05_May/second.jpg", "JPG File 2")
+    assert not fs.exists("/journal/run_1.jsonl")
+    assert read_journal("/journal/run_1.ended.jsonl")[3]
+    assert find_unfinished_journals("/journal") == []
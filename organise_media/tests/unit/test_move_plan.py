@@ -0,0 +1,45 @@
+import shutil
+from collections import namedtuple
+from organise_media.organise_media.move_plan import ACTION_HARDLINK, ACTION_MOVE, ACTION_SKIP, PlannedMove, check_free_space, read_plan, summarise_plan, write_plan
+from organise_media.tests.test_helpers import create_test_dir
+
+TEST_PLAN = [
+    PlannedMove(ACTION_MOVE, "./test_dir/", "./test_dir/file1.jpg", "./test_dir/2009/10_October/file1.jpg", 100, 1254700800.0, 1, False, None, None),
+    PlannedMove(ACTION_MOVE, "./test_dir/", "./test_dir/sub/file1.jpg", "./test_dir/2009/10_October/file1 (2).jpg", 200, 1254700800.5, 2, True, None, "hash"),
+    PlannedMove(ACTION_HARDLINK, "./test_dir/", "./test_dir/file2.jpg", "./test_dir/2013/07_July/file2.jpg", 100, 1373414400.0, 3, False, "./test_dir/2009/10_October/file1.jpg", "hash"),
+    PlannedMove(ACTION_SKIP, "./test_dir/", "./test_dir/file3.jpg", None, 100, 1373414400.0, 4, False, "./test_dir/2009/10_October/file1.jpg", None)
+]
+
+DiskUsage = namedtuple("DiskUsage", ["total", "used", "free"])
+
+def test_summarise_plan_counts_files_and_bytes():
+    summary = summarise_plan(TEST_PLAN)
+
+    assert summary == { "move": 2, "hardlink": 1, "link": 0, "skip": 1, "renamed": 1, "bytes": 400, "copied_bytes": 200 }
+
+def test_write_plan_and_read_plan_round_trip_json_files(fs):
+    create_test_dir(fs, "./test_dir/plan.json")
+
+    write_plan(TEST_PLAN, "./test_dir/plan.json")
+
+    assert read_plan("./test_dir/plan.json") == TEST_PLAN
+
+def test_write_plan_and_read_plan_round_trip_csv_files(fs):
+    create_test_dir(fs, "./test_dir/plan.csv")
+
+    write_plan(TEST_PLAN, "./test_dir/plan.csv")
+
+    assert read_plan("./test_dir/plan.csv") == TEST_PLAN
+
+def test_check_free_space_returns_zero_errors_when_there_is_enough_space(monkeypatch):
+    monkeypatch.setattr(shutil, "disk_usage", lambda path: DiskUsage(1000, 800, 200))
+
+    assert check_free_space(TEST_PLAN) == []
+
+def test_check_free_space_returns_error_when_copied_bytes_exceed_free_space(monkeypatch):
+    monkeypatch.setattr(shutil, "disk_usage", lambda path: DiskUsage(1000, 901, 99))
+
+    errors = check_free_space(TEST_PLAN)
+
+    assert len(errors) == 1
+    assert errors[0].startswith("Not enough free space to organise directory: ./test_dir/")
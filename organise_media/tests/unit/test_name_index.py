@@ -0,0 +1,64 @@
+from organise_media.organise_media.name_index import NameIndex, NameIndexCache, numbered_name
+from organise_media.tests.test_helpers import FakeFile, create_test_dir, create_test_files
+
+def test_numbered_name_places_number_before_the_real_extension():
+    assert numbered_name("file.jpg", 2) == "file (2).jpg"
+    assert numbered_name("IMG.2020.jpg", 3) == "IMG.2020 (3).jpg"
+    assert numbered_name("README", 2) == "README (2)"
+
+def test_name_index_reserves_free_names_unchanged(fs):
+    create_test_dir(fs, "./test_dir/destination/")
+    name_index = NameIndex("./test_dir/destination/")
+
+    assert name_index.reserve("file.jpg") == "file.jpg"
+
+def test_name_index_reserves_next_free_number_for_existing_names(fs):
+    create_test_files(fs, [
+        FakeFile("./test_dir/destination/file.jpg"),
+        FakeFile("./test_dir/destination/file (2).jpg"),
+        FakeFile("./test_dir/destination/file (4).jpg")
+    ])
+    name_index = NameIndex("./test_dir/destination/")
+
+    assert name_index.reserve("file.jpg") == "file (3).jpg"
+    assert name_index.reserve("file.jpg") == "file (5).jpg"
+    assert name_index.reserve("file.jpg") == "file (6).jpg"
+
+def test_name_index_does_not_read_the_directory_after_loading(fs):
+    create_test_files(fs, [FakeFile("./test_dir/destination/file.jpg")])
+    name_index = NameIndex("./test_dir/destination/")
+
+    fs.create_file("./test_dir/destination/file (2).jpg")
+
+    assert name_index.reserve("file.jpg") == "file (2).jpg"
+
+def test_name_index_release_frees_a_reserved_name(fs):
+    create_test_dir(fs, "./test_dir/destination/")
+    name_index = NameIndex("./test_dir/destination/")
+
+    name_index.reserve("file.jpg")
+    name_index.release("file.jpg")
+
+    assert name_index.reserve("file.jpg") == "file.jpg"
+
+def test_name_index_for_non_existant_dir_is_empty():
+    name_index = NameIndex("./non_existant_dir/")
+
+    assert name_index.reserve("file.jpg") == "file.jpg"
+
+def test_name_index_cache_loads_each_dir_once(fs):
+    create_test_dir(fs, "./test_dir/destination/")
+    name_indexes = NameIndexCache()
+
+    assert name_indexes.get("./test_dir/destination/") is name_indexes.get("./test_dir/destination")
+
+def test_name_index_cache_only_keeps_most_recently_used_indexes(fs):
+    name_indexes = NameIndexCache(max_size = 2)
+    first_index = name_indexes.get("/dir_a")
+
+    name_indexes.get("/dir_b")
+    assert name_indexes.get("/dir_a") is first_index
+
+    name_indexes.get("/dir_c")
+    assert name_indexes.get("/dir_a") is first_index
+    assert len(name_indexes.indexes) == 2
@@ -0,0 +1,111 @@
+import datetime
+import random
+import pytest
+from organise_media.organise_media import near_duplicates
+from organise_media.organise_media.near_duplicates import BKTree, average_hash, cluster_pairs, difference_hash, find_near_duplicates, find_near_pairs_with_bk_tree
+from organise_media.tests.test_helpers import FakeFile, create_test_files
+
+def hamming_distance(hash, other_hash):
+    return bin(hash ^ other_hash).count("1")
+
+def random_hashes(count, seed = 1):
+    generator = random.Random(seed)
+    hashes = [generator.getrandbits(64) for index in range(count)]
+
+    # Near copies of some of the hashes, with a few bits flipped
+    for index in range(0, count, 10):
+        hashes.append(hashes[index] ^ (1 << generator.randrange(64)) ^ (1 << generator.randrange(64)))
+
+    return hashes
+
+def brute_force_pairs(average_hashes, difference_hashes, max_distance):
+    return {
+        (index, other_index)
+        for index in range(len(difference_hashes)) for other_index in range(index + 1, len(difference_hashes))
+        if hamming_distance(difference_hashes[index], difference_hashes[other_index]) <= max_distance
+        and hamming_distance(average_hashes[index], average_hashes[other_index]) <= max_distance
+    }
+
+def test_average_hash_sets_bits_of_pixels_brighter_than_the_average():
+    pixels = [0] * 32 + [255] * 32
+
+    assert average_hash(pixels) == (1 << 32) - 1
+
+def test_difference_hash_sets_bits_of_pixels_brighter_than_their_right_neighbour():
+    pixels = [9 - column for row in range(8) for column in range(9)]
+
+    assert difference_hash(pixels) == (1 << 64) - 1
+    assert difference_hash(list(reversed(pixels))) == 0
+
+def test_bk_tree_finds_all_hashes_within_distance():
+    hashes = random_hashes(200)
+    tree = BKTree()
+    for index, image_hash in enumerate(hashes):
+        tree.add(image_hash, index)
+
+    for image_hash in hashes[:20]:
+        expected = [index for index, other_hash in enumerate(hashes) if hamming_distance(image_hash, other_hash) <= 4]
+        assert sorted(tree.search(image_hash, 4)) == expected
+
+def test_find_near_pairs_with_bk_tree_matches_brute_force():
+    hashes = random_hashes(200)
+
+    pairs = { tuple(sorted(pair)) for pair in find_near_pairs_with_bk_tree(hashes, hashes, 3) }
+
+    assert pairs == brute_force_pairs(hashes, hashes, 3)
+    assert len(pairs) == 20
+
+def test_find_near_pairs_vectorized_matches_brute_force(monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(near_duplicates, "COMPARE_ROWS", 16)
+    monkeypatch.setattr(near_duplicates, "COMPARE_COLUMNS", 64)
+    average_hashes = random_hashes(200, seed = 2)
+    difference_hashes = random_hashes(200, seed = 3)
+
+    pairs = set(near_duplicates.find_near_pairs_vectorized(average_hashes, difference_hashes, 2))
+
+    assert pairs == brute_force_pairs(average_hashes, difference_hashes, 2)
+
+def test_cluster_pairs_groups_linked_images():
+    assert cluster_pairs([(0, 3), (3, 5), (1, 4)], 6) == [[0, 3, 5], [1, 4]]
+
+def test_find_near_duplicates_groups_organised_images_with_near_hashes(fs, monkeypatch):
+    create_test_files(fs, [
+        FakeFile("/test_dir/2020/05_May/photo.jpg", "JPG File", datetime.datetime(2020, 5, 10)),
+        FakeFile("/test_dir/2021/07_July/photo small.jpg", "Small JPG File", datetime.datetime(2021, 7, 10)),
+        FakeFile("/test_dir/2021/07_July/other.jpg", "Other JPG File", datetime.datetime(2021, 7, 10)),
+        FakeFile("/test_dir/photo.jpg", "Unorganised JPG File", datetime.datetime(2020, 5, 10))
+    ])
+    fake_hashes = { "photo.jpg": 0b1111, "photo small.jpg": 0b1110, "other.jpg": 0b1111 << 40 }
+
+    def hash_images(paths, max_workers):
+        paths = sorted(paths)
+        hashes = [fake_hashes[path.rsplit("/", 1)[1]] for path in paths]
+        return paths, hashes, hashes
+
+    monkeypatch.setattr(near_duplicates, "hash_images", hash_images)
+
+    assert find_near_duplicates(["/test_dir", "/missing"], 2) == [["/test_dir/2020/05_May/photo.jpg", "/test_dir/2021/07_July/photo small.jpg"]]
+
+def test_hash_image_gives_near_hashes_to_resized_copies(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    image = Image.linear_gradient("L").rotate(30).convert("RGB")
+    image.save(str(tmp_path / "photo.jpg"), quality = 95)
+    image.resize((64, 64)).save(str(tmp_path / "photo small.jpg"), quality = 40)
+
+    path, average, difference = near_duplicates.hash_image(str(tmp_path / "photo.jpg"))
+    small_path, small_average, small_difference = near_duplicates.hash_image(str(tmp_path / "photo small.jpg"))
+
+    assert hamming_distance(average, small_average) <= 6
+    assert hamming_distance(difference, small_difference) <= 6
+    assert near_duplicates.hash_image(str(tmp_path / "missing.jpg")) == (str(tmp_path / "missing.jpg"), None, None)
+
+def test_find_near_duplicates_looks_in_the_configured_destinations(fs, monkeypatch):
+    create_test_files(fs, [
+        FakeFile("/test_dir/photos/2020/photo.jpg", "JPG File", datetime.datetime(2020, 5, 10)),
+        FakeFile("/test_dir/photos/2021/photo small.jpg", "Small JPG File", datetime.datetime(2021, 7, 10)),
+        FakeFile("/test_dir/2020/05_May/photo.jpg", "JPG File", datetime.datetime(2020, 5, 10))
+    ])
+    monkeypatch.setattr(near_duplicates, "hash_images", lambda paths, max_workers: (sorted(paths), [0b1111] * len(paths), [0b1111] * len(paths)))
+
+    assert find_near_duplicates(["/test_dir"], 2, destination = "photos/{year}") == [["/test_dir/photos/2020/photo.jpg", "/test_dir/photos/2021/photo small.jpg"]]
@@ -0,0 +1,102 @@
+import os
+import tarfile
+import zipfile
+import pytest
+from organise_media.organise_media.file_operations import organise_media
+from organise_media.organise_media.metrics import RunMetrics
+from organise_media.organise_media.name_index import NameIndex
+from organise_media.organise_media.packing import (
+    extract_packed_files, get_index_path, list_packed_files, pack_files, read_pack_index, unpack_file
+)
+
+MAY_2020 = 1589100000
+
+def write_file(path, contents, mtime = MAY_2020):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    with open(path, "wb") as file:
+        file.write(contents)
+    os.utime(path, (mtime, mtime))
+
+@pytest.mark.parametrize("pack_format", ["tar", "zip"])
+def test_pack_files_appends_files_readable_by_the_archive_format_and_the_index(tmp_path, pack_format):
+    dir = str(tmp_path)
+    write_file(os.path.join(dir, "a.jpg"), b"first")
+    write_file(os.path.join(dir, "b.jpg"), b"second file")
+
+    pack_files(dir, [os.path.join(dir, "a.jpg")], pack_format)
+    packed_paths = pack_files(dir, [os.path.join(dir, "b.jpg")], pack_format)
+
+    archive_path = os.path.join(dir, "packed." + pack_format)
+    assert packed_paths == [os.path.join(dir, "b.jpg")]
+    assert sorted(os.listdir(dir)) == ["packed." + pack_format, "packed." + pack_format + ".index"]
+    assert [entry["name"] for entry in list_packed_files(archive_path)] == ["a.jpg", "b.jpg"]
+
+    if pack_format == "tar":
+        with tarfile.open(archive_path) as archive:
+            assert archive.extractfile("b.jpg").read() == b"second file"
+    else:
+        with zipfile.ZipFile(archive_path) as archive:
+            assert archive.read("b.jpg") == b"second file"
+
+    assert extract_packed_files(archive_path, str(tmp_path / "out")) == 2
+    assert (tmp_path / "out" / "a.jpg").read_bytes() == b"first"
+    assert os.stat(str(tmp_path / "out" / "b.jpg")).st_mtime == MAY_2020
+
+def test_pack_files_leaves_files_whose_name_is_already_packed(tmp_path):
+    dir = str(tmp_path)
+    write_file(os.path.join(dir, "a.jpg"), b"first")
+    pack_files(dir, [os.path.join(dir, "a.jpg")])
+    write_file(os.path.join(dir, "a.jpg"), b"other")
+
+    assert pack_files(dir, [os.path.join(dir, "a.jpg")]) == []
+    assert (tmp_path / "a.jpg").read_bytes() == b"other"
+
+def test_pack_files_overwrites_unindexed_data_left_by_a_crash(tmp_path):
+    dir = str(tmp_path)
+    write_file(os.path.join(dir, "a.jpg"), b"first")
+    pack_files(dir, [os.path.join(dir, "a.jpg")])
+    with open(os.path.join(dir, "packed.tar"), "ab") as archive:
+        archive.write(b"partial member" * 100)
+
+    write_file(os.path.join(dir, "b.jpg"), b"second")
+    pack_files(dir, [os.path.join(dir, "b.jpg")])
+
+    with tarfile.open(os.path.join(dir, "packed.tar")) as archive:
+        assert archive.getnames() == ["a.jpg", "b.jpg"]
+
+def test_read_pack_index_ignores_a_line_cut_short(tmp_path):
+    dir = str(tmp_path)
+    write_file(os.path.join(dir, "a.jpg"), b"first")
+    pack_files(dir, [os.path.join(dir, "a.jpg")])
+    with open(get_index_path(os.path.join(dir, "packed.tar")), "a") as index_file:
+        index_file.write('{"name": "b.jpg", "off')
+
+    assert list(read_pack_index(os.path.join(dir, "packed.tar"))[0]) == ["a.jpg"]
+
+def test_unpack_file_takes_the_file_out_and_removes_the_emptied_archive(tmp_path):
+    dir = str(tmp_path / "2020" / "05_May")
+    write_file(os.path.join(dir, "a.jpg"), b"first")
+    pack_files(dir, [os.path.join(dir, "a.jpg")])
+
+    assert "a.jpg" in NameIndex(dir)
+    assert unpack_file(os.path.join(dir, "a.jpg"), str(tmp_path / "a.jpg"))
+    assert (tmp_path / "a.jpg").read_bytes() == b"first"
+    assert os.listdir(dir) == []
+    assert not unpack_file(os.path.join(dir, "a.jpg"), str(tmp_path / "b.jpg"))
+
+def test_organise_media_packs_small_moved_files_and_renames_clashes_with_packed_names(tmp_path):
+    dir = str(tmp_path)
+    write_file(os.path.join(dir, "small.jpg"), b"small")
+    write_file(os.path.join(dir, "large.jpg"), b"large file" * 100)
+    options = { "date_source": "mtime", "pack_threshold": 100 }
+    metrics = RunMetrics()
+
+    organise_media(dir, [".jpg"], options, metrics = metrics)
+    write_file(os.path.join(dir, "small.jpg"), b"other small")
+    organise_media(dir, [".jpg"], options, metrics = metrics)
+
+    month_dir = os.path.join(dir, "2020", "05_May")
+    assert sorted(os.listdir(month_dir)) == ["large.jpg", "packed.tar", "packed.tar.index"]
+    assert [entry["name"] for entry in list_packed_files(os.path.join(month_dir, "packed.tar"))] == ["small (2).jpg", "small.jpg"]
+    assert metrics.totals()["counters"]["packed_files"] == 2
+    assert metrics.totals()["counters"]["packed_bytes"] == 16
@@ -0,0 +1,43 @@
+import pytest
+import time
+from organise_media.organise_media.pipeline import Pipeline
+
+def test_pipeline_passes_items_through_stages_in_order():
+    with Pipeline(chunk_size = 3) as pipeline:
+        numbers = pipeline.stage("numbers", range(10))
+        squares = pipeline.stage("squares", (number * number for number in numbers))
+
+        assert list(squares) == [number * number for number in range(10)]
+
+def test_pipeline_stage_blocks_when_consumer_falls_behind():
+    produced = list()
+
+    def produce():
+        for number in range(1000):
+            produced.append(number)
+            yield number
+
+    with Pipeline(chunk_size = 10, queue_chunks = 2) as pipeline:
+        numbers = pipeline.stage("numbers", produce())
+        time.sleep(0.2)
+
+        assert len(produced) <= 10 * 4
+        assert sum(numbers) == sum(range(1000))
+
+def test_pipeline_raises_stage_error_in_consumer():
+    def produce():
+        yield 1
+        raise OSError("Failed to scan")
+
+    with Pipeline() as pipeline:
+        numbers = pipeline.stage("numbers", produce())
+
+        with pytest.raises(OSError):
+            list(numbers)
+
+def test_pipeline_stops_stages_when_left_early():
+    with Pipeline(chunk_size = 1, queue_chunks = 1) as pipeline:
+        numbers = pipeline.stage("numbers", iter(range(1000000)))
+        next(iter(numbers))
+
+    assert not numbers.is_alive()
@@ -0,0 +1,59 @@
+import pytest
+import re
+from organise_media.organise_media.rules import DEFAULT_DESTINATION, Ruleset, as_ruleset, compile_rule, compile_ruleset
+
+def test_compile_ruleset_matches_media_extensions_case_insensitively():
+    ruleset = compile_ruleset([".jpg", ".PNG"])
+
+    assert ruleset.match("photo.JPG").destination.template == DEFAULT_DESTINATION
+    assert ruleset.match("image.png") is not None
+    assert ruleset.match("notes.txt") is None
+
+def test_ruleset_returns_first_matching_rule_before_media_extensions():
+    ruleset = compile_ruleset([".jpg"], [
+        { "extensions": [".jpg"], "patterns": ["IMG-*-WA*"], "destination": "whatsapp/{year}" },
+        { "regex": r"screenshot_\d+\.png" , "destination": "screenshots" }
+    ])
+
+    assert ruleset.match("IMG-20200510-WA0001.jpg").destination.template == "whatsapp/{year}"
+    assert ruleset.match("holiday.jpg").destination.template == DEFAULT_DESTINATION
+    assert ruleset.match("Screenshot_1.PNG").destination.template == "screenshots"
+    assert ruleset.match("screenshot_a.png") is None
+
+def test_ruleset_only_gets_size_of_files_whose_rules_have_size_conditions():
+    ruleset = compile_ruleset([".jpg"], [{ "extensions": [".mp4"], "min_size": 10, "max_size": 100 }])
+    sizes = list()
+
+    def get_size(size):
+        sizes.append(size)
+        return size
+
+    assert ruleset.match("photo.jpg", lambda: get_size(1)) is not None
+    assert ruleset.match("clip.mp4", lambda: get_size(5)) is None
+    assert ruleset.match("clip.mp4", lambda: get_size(50)) is not None
+    assert ruleset.match("clip.mp4", lambda: get_size(500)) is None
+    assert sizes == [5, 50, 500]
+
+def test_ruleset_is_immutable():
+    ruleset = compile_ruleset([".jpg"])
+
+    with pytest.raises(AttributeError):
+        ruleset.rules = ()
+    with pytest.raises(TypeError):
+        ruleset.rules_by_extension[".png"] = ()
+
+def test_compile_rule_raises_for_invalid_rules():
+    with pytest.raises(ValueError):
+        compile_rule({ "extension": [".jpg"] })
+    with pytest.raises(ValueError):
+        compile_rule({ "min_size": "10" })
+    with pytest.raises(ValueError):
+        compile_rule({ "destination": "{lens}" })
+    with pytest.raises(re.error):
+        compile_rule({ "regex": "(" })
+
+def test_as_ruleset_returns_compiled_ruleset_unchanged():
+    ruleset = compile_ruleset([".jpg"])
+
+    assert as_ruleset(ruleset) is ruleset
+    assert isinstance(as_ruleset([".jpg"]), Ruleset)
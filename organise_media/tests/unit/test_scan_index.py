@@ -0,0 +1,59 @@
+import os
+from organise_media.organise_media.scan_index import STATUS_ORGANISED, STATUS_SKIPPED, ScanIndex
+
+def test_scan_index_returns_zero_files_for_unknown_dir():
+    with ScanIndex(":memory:") as scan_index:
+        assert scan_index.get_files("./test_dir/", STATUS_ORGANISED) == {}
+        assert not scan_index.is_dir_indexed("./test_dir/")
+
+def test_scan_index_returns_recorded_files_by_dir_and_status():
+    with ScanIndex(":memory:") as scan_index:
+        scan_index.record_files("./test_dir/", STATUS_ORGANISED, [("./test_dir/2009/10_October/file1.jpg", "./test_dir/file1.jpg", 10, 1254700800.0, 1, "hash1")])
+        scan_index.record_files("./test_dir/", STATUS_SKIPPED, [("./test_dir/file2.jpg", "./test_dir/file2.jpg", 10, 1254700800.0, 2, "hash1")])
+        scan_index.record_files("./other_dir/", STATUS_ORGANISED, [("./other_dir/2009/10_October/file3.jpg", None, 20, 1254700800.0, 3, None)])
+
+        assert scan_index.get_files("./test_dir", STATUS_ORGANISED) == { os.path.abspath("./test_dir/2009/10_October/file1.jpg"): (10, 1254700800.0, 1, "hash1") }
+        assert scan_index.get_files("./test_dir", STATUS_SKIPPED) == { os.path.abspath("./test_dir/file2.jpg"): (10, 1254700800.0, 2, "hash1") }
+
+def test_scan_index_keeps_known_hash_when_unchanged_file_is_recorded_again():
+    with ScanIndex(":memory:") as scan_index:
+        scan_index.record_files("./test_dir/", STATUS_ORGANISED, [("./test_dir/file.jpg", None, 10, 1.0, 1, "hash")])
+        scan_index.record_files("./test_dir/", STATUS_ORGANISED, [("./test_dir/file.jpg", None, 10, 1.0, 1, None)])
+
+        assert scan_index.get_files("./test_dir/", STATUS_ORGANISED)[os.path.abspath("./test_dir/file.jpg")][3] == "hash"
+
+def test_scan_index_drops_known_hash_when_changed_file_is_recorded_again():
+    with ScanIndex(":memory:") as scan_index:
+        scan_index.record_files("./test_dir/", STATUS_ORGANISED, [("./test_dir/file.jpg", None, 10, 1.0, 1, "hash")])
+        scan_index.record_files("./test_dir/", STATUS_ORGANISED, [("./test_dir/file.jpg", None, 12, 2.0, 1, None)])
+
+        assert scan_index.get_files("./test_dir/", STATUS_ORGANISED)[os.path.abspath("./test_dir/file.jpg")][3] is None
+
+def test_scan_index_records_hashes_of_unchanged_files_only():
+    with ScanIndex(":memory:") as scan_index:
+        scan_index.record_files("./test_dir/", STATUS_ORGANISED, [
+            ("./test_dir/file1.jpg", None, 10, 1.0, 1, None),
+            ("./test_dir/file2.jpg", None, 10, 1.0, 2, None)
+        ])
+        scan_index.record_hashes([("./test_dir/file1.jpg", 10, 1.0, "hash1"), ("./test_dir/file2.jpg", 12, 2.0, "hash2")])
+
+        files = scan_index.get_files("./test_dir/", STATUS_ORGANISED)
+        assert files[os.path.abspath("./test_dir/file1.jpg")][3] == "hash1"
+        assert files[os.path.abspath("./test_dir/file2.jpg")][3] is None
+
+def test_scan_index_persists_records_between_connections(tmp_path):
+    index_path = str(tmp_path / "index" / "scan_index.sqlite3")
+
+    with ScanIndex(index_path) as scan_index:
+        scan_index.record_files("./test_dir/", STATUS_ORGANISED, [("./test_dir/file.jpg", None, 10, 1.0, 1, "hash")])
+        scan_index.mark_dir_indexed("./test_dir/")
+
+    with ScanIndex(index_path) as scan_index:
+        assert scan_index.is_dir_indexed("./test_dir")
+        assert len(scan_index.get_files("./test_dir/", STATUS_ORGANISED)) == 1
+
+def test_scan_index_returns_recorded_capture_dates():
+    with ScanIndex(":memory:") as scan_index:
+        scan_index.record_capture_dates({ (1, 10, 1.0): 1434796200.0, (2, 20, 2.0): None })
+
+        assert scan_index.get_capture_dates([(1, 10, 1.0), (2, 20, 2.0), (3, 30, 3.0)]) == { (1, 10, 1.0): 1434796200.0, (2, 20, 2.0): None }
@@ -0,0 +1,52 @@
+import datetime
+import os
+from organise_media.organise_media import scheduler
+from organise_media.organise_media.file_operations import organise_media
+from organise_media.organise_media.move_plan import ACTION_HARDLINK, ACTION_MOVE, PlannedMove
+from organise_media.organise_media.scheduler import read_physical_offset, schedule_moves
+from organise_media.tests.test_helpers import FakeFile, create_test_files, assert_file_exists_with_content
+
+def planned_move(src_file_path, dest_file_path, inode, action = ACTION_MOVE):
+    return PlannedMove(action, "/test_dir", src_file_path, dest_file_path, 8, 0.0, inode, True, None, None)
+
+TEST_MOVES = [
+    planned_move("/test_dir/a.jpg", "/test_dir/2021/01_January/a.jpg", 30),
+    planned_move("/test_dir/b.jpg", "/test_dir/2020/01_January/b.jpg", 10, ACTION_HARDLINK),
+    planned_move("/test_dir/c.jpg", "/test_dir/2020/01_January/c.jpg", 20),
+    planned_move("/test_dir/d.jpg", "/test_dir/2021/01_January/d.jpg", 40)
+]
+
+def source_names(moves):
+    return [os.path.basename(move.src_file_path) for move in moves]
+
+def test_schedule_moves_orders_by_destination_with_hardlinks_last():
+    assert source_names(schedule_moves(TEST_MOVES, "destination")) == ["c.jpg", "a.jpg", "d.jpg", "b.jpg"]
+
+def test_schedule_moves_orders_by_inode_or_as_planned():
+    assert source_names(schedule_moves(TEST_MOVES, "inode")) == ["c.jpg", "a.jpg", "d.jpg", "b.jpg"]
+    assert source_names(schedule_moves(TEST_MOVES, "plan")) == ["a.jpg", "c.jpg", "d.jpg", "b.jpg"]
+
+def test_schedule_moves_accepts_an_order_function():
+    assert source_names(schedule_moves(TEST_MOVES, lambda moves: list(reversed(moves)))) == ["d.jpg", "c.jpg", "a.jpg", "b.jpg"]
+
+def test_schedule_moves_orders_by_physical_offset_and_by_inode_without_one(monkeypatch):
+    offsets = { "/test_dir/a.jpg": 4096, "/test_dir/d.jpg": 0 }
+    monkeypatch.setattr(scheduler, "read_physical_offset", lambda path: offsets.get(path))
+
+    assert source_names(schedule_moves(TEST_MOVES, "physical")) == ["d.jpg", "a.jpg", "c.jpg", "b.jpg"]
+
+def test_read_physical_offset_returns_none_for_missing_files(tmp_path):
+    assert read_physical_offset(str(tmp_path / "missing.jpg")) is None
+
+def test_organise_media_moves_all_files_in_inode_order(fs):
+    test_files = [
+        FakeFile("/test_dir/file1.jpg", "JPG File 1", datetime.datetime(2020, 5, 10)),
+        FakeFile("/test_dir/file2.jpg", "JPG File 2", datetime.datetime(2021, 7, 10)),
+        FakeFile("/test_dir/file3.jpg", "JPG File 3", datetime.datetime(2020, 5, 10))
+    ]
+    create_test_files(fs, test_files)
+
+    assert organise_media("/test_dir", [".jpg"], { "date_source": "mtime", "move_order": "inode" }) == 3
+    assert_file_exists_with_content(fs, "/test_dir/2020/05_May/file1.jpg", "JPG File 1")
+    assert_file_exists_with_content(fs, "/test_dir/2021/07_July/file2.jpg", "JPG File 2")
+    assert_file_exists_with_content(fs, "/test_dir/2020/05_May/file3.jpg", "JPG File 3")
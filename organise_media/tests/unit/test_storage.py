@@ -0,0 +1,136 @@
+import errno
+import os
+import pytest
+from organise_media.organise_media.file_operations import get_file_entries, get_known_organised_files, organise_media, safe_move
+from organise_media.organise_media.rules import as_ruleset
+from organise_media.organise_media.storage import LocalStorage, MemoryStorage, ObjectStoreStorage, get_storage
+
+OCTOBER_2009 = 1255000000
+
+def test_memory_storage_organises_files_without_touching_the_disk():
+    storage = MemoryStorage()
+    storage.write_file("/memory_storage/media/file.jpg", b"new", OCTOBER_2009)
+    storage.write_file("/memory_storage/media/notes.txt", b"text", OCTOBER_2009)
+    storage.write_file("/memory_storage/media/2009/10_October/file.jpg", b"organised", OCTOBER_2009)
+
+    file_count = organise_media("/memory_storage/media", [".jpg"], { "date_source": "mtime" }, storage = storage)
+
+    assert file_count == 1
+    assert not os.path.exists("/memory_storage/media")
+    assert storage.read_file("/memory_storage/media/2009/10_October/file.jpg") == b"organised"
+    assert storage.read_file("/memory_storage/media/2009/10_October/file (2).jpg") == b"new"
+    assert storage.read_file("/memory_storage/media/notes.txt") == b"text"
+    assert storage.stat_many(["/memory_storage/media/file.jpg"]) == [None]
+
+def test_get_known_organised_files_lists_the_organised_files_through_the_storage_backend():
+    storage = MemoryStorage()
+    storage.write_file("/memory_storage/media/file.jpg", b"new", OCTOBER_2009)
+    storage.write_file("/memory_storage/media/2009/10_October/file.jpg", b"organised", OCTOBER_2009)
+
+    organised_files, known_hashes = get_known_organised_files("/memory_storage/media", [".jpg"], storage = storage)
+
+    assert organised_files == [(os.path.join("/memory_storage/media", "2009", "10_October", "file.jpg"), 9)]
+    assert known_hashes is None
+
+def test_memory_storage_links_share_the_file_and_copies_keep_the_modification_time():
+    storage = MemoryStorage()
+    storage.write_file("/src/file.jpg", b"data", OCTOBER_2009)
+    storage.make_dirs(["/dest"])
+
+    storage.link("/src/file.jpg", "/dest/link.jpg")
+    storage.copy("/src/file.jpg", "/dest/copy.jpg")
+
+    assert storage.stat("/dest/link.jpg").st_ino == storage.stat("/src/file.jpg").st_ino
+    assert storage.stat("/dest/copy.jpg").st_ino != storage.stat("/src/file.jpg").st_ino
+    assert storage.stat("/dest/copy.jpg").st_mtime == OCTOBER_2009
+    assert sorted(entry.name for entry in storage.list_dir("/dest")) == ["copy.jpg", "link.jpg"]
+
+def test_memory_storage_raises_os_errors_like_the_filesystem():
+    storage = MemoryStorage()
+    storage.write_file("/src/file.jpg", b"data")
+
+    with pytest.raises(FileNotFoundError):
+        storage.rename("/src/missing.jpg", "/src/other.jpg")
+    with pytest.raises(FileNotFoundError):
+        storage.rename("/src/file.jpg", "/missing_dir/file.jpg")
+    with pytest.raises(FileExistsError):
+        storage.copy("/src/file.jpg", "/src/file.jpg")
+
+def test_safe_move_links_through_the_storage_backend():
+    storage = MemoryStorage()
+    storage.write_file("/src/file.jpg", b"data")
+    storage.make_dirs(["/dest"])
+
+    dest_file_path = safe_move("/src/file.jpg", "/dest", link_mode = "hardlink", storage = storage)
+
+    assert dest_file_path == os.path.join("/dest", "file.jpg")
+    assert storage.stat(dest_file_path).st_ino == storage.stat("/src/file.jpg").st_ino
+
+def test_local_storage_stats_paths_in_a_batch(tmp_path):
+    (tmp_path / "file.jpg").write_bytes(b"data")
+
+    stats = LocalStorage().stat_many([str(tmp_path / "file.jpg"), str(tmp_path / "missing.jpg")])
+
+    assert stats[0].st_size == 4
+    assert stats[1] is None
+
+def test_get_file_entries_skips_missing_paths_and_directories(tmp_path):
+    (tmp_path / "file.jpg").write_bytes(b"data")
+    (tmp_path / "dir.jpg").mkdir()
+
+    entries = list(get_file_entries([str(tmp_path / name) for name in ["file.jpg", "dir.jpg", "missing.jpg"]], as_ruleset([".jpg"])))
+
+    assert [entry.name for entry in entries] == ["file.jpg"]
+    assert entries[0].stat().st_size == 4
+
+def test_object_store_charges_one_call_per_batch_and_two_per_rename(tmp_path):
+    storage = ObjectStoreStorage(latency = 0)
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "file.jpg").write_bytes(b"data")
+
+    storage.stat_many([str(tmp_path / "src" / name) for name in ["file.jpg", "a.jpg", "b.jpg"]])
+    storage.make_dirs([str(tmp_path / "dest" / name) for name in ["a", "b", "c"]])
+    storage.rename(str(tmp_path / "src" / "file.jpg"), str(tmp_path / "dest" / "a" / "file.jpg"))
+
+    assert storage.calls == { "stat": 1, "make_dirs": 1, "copy": 1, "delete": 1 }
+    assert (tmp_path / "dest" / "a" / "file.jpg").read_bytes() == b"data"
+    assert not (tmp_path / "src" / "file.jpg").exists()
+
+def test_object_store_copies_files_in_link_mode_since_it_has_no_hardlinks(tmp_path):
+    storage = ObjectStoreStorage(latency = 0)
+    dir = tmp_path / "media"
+    dir.mkdir()
+    (dir / "file.jpg").write_bytes(b"data")
+    os.utime(str(dir / "file.jpg"), (OCTOBER_2009, OCTOBER_2009))
+
+    file_count = organise_media(str(dir), [".jpg"], { "date_source": "mtime", "organise_mode": "hardlink" }, storage = storage)
+
+    assert file_count == 1
+    assert (dir / "file.jpg").exists()
+    assert (dir / "2009" / "10_October" / "file.jpg").read_bytes() == b"data"
+    assert os.stat(str(dir / "2009" / "10_October" / "file.jpg")).st_ino != os.stat(str(dir / "file.jpg")).st_ino
+    assert storage.calls["copy"] == 1
+    assert "delete" not in storage.calls
+
+def test_get_storage_builds_the_backend_of_the_options():
+    storage = get_storage({ "storage": "object_store", "storage_latency_ms": 5 })
+
+    assert isinstance(storage, ObjectStoreStorage)
+    assert storage.latency == 0.005
+    assert type(get_storage({})) is LocalStorage
+
+def test_object_store_link_raises_an_unsupported_error(tmp_path):
+    with pytest.raises(OSError) as error:
+        ObjectStoreStorage(latency = 0).link(str(tmp_path / "a"), str(tmp_path / "b"))
+
+    assert error.value.errno == errno.EOPNOTSUPP
+
+def test_local_storage_lists_directories_lazily(tmp_path):
+    for index in range(3):
+        (tmp_path / f"file{index}.jpg").write_bytes(b"data")
+
+    entries = LocalStorage().list_dir(str(tmp_path))
+
+    assert not isinstance(entries, list)
+    assert next(entries).name.startswith("file")
+    assert len(list(entries)) == 2
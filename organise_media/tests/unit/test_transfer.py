@@ -0,0 +1,151 @@
+import errno
+import os
+import pytest
+from organise_media.organise_media import transfer
+from organise_media.organise_media.file_operations import safe_move
+from organise_media.organise_media.transfer import TransferEngine, copy_file, copy_file_contents, move_across_devices
+
+def create_real_file(path, content, mtime = 1262304000):
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+
+    with open(path, "w") as file:
+        file.write(content)
+
+    os.utime(path, (mtime, mtime))
+
+def read_real_file(path):
+    with open(path, "r") as file:
+        return file.read()
+
+def raise_unsupported(src_fd, dest_fd, offset, count):
+    raise OSError(errno.ENOSYS, "Not supported")
+
+def test_move_across_devices_copies_contents_and_timestamps_and_removes_source(tmp_path):
+    src_file_path = str(tmp_path / "source" / "file.jpg")
+    dest_file_path = str(tmp_path / "destination" / "file.jpg")
+
+    create_real_file(src_file_path, "JPG File")
+    os.makedirs(os.path.dirname(dest_file_path))
+
+    move_across_devices(src_file_path, dest_file_path)
+
+    assert not os.path.exists(src_file_path)
+    assert read_real_file(dest_file_path) == "JPG File"
+    assert os.stat(dest_file_path).st_mtime == 1262304000
+
+def test_move_across_devices_does_not_overwrite_existing_file(tmp_path):
+    src_file_path = str(tmp_path / "source" / "file.jpg")
+    dest_file_path = str(tmp_path / "destination" / "file.jpg")
+
+    create_real_file(src_file_path, "JPG File")
+    create_real_file(dest_file_path, "Existing JPG File")
+
+    with pytest.raises(FileExistsError):
+        move_across_devices(src_file_path, dest_file_path)
+
+    assert read_real_file(src_file_path) == "JPG File"
+    assert read_real_file(dest_file_path) == "Existing JPG File"
+
+def test_move_across_devices_keeps_source_and_removes_partial_copy_on_failure(tmp_path, monkeypatch):
+    src_file_path = str(tmp_path / "source" / "file.jpg")
+    dest_file_path = str(tmp_path / "destination" / "file.jpg")
+
+    create_real_file(src_file_path, "JPG File")
+    os.makedirs(os.path.dirname(dest_file_path))
+    monkeypatch.setattr(transfer, "copy_file_contents", lambda src_fd, dest_fd, size: 1)
+
+    with pytest.raises(OSError):
+        move_across_devices(src_file_path, dest_file_path)
+
+    assert read_real_file(src_file_path) == "JPG File"
+    assert not os.path.exists(dest_file_path)
+
+def test_copy_file_contents_falls_back_to_buffered_copy_when_zero_copy_is_unsupported(tmp_path, monkeypatch):
+    src_file_path = str(tmp_path / "file.jpg")
+    dest_file_path = str(tmp_path / "copy.jpg")
+
+    create_real_file(src_file_path, "JPG File" * 1000)
+    monkeypatch.setattr(transfer, "ZERO_COPY_CHUNK_FUNCTIONS", [raise_unsupported])
+
+    with open(src_file_path, "rb") as src_file, open(dest_file_path, "wb") as dest_file:
+        copied = copy_file_contents(src_file.fileno(), dest_file.fileno(), os.path.getsize(src_file_path))
+
+    assert copied == 8000
+    assert read_real_file(dest_file_path) == "JPG File" * 1000
+
+def test_transfer_engine_moves_all_submitted_files(tmp_path):
+    dest_dir_path = str(tmp_path / "destination")
+    os.makedirs(dest_dir_path)
+
+    for index in range(20):
+        create_real_file(str(tmp_path / "source" / f"file{index}.jpg"), f"JPG File {index}")
+
+    with TransferEngine(max_workers = 3) as engine:
+        for index in range(20):
+            engine.submit(str(tmp_path / "source" / f"file{index}.jpg"), os.path.join(dest_dir_path, f"file{index}.jpg"))
+
+    assert engine.failures == []
+    assert os.listdir(str(tmp_path / "source")) == []
+
+    for index in range(20):
+        assert read_real_file(os.path.join(dest_dir_path, f"file{index}.jpg")) == f"JPG File {index}"
+
+def test_transfer_engine_reports_failed_transfers(tmp_path):
+    dest_dir_path = str(tmp_path / "destination")
+    os.makedirs(dest_dir_path)
+
+    with TransferEngine() as engine:
+        engine.submit(str(tmp_path / "missing.jpg"), os.path.join(dest_dir_path, "missing.jpg"))
+
+    assert len(engine.failures) == 1
+    assert not os.path.exists(os.path.join(dest_dir_path, "missing.jpg"))
+
+def test_safe_move_uses_transfer_engine_across_devices(tmp_path, monkeypatch):
+    src_file_path = str(tmp_path / "source" / "file.jpg")
+    dest_dir_path = str(tmp_path / "destination")
+
+    create_real_file(src_file_path, "JPG File")
+    os.makedirs(dest_dir_path)
+
+    def rename_across_devices(src, dest):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "rename", rename_across_devices)
+
+    with TransferEngine() as engine:
+        safe_move(src_file_path, dest_dir_path, engine)
+
+    assert not os.path.exists(src_file_path)
+    assert read_real_file(os.path.join(dest_dir_path, "file.jpg")) == "JPG File"
+
+def test_copy_file_falls_back_to_copy_when_clone_is_unsupported(tmp_path, monkeypatch):
+    src_file_path = str(tmp_path / "source" / "file.jpg")
+    dest_file_path = str(tmp_path / "destination" / "file.jpg")
+
+    create_real_file(src_file_path, "JPG File")
+    os.makedirs(os.path.dirname(dest_file_path))
+    monkeypatch.setattr(transfer, "clone_file_contents", lambda src_fd, dest_fd: False)
+
+    assert not copy_file(src_file_path, dest_file_path, clone = True)
+    assert read_real_file(src_file_path) == "JPG File"
+    assert read_real_file(dest_file_path) == "JPG File"
+    assert os.stat(dest_file_path).st_mtime == 1262304000
+
+def test_safe_move_copies_and_keeps_source_when_hardlink_fails_across_devices(tmp_path, monkeypatch):
+    src_file_path = str(tmp_path / "source" / "file.jpg")
+    dest_dir_path = str(tmp_path / "destination")
+
+    create_real_file(src_file_path, "JPG File")
+    os.makedirs(dest_dir_path)
+
+    def link_across_devices(src, dest):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", link_across_devices)
+
+    with TransferEngine() as engine:
+        safe_move(src_file_path, dest_dir_path, engine, link_mode = "hardlink")
+
+    assert read_real_file(src_file_path) == "JPG File"
+    assert read_real_file(os.path.join(dest_dir_path, "file.jpg")) == "JPG File"
+    assert src_file_path in engine.copy_seconds
@@ -0,0 +1,127 @@
+import datetime
+import os
+import pytest
+from organise_media.organise_media.file_operations import execute_plan, plan_media
+from organise_media.organise_media.move_journal import MoveJournal
+from organise_media.organise_media.scan_index import STATUS_ORGANISED, ScanIndex
+from organise_media.organise_media.undo import get_moves_to_undo, undo_run
+from organise_media.tests.test_helpers import FakeFile, create_test_files, assert_file_exists_with_content
+
+def organise_with_journal(dir, media_types, options, journal_path, scan_index = None):
+    with MoveJournal(journal_path) as journal:
+        plan = plan_media(dir, media_types, options, scan_index)
+        journal.record_plan(plan)
+        execute_plan(plan, options, scan_index, journal = journal)
+        journal.end()
+
+    return journal.path
+
+def test_undo_run_restores_original_names_and_removes_empty_dirs(fs):
+    test_files = [
+        FakeFile("/test_dir/file.jpg", "JPG File", datetime.datetime(2020, 5, 10)),
+        FakeFile("/test_dir/nested/other.jpg", "Other JPG File", datetime.datetime(2021, 7, 10)),
+        FakeFile("/test_dir/2020/05_May/file.jpg", "Organised JPG File", datetime.datetime(2020, 5, 10))
+    ]
+    create_test_files(fs, test_files)
+    options = { "date_source": "mtime", "recursive": True, "max_workers": 2 }
+
+    journal_path = organise_with_journal("/test_dir", [".jpg"], options, "/journal/run.jsonl")
+    assert fs.exists("/test_dir/2020/05_May/file (2).jpg")
+
+    restored_count, failed_count = undo_run(journal_path, options)
+
+    assert (restored_count, failed_count) == (2, 0)
+    assert_file_exists_with_content(fs, "/test_dir/file.jpg", "JPG File")
+    assert_file_exists_with_content(fs, "/test_dir/nested/other.jpg", "Other JPG File")
+    assert_file_exists_with_content(fs, "/test_dir/2020/05_May/file.jpg", "Organised JPG File")
+    assert not fs.exists("/test_dir/2020/05_May/file (2).jpg")
+    assert not fs.exists("/test_dir/2021")
+
+@pytest.mark.parametrize("destination", ["{year}", "{year}/{month:02}/{day:02}", "videos/{year}"])
+def test_undo_run_removes_empty_dirs_of_other_destinations(fs, destination):
+    create_test_files(fs, [FakeFile("/test_dir/file.jpg", "JPG File", datetime.datetime(2020, 5, 10))])
+    options = { "date_source": "mtime", "destination": destination }
+
+    journal_path = organise_with_journal("/test_dir", [".jpg"], options, "/journal/run.jsonl")
+
+    assert undo_run(journal_path, options) == (1, 0)
+    assert os.listdir("/test_dir") == ["file.jpg"]
+
+def test_undo_run_only_undoes_each_move_once(fs):
+    create_test_files(fs, [FakeFile("/test_dir/file.jpg", "JPG File", datetime.datetime(2020, 5, 10))])
+    options = { "date_source": "mtime" }
+
+    journal_path = organise_with_journal("/test_dir", [".jpg"], options, "/journal/run.jsonl")
+    undo_run(journal_path, options)
+
+    assert get_moves_to_undo(journal_path) == []
+    assert undo_run(journal_path, options) == (0, 0)
+    assert fs.exists("/test_dir/file.jpg")
+
+def test_undo_run_restores_file_with_numbered_name_when_original_name_is_taken(fs):
+    create_test_files(fs, [FakeFile("/test_dir/file.jpg", "JPG File", datetime.datetime(2020, 5, 10))])
+    options = { "date_source": "mtime" }
+
+    journal_path = organise_with_journal("/test_dir", [".jpg"], options, "/journal/run.jsonl")
+    fs.create_file("/test_dir/file.jpg", contents = "New JPG File")
+
+    undo_run(journal_path, options)
+
+    assert_file_exists_with_content(fs, "/test_dir/file.jpg", "New JPG File")
+    assert_file_exists_with_content(fs, "/test_dir/file (2).jpg", "JPG File")
+
+def test_undo_run_restores_hardlinked_duplicates_as_separate_files(fs):
+    test_files = [
+        FakeFile("/test_dir/file.jpg", "JPG File", datetime.datetime(2020, 5, 10)),
+        FakeFile("/test_dir/copy.jpg", "JPG File", datetime.datetime(2020, 5, 10))
+    ]
+    create_test_files(fs, test_files)
+    options = { "date_source": "mtime", "duplicates": "hardlink" }
+
+    journal_path = organise_with_journal("/test_dir", [".jpg"], options, "/journal/run.jsonl")
+    undo_run(journal_path, options)
+
+    assert_file_exists_with_content(fs, "/test_dir/file.jpg", "JPG File")
+    assert_file_exists_with_content(fs, "/test_dir/copy.jpg", "JPG File")
+    assert os.stat("/test_dir/file.jpg").st_ino != os.stat("/test_dir/copy.jpg").st_ino
+    assert not fs.exists("/test_dir/2020")
+
+def test_undo_run_forgets_restored_files_in_scan_index(fs):
+    create_test_files(fs, [FakeFile("/test_dir/file.jpg", "JPG File", datetime.datetime(2020, 5, 10))])
+    options = { "date_source": "mtime" }
+
+    with ScanIndex(":memory:") as scan_index:
+        journal_path = organise_with_journal("/test_dir", [".jpg"], options, "/journal/run.jsonl", scan_index)
+        assert list(scan_index.get_files("/test_dir", STATUS_ORGANISED)) == ["/test_dir/2020/05_May/file.jpg"]
+
+        undo_run(journal_path, options, scan_index)
+
+        assert scan_index.get_files("/test_dir", STATUS_ORGANISED) == {}
+
+def test_undo_run_removes_links_and_keeps_originals_in_hardlink_mode(fs):
+    create_test_files(fs, [FakeFile("/test_dir/file.jpg", "JPG File", datetime.datetime(2020, 5, 10))])
+    options = { "date_source": "mtime", "organise_mode": "hardlink" }
+
+    journal_path = organise_with_journal("/test_dir", [".jpg"], options, "/journal/run.jsonl")
+    assert os.path.samefile("/test_dir/file.jpg", "/test_dir/2020/05_May/file.jpg")
+
+    assert undo_run(journal_path, options) == (1, 0)
+    assert_file_exists_with_content(fs, "/test_dir/file.jpg", "JPG File")
+    assert not fs.exists("/test_dir/file (2).jpg")
+    assert not fs.exists("/test_dir/2020")
+
+def test_undo_run_takes_packed_files_out_of_their_archive(fs):
+    create_test_files(fs, [
+        FakeFile("/test_dir/small.jpg", "Small", datetime.datetime(2020, 5, 10)),
+        FakeFile("/test_dir/large.jpg", "Large JPG File", datetime.datetime(2020, 5, 10))
+    ])
+    options = { "date_source": "mtime", "pack_threshold": 10 }
+
+    journal_path = organise_with_journal("/test_dir", [".jpg"], options, "/journal/run.jsonl")
+    assert fs.exists("/test_dir/2020/05_May/packed.tar")
+    assert not fs.exists("/test_dir/2020/05_May/small.jpg")
+
+    assert undo_run(journal_path, options) == (2, 0)
+    assert_file_exists_with_content(fs, "/test_dir/small.jpg", "Small")
+    assert_file_exists_with_content(fs, "/test_dir/large.jpg", "Large JPG File")
+    assert not fs.exists("/test_dir/2020")
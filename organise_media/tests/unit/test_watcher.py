@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+from organise_media.organise_media.rules import compile_ruleset
+from organise_media.organise_media.watcher import MediaWatcher, PendingFiles
+
+def watch_until(watcher, condition, timeout = 5):
+    stop_event = threading.Event()
+    thread = threading.Thread(target = watcher.run, args = (stop_event,))
+    thread.start()
+
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    stop_event.set()
+    thread.join()
+
+def test_pending_files_pops_settled_files_in_batches():
+    pending = PendingFiles()
+    pending.add("/dir_a/file1.jpg", "/dir_a", 0)
+    pending.add("/dir_b/file2.jpg", "/dir_b", 1)
+    pending.add("/dir_a/file3.jpg", "/dir_a", 2)
+    pending.add("/dir_a/file1.jpg", "/dir_a", 3)
+
+    assert pending.next_settle_delay(4, 5) == 2
+    assert pending.pop_settled(7, 5, 10) == { "/dir_b": ["/dir_b/file2.jpg"], "/dir_a": ["/dir_a/file3.jpg"] }
+    assert pending.pop_settled(9, 5, 10) == { "/dir_a": ["/dir_a/file1.jpg"] }
+    assert pending.next_settle_delay(9, 5) is None
+
+def test_pending_files_limits_batch_size():
+    pending = PendingFiles()
+    for index in range(5):
+        pending.add(f"/dir/file{index}.jpg", "/dir", 0)
+
+    assert pending.pop_settled(10, 5, 2) == { "/dir": ["/dir/file0.jpg", "/dir/file1.jpg"] }
+    assert len(pending) == 3
+
+def test_media_watcher_organises_written_and_moved_in_media_files(tmp_path):
+    watched_dir = str(tmp_path / "watched")
+    os.makedirs(os.path.join(watched_dir, "2020"))
+    batches = list()
+
+    with MediaWatcher([watched_dir], compile_ruleset([".jpg"]), lambda dir, paths: batches.append((dir, sorted(paths))), quiet_period = 0) as watcher:
+        (tmp_path / "watched" / "file1.jpg").write_text("JPG File 1")
+        (tmp_path / "watched" / "notes.txt").write_text("Text File")
+        (tmp_path / "file2.jpg").write_text("JPG File 2")
+        os.rename(str(tmp_path / "file2.jpg"), os.path.join(watched_dir, "file2.jpg"))
+
+        watch_until(watcher, lambda: sum(len(paths) for dir, paths in batches) >= 2)
+
+    assert sorted(path for dir, paths in batches for path in paths) == [os.path.join(watched_dir, "file1.jpg"), os.path.join(watched_dir, "file2.jpg")]
+    assert all(dir == watched_dir for dir, paths in batches)
+
+def test_media_watcher_watches_new_subdirectories_when_recursive(tmp_path):
+    watched_dir = str(tmp_path / "watched")
+    os.makedirs(watched_dir)
+    batches = list()
+
+    with MediaWatcher([watched_dir], compile_ruleset([".jpg"]), lambda dir, paths: batches.append((dir, paths)), recursive = True, quiet_period = 0) as watcher:
+        os.makedirs(os.path.join(watched_dir, "2020"))
+        os.makedirs(os.path.join(watched_dir, "import"))
+        watch_until(watcher, lambda: len(watcher.watched_dirs) == 2)
+
+        (tmp_path / "watched" / "2020" / "organised.jpg").write_text("Organised JPG File")
+        (tmp_path / "watched" / "import" / "file.jpg").write_text("JPG File")
+        watch_until(watcher, lambda: batches)
+
+    assert batches == [(watched_dir, [os.path.join(watched_dir, "import", "file.jpg")])]